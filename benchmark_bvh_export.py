@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+#
+# Copyright 2019 DFKI GmbH.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to permit
+# persons to whom the Software is furnished to do so, subject to the
+# following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN
+# NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE
+# USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+Compares the vectorized BVH export of get_bvh_string with the per frame
+conversion of anim_utils. The frames of the BVH file are repeated until
+the motion has the requested number of frames.
+
+python benchmark_bvh_export.py walk.bvh --n_frames 20000 --repeat 3
+"""
+import time
+import argparse
+import numpy as np
+from motion_database_server.utils import get_bvh_string, get_bvh_string_per_frame
+from motion_database_server.bvh_serializer import get_angle_difference
+from motion_database_server.motion_file_database import load_motion_vector_from_bvh_str
+
+DEFAULT_N_FRAMES = 20000
+DEFAULT_REPEAT = 3
+# tolerance in degrees and units of the root translation, the vectorized export writes 6 decimals
+EULER_TOLERANCE = 1e-4
+
+
+def get_motion_block(bvh_str):
+    lines = bvh_str[bvh_str.index("MOTION"):].splitlines()[3:]
+    return np.array([[float(v) for v in l.split()] for l in lines if len(l) > 0])
+
+
+def measure(func, repeat, *args):
+    durations = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        durations.append(time.perf_counter() - start)
+    return min(durations), result
+
+
+def run_benchmark(filename, n_frames, repeat):
+    with open(filename, "rt") as in_file:
+        motion_vector = load_motion_vector_from_bvh_str(in_file.read())
+    skeleton = motion_vector.skeleton
+    frames = np.asarray(motion_vector.frames)
+    frames = np.tile(frames, (int(np.ceil(n_frames / len(frames))), 1))[:n_frames]
+    print("frames", frames.shape, "joints", len(skeleton.animated_joints))
+    per_frame_time, per_frame_str = measure(get_bvh_string_per_frame, repeat, skeleton, frames, skeleton.frame_time)
+    vectorized_time, vectorized_str = measure(get_bvh_string, repeat, skeleton, frames)
+    expected = get_motion_block(per_frame_str)
+    result = get_motion_block(vectorized_str)
+    same_hierarchy = per_frame_str[:per_frame_str.index("MOTION")] == vectorized_str[:vectorized_str.index("MOTION")]
+    print("per frame: %.3f s, vectorized: %.3f s, speedup: %.1f" % (per_frame_time, vectorized_time, per_frame_time / vectorized_time))
+    print("same hierarchy:", same_hierarchy)
+    translation_difference = np.abs(expected[:, :3] - result[:, :3]).max()
+    angle_difference = get_angle_difference(expected[:, 3:], result[:, 3:]).max()
+    print("max translation difference: %.2e" % translation_difference)
+    print("max angle difference: %.2e degrees" % angle_difference)
+    print("matches per frame conversion:", same_hierarchy and max(translation_difference, angle_difference) < EULER_TOLERANCE)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the BVH export.')
+    parser.add_argument('filename', help='BVH file')
+    parser.add_argument('--n_frames', type=int, default=DEFAULT_N_FRAMES)
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    args = parser.parse_args()
+    run_benchmark(args.filename, args.n_frames, args.repeat)
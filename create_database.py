@@ -49,16 +49,27 @@ def create_database(config, project_name, user_name, pw, email):
     project_db.close()
     
 
+def migrate_database(config):
+    # apply schema migrations like new indices to an existing database
+    schema = DBSchema(TABLES)
+    schema.migrate_database(config["db_path"])
+
 
 CONFIG_FILE = "db_server_config.json"
 if __name__ == "__main__":
     config = load_json_file(CONFIG_FILE)
     parser = argparse.ArgumentParser(description='Create database.')
-    parser.add_argument('project_name', help='project_name')
-    parser.add_argument('user_name', help='user name')
-    parser.add_argument('pw', help='password')
-    parser.add_argument('email', help='email')
+    parser.add_argument('project_name', nargs='?', help='project_name')
+    parser.add_argument('user_name', nargs='?', help='user name')
+    parser.add_argument('pw', nargs='?', help='password')
+    parser.add_argument('email', nargs='?', help='email')
+    parser.add_argument('--migrate', action='store_true', help='update the schema of an existing database')
     args = parser.parse_args()
     kwargs = vars(args)
-    if args.user_name is not None and args.pw is not None and args.email is not None:
-        create_database(config, **kwargs)
\ No newline at end of file
+    migrate = kwargs.pop("migrate")
+    if migrate:
+        migrate_database(config)
+    elif args.project_name is not None and args.user_name is not None and args.pw is not None and args.email is not None:
+        create_database(config, **kwargs)
+    else:
+        parser.print_help()
\ No newline at end of file
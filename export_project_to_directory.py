@@ -28,6 +28,7 @@ from motion_database_server.project_database import ProjectDatabase
 from motion_database_server.motion_file_database import MotionFileDatabase
 from motion_database_server.utils import load_json_file
 from motion_database_server.utils import extract_compressed_bson
+from motion_database_server.motion_format import convert_motion_blob, MOTION_FORMAT_BSON
 
 CONFIG_FILE = "db_server_config.json"
 
@@ -38,7 +39,7 @@ def export_data_to_file(db, skeleton, file_id, name, data_type, directory):
     tags = [t[0] for t in db.get_data_type_tag_list(data_type)]
     binary_data = data
     if "compressed_bson" in tags:
-        raw_data = extract_compressed_bson(data)
+        raw_data = extract_compressed_bson(convert_motion_blob(data, MOTION_FORMAT_BSON))
         data_str = json.dumps(raw_data)
         binary_data = data_str.encode("utf-8")
 
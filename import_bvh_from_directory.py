@@ -21,29 +21,34 @@
 # OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE
 # USE OR OTHER DEALINGS IN THE SOFTWARE.
 import os
-import bson
-import bz2
 import argparse
 from pathlib import Path
 from motion_database_server.schema import DBSchema, TABLES
 from motion_database_server.project_database import ProjectDatabase
 from motion_database_server.motion_file_database import MotionFileDatabase
 from motion_database_server.utils import load_json_file
-from anim_utils.animation_data import BVHReader, MotionVector
+from motion_database_server.blob_codecs import load_codec_from_config
+from motion_database_server.connection_pool import get_pragma_profile
+from motion_database_server.bvh_parser import load_bvh_file
+from anim_utils.animation_data import MotionVector
 
 CONFIG_FILE = "db_server_config.json"
+# pragmas for a single writer without concurrent server requests
+DEFAULT_IMPORT_PROFILE = "bulk_import"
+# number of clips that are inserted in one transaction
+IMPORT_BATCH_SIZE = 200
 
-def import_motion(db,new_id, skeleton_name, filename):
-    bvh = BVHReader(filename)
+def load_motion_record(db, new_id, skeleton_name, filename):
+    bvh = load_bvh_file(filename)
     name = filename.split(os.sep)[-1]
     mv = MotionVector()
     mv.from_bvh_reader(bvh)
     data = mv.to_db_format()
     public = 0
     n_frames = mv.n_frames
-    data =  bz2.compress(bson.dumps(data))
+    data = db.encode_motion_data(data)
     meta_data = None
-    db.insert_motion(new_id, skeleton_name, name, data, meta_data, n_frames, public)
+    return db.get_motion_record(new_id, skeleton_name, name, data, meta_data, n_frames, public)
 
 
 def get_parent_collection(db_path, project_name):
@@ -60,19 +65,26 @@ def get_parent_collection(db_path, project_name):
 
 
 def import_directories_recursively(db: MotionFileDatabase, skeleton_name: str, collection_id: int, path: Path):
+    records = []
     for child_path in path.iterdir():
         if child_path.is_dir():
             new_collection_id = db.add_new_collection_by_id(child_path.name, "collection", collection_id)
             import_directories_recursively(db, skeleton_name, new_collection_id, child_path)
         elif child_path.suffix == ".bvh":
             filename = str(child_path)
-            import_motion(db, collection_id, skeleton_name, filename)
+            records.append(load_motion_record(db, collection_id, skeleton_name, filename))
+            if len(records) >= IMPORT_BATCH_SIZE:
+                db.insert_motions(records)
+                records = []
+    if len(records) > 0:
+        db.insert_motions(records)
 
-def import_directories_to_project(db_path, project_name, skeleton_name, directory):
+def import_directories_to_project(db_path, project_name, skeleton_name, directory, config=None, pragmas=None):
     schema = DBSchema(TABLES)
     parent_collection_id = get_parent_collection(db_path, project_name)
-    motion_db = MotionFileDatabase(schema)
-    motion_db.connect_to_database(db_path)
+    # the config sets the storage and motion format of the server
+    motion_db = MotionFileDatabase(schema, storage_config=config)
+    motion_db.connect_to_database(db_path, pragmas)
     skeleton_list = [name for s_id, name, owner in motion_db.get_skeleton_list()]
     if skeleton_name not in skeleton_list:
         print("skeleton",skeleton_name,"not in skeleton list", skeleton_list)
@@ -90,8 +102,11 @@ if __name__ == "__main__":
     parser.add_argument('project_name', help='Project Name')
     parser.add_argument('skeleton_name', help='Type of skeleton already in the database.')
     parser.add_argument('directory', help='Directory containing BVH files')
+    parser.add_argument('--db_profile', default=DEFAULT_IMPORT_PROFILE, help='Pragma profile of the database connection')
     args = parser.parse_args()
     
     if args.skeleton_name is not None and args.directory is not None and args.project_name is not None:
-        import_directories_to_project(config["db_path"], args.project_name, args.skeleton_name, args.directory)
+        load_codec_from_config(config)
+        pragmas = get_pragma_profile(args.db_profile, config.get("db_profiles", None))
+        import_directories_to_project(config["db_path"], args.project_name, args.skeleton_name, args.directory, config, pragmas)
   
\ No newline at end of file
@@ -20,12 +20,10 @@
 # DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
 # OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE
 # USE OR OTHER DEALINGS IN THE SOFTWARE.
-import bson
-import bz2
 import argparse
 from motion_database_server.schema import DBSchema, TABLES
 from motion_database_server.motion_file_database import MotionFileDatabase
-from motion_database_server.utils import load_json_file
+from motion_database_server.utils import load_json_file, compress_bson
 from anim_utils.animation_data import BVHReader, SkeletonBuilder
 
 CONFIG_FILE = "db_server_config.json"
@@ -38,11 +36,11 @@ def add_skeleton(db_path, name, bvh_file, skeleton_model_file):
     bvh = BVHReader(bvh_file)
     skeleton = SkeletonBuilder().load_from_bvh(bvh)
     data = skeleton.to_unity_format()
-    data = bz2.compress(bson.dumps(data))
+    data = compress_bson(data)
     meta_data = None
     if skeleton_model_file is not None:
         meta_data = load_json_file(skeleton_model_file)
-        meta_data = bz2.compress(bson.dumps(meta_data))
+        meta_data = compress_bson(meta_data)
     db.add_new_skeleton(name, data, meta_data)
     db.close()
 
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+#
+# Copyright 2019 DFKI GmbH.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to permit
+# persons to whom the Software is furnished to do so, subject to the
+# following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN
+# NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE
+# USE OR OTHER DEALINGS IN THE SOFTWARE.
+import os
+import time
+import argparse
+from motion_database_server.schema import TABLES
+from motion_database_server.table import DATA_COLS
+from motion_database_server.file_storage import get_data_file_path
+from motion_database_server.utils import load_json_file
+
+CONFIG_FILE = "db_server_config.json"
+DEFAULT_BATCH_SIZE = 1000
+
+
+def get_file_table_names():
+    return [t for t in TABLES if any(c[0] in DATA_COLS for c in TABLES[t])]
+
+
+def remove_empty_directories(table_dir):
+    for directory, sub_dirs, files in os.walk(table_dir, topdown=False):
+        if directory != table_dir and len(os.listdir(directory)) == 0:
+            os.rmdir(directory)
+
+
+def migrate_table_directory(data_dir, table_name, fan_out, batch_size=DEFAULT_BATCH_SIZE, pause=0.0):
+    """ Moves the data files of a table into the layout with fan_out directory levels.
+        The server can keep running, because it also looks for files in the flat layout.
+        The database only stores the file names, so the records do not change.
+    """
+    table_dir = data_dir + os.sep + table_name
+    if not os.path.isdir(table_dir):
+        return 0
+    n_moved = 0
+    n_batch = 0
+    for directory, sub_dirs, files in os.walk(table_dir):
+        for name in files:
+            filename = directory + os.sep + name
+            target_filename = get_data_file_path(data_dir, table_name, name, fan_out)
+            if filename == target_filename:
+                continue
+            os.makedirs(os.path.dirname(target_filename), exist_ok=True)
+            os.replace(filename, target_filename)
+            n_moved += 1
+            n_batch += 1
+            if n_batch >= batch_size:
+                print("moved", n_moved, "files of", table_name)
+                n_batch = 0
+                time.sleep(pause)
+    remove_empty_directories(table_dir)
+    print("moved", n_moved, "files of", table_name)
+    return n_moved
+
+
+def migrate_file_layout(data_dir, fan_out, batch_size=DEFAULT_BATCH_SIZE, pause=0.0):
+    for table_name in get_file_table_names():
+        migrate_table_directory(data_dir, table_name, fan_out, batch_size, pause)
+
+
+if __name__ == "__main__":
+    config = load_json_file(CONFIG_FILE)
+    parser = argparse.ArgumentParser(description='Move data files into the directory layout set by storage_fan_out in the config.')
+    parser.add_argument('directory', nargs='?', default=config.get("data_dir", "data"), help='Data directory')
+    parser.add_argument('--fan_out', type=int, default=config.get("storage_fan_out", 0), help='Number of directory levels, 0 for the flat layout')
+    parser.add_argument('--batch_size', type=int, default=DEFAULT_BATCH_SIZE, help='Number of files moved before a pause')
+    parser.add_argument('--pause', type=float, default=0.0, help='Pause in seconds between batches to reduce the load on a running server')
+    args = parser.parse_args()
+    migrate_file_layout(args.directory, args.fan_out, args.batch_size, args.pause)
@@ -20,6 +20,7 @@
 # DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
 # OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE
 # USE OR OTHER DEALINGS IN THE SOFTWARE.
+import os
 import mimetypes
 import tornado.web
 import json
@@ -43,7 +44,8 @@ class BaseHandler(tornado.web.RequestHandler):
         self.set_header("Access-Control-Allow-Headers", "x-requested-with, Origin, Content-Type, X-Auth-Token")
         self.set_header('Access-Control-Allow-Methods', 'GET, PUT, DELETE, OPTIONS')
         ## HEADERS!
-        self.set_header("Access-Control-Allow-Headers", 'Authorization, Content-Type, Access-Control-Allow-Origin, Access-Control-Allow-Headers, X-Requested-By, Access-Control-Allow-Methods')
+        self.set_header("Access-Control-Allow-Headers", 'Authorization, Content-Type, Access-Control-Allow-Origin, Access-Control-Allow-Headers, X-Requested-By, Access-Control-Allow-Methods, Range, If-Range, If-None-Match, X-Upload-Metadata')
+        self.set_header("Access-Control-Expose-Headers", 'Accept-Ranges, Content-Range, Content-Length, ETag')
 
     def options(self, *args, **kwargs):
         # no body   
@@ -56,6 +58,46 @@ class BaseHandler(tornado.web.RequestHandler):
         self.write(error_string)
 
 USER_ROLE_ADMIN = "admin"
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+
+def parse_range_header(range_header, length):
+    """ Parses a single byte range of the form "bytes=start-end", "bytes=start-" or "bytes=-suffix".
+
+    Returns:
+        tuple: start and exclusive end of the range or None if the header is not supported
+               and the full content should be sent. start is equal to length if the
+               range can not be satisfied.
+    """
+    if range_header is None or not range_header.startswith("bytes=") or "," in range_header:
+        return None
+    start_str, sep, end_str = range_header[len("bytes="):].strip().partition("-")
+    if sep == "":
+        return None
+    try:
+        if start_str == "":
+            start = max(length - int(end_str), 0) if int(end_str) > 0 else length
+            end = length
+        else:
+            start = int(start_str)
+            end = int(end_str) + 1 if end_str != "" else length
+    except ValueError:
+        return None
+    if start >= length:
+        return length, length
+    if end <= start:
+        return None
+    return start, min(end, length)
+
+
+def match_etag(etag_header, etag):
+    """ Checks if the quoted etag is in the comma separated list of an If-None-Match or If-Range header """
+    if etag_header is None:
+        return False
+    if etag_header.strip() == "*":
+        return True
+    tags = [t.strip() for t in etag_header.split(",")]
+    return etag in tags or "W/" + etag in tags
 
 class BaseDBHandler(BaseHandler):
     def __init__(self, application, request, **kwargs):
@@ -66,6 +108,92 @@ class BaseDBHandler(BaseHandler):
         self.project_service = application.get_service_context("PROJECT_DB")
         self.project_database = self.project_service.project_database
         self.data_transform_service = application.get_service_context("DATA_TRANSFORM_DB")
+        self.executor_pool = application.executor_pool
+
+    def run_db(self, func, *args, **kwargs):
+        """ Runs blocking database or file access in the thread pool of the server.
+
+        Returns:
+            Future: awaitable result of func(*args, **kwargs)
+        """
+        return self.executor_pool.run_db(func, *args, **kwargs)
+
+    def run_cpu(self, func, *args, **kwargs):
+        """ Runs CPU heavy work in the process pool of the server.
+            func has to be a module level function and the arguments have to be picklable.
+
+        Returns:
+            Future: awaitable result of func(*args, **kwargs)
+        """
+        return self.executor_pool.run_cpu(func, *args, **kwargs)
+
+    async def write_data_file(self, data_file):
+        """ Streams a data file opened by FileStorage.open_data_file in chunks,
+            so the memory per download does not depend on the size of the file.
+            Supports conditional requests with If-None-Match and resuming
+            downloads with a single byte range.
+
+        Args:
+            data_file (tuple): open file, length of the data and entity tag
+        """
+        file, length, etag = data_file
+        try:
+            etag = '"' + etag + '"'
+            self.set_header("ETag", etag)
+            self.set_header("Accept-Ranges", "bytes")
+            if match_etag(self.request.headers.get("If-None-Match", None), etag):
+                self.set_status(304)
+                return
+            byte_range = parse_range_header(self.request.headers.get("Range", None), length)
+            if_range = self.request.headers.get("If-Range", None)
+            if byte_range is not None and if_range is not None and not match_etag(if_range, etag):
+                # the data changed since the first part was downloaded
+                byte_range = None
+            if byte_range is not None:
+                start, end = byte_range
+                if start >= length:
+                    self.set_status(416)
+                    self.set_header("Content-Range", "bytes */%d" % length)
+                    return
+                self.set_status(206)
+                self.set_header("Content-Range", "bytes %d-%d/%d" % (start, end - 1, length))
+                file.seek(start, os.SEEK_CUR)
+                length = end - start
+            self.set_header("Content-Length", length)
+            while length > 0:
+                chunk = await self.run_db(file.read, min(STREAM_CHUNK_SIZE, length))
+                if len(chunk) == 0:
+                    break
+                self.write(chunk)
+                await self.flush()
+                length -= len(chunk)
+        finally:
+            file.close()
+
+    def get_page_args(self, input_data):
+        """ Reads the optional keyset pagination parameters of a list request.
+
+        Returns:
+            tuple: limit, after_id and with_count. limit is None if the full list was requested.
+        """
+        limit = input_data.get("limit", None)
+        if limit is not None:
+            limit = int(limit)
+        after_id = input_data.get("after_id", None)
+        with_count = bool(input_data.get("with_count", False))
+        return limit, after_id, with_count
+
+    def get_upload_session(self, input_data):
+        """ Returns the id of the resumable upload session if it was created by the user of the token or None """
+        upload_id = input_data.get("upload_id", None)
+        token = input_data.get("token", None)
+        if upload_id is None or token is None:
+            return None
+        user_id = self.project_database.get_user_id_from_token(token)
+        info = self.motion_database.upload_sessions.get_session_info(upload_id)
+        if user_id < 0 or info is None or info["owner"] != user_id:
+            return None
+        return upload_id
 
     def has_access_to_collection_by_project(self, collection_id, user_id):
         """Checks if the user is in the project the collection belongs to.
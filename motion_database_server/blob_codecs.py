@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+#
+# Copyright 2019 DFKI GmbH.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to permit
+# persons to whom the Software is furnished to do so, subject to the
+# following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN
+# NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE
+# USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+Registry of the compression codecs of stored blobs. Blobs that are not bz2
+streams start with BLOB_MAGIC followed by the id of the codec, so each blob
+can be decoded regardless of the codec that is configured for new writes.
+bz2 streams are identified by their own magic, so blobs written before the
+header was introduced and blobs written with the bz2 codec keep the format
+expected by existing clients. zstd and lz4 are used if the packages
+zstandard and lz4 are installed.
+"""
+import bz2
+import zlib
+import lzma
+
+BLOB_MAGIC = b"\x89MDB"
+BZ2_MAGIC = b"BZh"
+DEFAULT_CODEC = "bz2"
+
+# name -> (id, compress, decompress)
+CODECS = dict()
+CODEC_NAMES = dict()
+_default_codec = DEFAULT_CODEC
+
+
+def register_codec(name, codec_id, compress, decompress):
+    CODECS[name] = (codec_id, compress, decompress)
+    CODEC_NAMES[codec_id] = name
+
+
+register_codec("none", 0, lambda data: data, lambda data: data)
+register_codec("bz2", 1, bz2.compress, bz2.decompress)
+register_codec("zlib", 2, zlib.compress, zlib.decompress)
+register_codec("lzma", 3, lzma.compress, lzma.decompress)
+try:
+    import zstandard
+    register_codec("zstd", 4, lambda data: zstandard.ZstdCompressor().compress(data),
+                   lambda data: zstandard.ZstdDecompressor().decompress(data))
+except ImportError:
+    pass
+try:
+    import lz4.frame
+    register_codec("lz4", 5, lz4.frame.compress, lz4.frame.decompress)
+except ImportError:
+    pass
+
+
+def set_default_codec(name):
+    global _default_codec
+    if name not in CODECS:
+        print("Warning: unknown codec", name, "use", DEFAULT_CODEC)
+        name = DEFAULT_CODEC
+    _default_codec = name
+
+
+def get_default_codec():
+    return _default_codec
+
+
+def load_codec_from_config(config):
+    set_default_codec(config.get("blob_codec", DEFAULT_CODEC))
+
+
+def get_blob_codec(data):
+    """ Returns the name of the codec of a blob or None if the blob has no known header """
+    if data[:len(BZ2_MAGIC)] == BZ2_MAGIC:
+        return "bz2"
+    if data[:len(BLOB_MAGIC)] == BLOB_MAGIC and len(data) > len(BLOB_MAGIC):
+        return CODEC_NAMES.get(data[len(BLOB_MAGIC)], None)
+    return None
+
+
+def encode_blob(data, codec=None):
+    """ Compresses data with the codec or the default codec """
+    if codec is None:
+        codec = _default_codec
+    codec_id, compress, _ = CODECS[codec]
+    if codec == "bz2":
+        return compress(data)
+    return BLOB_MAGIC + bytes([codec_id]) + compress(data)
+
+
+def decode_blob(data):
+    """ Decompresses a blob with the codec given by its header.
+        Data without a known header is returned unchanged.
+    """
+    codec = get_blob_codec(data)
+    if codec is None:
+        if data[:len(BLOB_MAGIC)] == BLOB_MAGIC:
+            raise ValueError("Blob was written with a codec that is not available")
+        return data
+    _, _, decompress = CODECS[codec]
+    if codec == "bz2":
+        return decompress(data)
+    return decompress(data[len(BLOB_MAGIC)+1:])
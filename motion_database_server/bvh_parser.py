@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+#
+# Copyright 2019 DFKI GmbH.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to permit
+# persons to whom the Software is furnished to do so, subject to the
+# following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN
+# NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE
+# USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+BVH reader that parses the hierarchy with the BVHReader of anim_utils and
+the MOTION block in bulk with numpy instead of line by line. The frames are
+read in chunks from a file or from a string, so the text of a large file is
+never held in memory at once.
+"""
+import io
+import numpy as np
+from anim_utils.animation_data.bvh import BVHReader
+
+MOTION_CHUNK_SIZE = 16 * 1024 * 1024
+
+
+def read_bvh_header(file):
+    """ Reads the lines up to and including the Frame Time line
+
+    Returns:
+        list: non-empty lines of the header
+    """
+    lines = []
+    for line in file:
+        line = line.strip()
+        if len(line) == 0:
+            continue
+        lines.append(line)
+        if line.startswith("Frame Time"):
+            return lines
+    raise ValueError("BVH data has no MOTION block")
+
+
+def parse_frame_text(text, n_channels):
+    values = np.fromstring(text, dtype=np.float64, sep=" ")
+    if values.size % n_channels != 0:
+        raise ValueError("BVH frames do not match the %d channels of the hierarchy" % n_channels)
+    return values.reshape((-1, n_channels))
+
+
+def read_bvh_frames(file, n_channels, chunk_size=MOTION_CHUNK_SIZE):
+    """ Reads the remaining lines of the file as frames with n_channels values """
+    blocks = []
+    rest = ""
+    while True:
+        chunk = file.read(chunk_size)
+        if len(chunk) == 0:
+            break
+        # a frame that continues in the next chunk is parsed with it
+        chunk = rest + chunk
+        split_idx = chunk.rfind("\n") + 1
+        text = chunk[:split_idx]
+        rest = chunk[split_idx:]
+        if text.strip() != "":
+            blocks.append(parse_frame_text(text, n_channels))
+    if rest.strip() != "":
+        blocks.append(parse_frame_text(rest, n_channels))
+    if len(blocks) == 0:
+        return np.zeros((0, n_channels))
+    if len(blocks) == 1:
+        return blocks[0]
+    return np.concatenate(blocks)
+
+
+def get_n_channels(header_lines):
+    n_channels = 0
+    for line in header_lines:
+        if line.startswith("CHANNELS"):
+            n_channels += int(line.split()[1])
+    return n_channels
+
+
+def load_bvh_reader(file, chunk_size=MOTION_CHUNK_SIZE):
+    """ Returns a BVHReader with the frames of a BVH file that is opened in text mode """
+    header_lines = read_bvh_header(file)
+    bvh_reader = BVHReader("")
+    bvh_reader.process_lines(header_lines)
+    bvh_reader.frames = read_bvh_frames(file, get_n_channels(header_lines), chunk_size)
+    return bvh_reader
+
+
+def load_bvh_reader_from_str(bvh_str):
+    # clients send the lines separated by escaped line breaks
+    if "\n" not in bvh_str:
+        bvh_str = bvh_str.replace("\\n", "\n")
+    return load_bvh_reader(io.StringIO(bvh_str))
+
+
+def load_bvh_file(filename):
+    with open(filename, "rt") as file:
+        bvh_reader = load_bvh_reader(file)
+    bvh_reader.filename = filename.replace("\\", "/").split("/")[-1]
+    return bvh_reader
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+#
+# Copyright 2019 DFKI GmbH.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to permit
+# persons to whom the Software is furnished to do so, subject to the
+# following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN
+# NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE
+# USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+Vectorized conversion of quaternion frames into the MOTION block of a BVH file.
+The frames of all joints are converted at once instead of per frame and joint.
+The Euler angles are computed like transformations.euler_from_matrix, which is
+used by anim_utils, so the result matches convert_quaternion_to_euler_frames.
+"""
+import numpy as np
+
+# values are written with 6 decimals instead of the full precision of the per frame writer of anim_utils
+BVH_FLOAT_FORMAT = "%.6f"
+# is part of the keys of cached BVH strings and has to be increased when the output changes
+BVH_FORMAT_VERSION = 1
+_EPS = np.finfo(float).eps * 4.0
+_NEXT_AXIS = [1, 2, 0, 1]
+# first axis, parity, repetition and frame of the axis sequences of transformations.py
+_AXES2TUPLE = {
+    'sxyz': (0, 0, 0, 0), 'sxyx': (0, 0, 1, 0), 'sxzy': (0, 1, 0, 0),
+    'sxzx': (0, 1, 1, 0), 'syzx': (1, 0, 0, 0), 'syzy': (1, 0, 1, 0),
+    'syxz': (1, 1, 0, 0), 'syxy': (1, 1, 1, 0), 'szxy': (2, 0, 0, 0),
+    'szxz': (2, 0, 1, 0), 'szyx': (2, 1, 0, 0), 'szyz': (2, 1, 1, 0),
+    'rzyx': (0, 0, 0, 1), 'rxyx': (0, 0, 1, 1), 'ryzx': (0, 1, 0, 1),
+    'rxzx': (0, 1, 1, 1), 'rxzy': (1, 0, 0, 1), 'ryzy': (1, 0, 1, 1),
+    'rzxy': (1, 1, 0, 1), 'ryxy': (1, 1, 1, 1), 'ryxz': (2, 0, 0, 1),
+    'rzxz': (2, 0, 1, 1), 'rxyz': (2, 1, 0, 1), 'rzyz': (2, 1, 1, 1)}
+
+
+def quaternions_to_matrices(quaternions):
+    """ Converts an array of quaternions [w, x, y, z] with shape (..., 4) into rotation matrices with shape (..., 3, 3) """
+    q = np.array(quaternions, dtype=np.float64)
+    n = np.sum(q * q, axis=-1)
+    valid = n >= _EPS
+    q *= np.sqrt(2.0 / np.where(valid, n, 1.0))[..., None]
+    # quaternions close to zero are treated as identity
+    q[~valid] = [np.sqrt(2.0), 0.0, 0.0, 0.0]
+    w, x, y, z = q[..., 0], q[..., 1], q[..., 2], q[..., 3]
+    m = np.empty(q.shape[:-1] + (3, 3))
+    m[..., 0, 0] = 1.0 - y*y - z*z
+    m[..., 0, 1] = x*y - z*w
+    m[..., 0, 2] = x*z + y*w
+    m[..., 1, 0] = x*y + z*w
+    m[..., 1, 1] = 1.0 - x*x - z*z
+    m[..., 1, 2] = y*z - x*w
+    m[..., 2, 0] = x*z - y*w
+    m[..., 2, 1] = y*z + x*w
+    m[..., 2, 2] = 1.0 - x*x - y*y
+    return m
+
+
+def matrices_to_euler(matrices, axes="rxyz"):
+    """ Returns the Euler angles in radians of rotation matrices with shape (..., 3, 3) as array with shape (..., 3) """
+    firstaxis, parity, repetition, frame = _AXES2TUPLE[axes.lower()]
+    i = firstaxis
+    j = _NEXT_AXIS[i+parity]
+    k = _NEXT_AXIS[i-parity+1]
+    m = matrices
+    if repetition:
+        sy = np.sqrt(m[..., i, j]*m[..., i, j] + m[..., i, k]*m[..., i, k])
+        regular = sy > _EPS
+        ax = np.where(regular, np.arctan2(m[..., i, j], m[..., i, k]), np.arctan2(-m[..., j, k], m[..., j, j]))
+        ay = np.arctan2(sy, m[..., i, i])
+        az = np.where(regular, np.arctan2(m[..., j, i], -m[..., k, i]), 0.0)
+    else:
+        cy = np.sqrt(m[..., i, i]*m[..., i, i] + m[..., j, i]*m[..., j, i])
+        regular = cy > _EPS
+        ax = np.where(regular, np.arctan2(m[..., k, j], m[..., k, k]), np.arctan2(-m[..., j, k], m[..., j, j]))
+        ay = np.arctan2(-m[..., k, i], cy)
+        az = np.where(regular, np.arctan2(m[..., j, i], m[..., i, i]), 0.0)
+    if parity:
+        ax, ay, az = -ax, -ay, -az
+    if frame:
+        ax, az = az, ax
+    return np.stack([ax, ay, az], axis=-1)
+
+
+def rotation_order_to_axes(rotation_order):
+    """ Converts a BVH rotation order, e.g. ["Xrotation", "Yrotation", "Zrotation"], into the axes "rxyz" """
+    return "r" + "".join(c[0].lower() for c in rotation_order)
+
+
+def get_joint_layout(skeleton):
+    """ Returns the joints that have a quaternion in the frames of reference_frame_length in their order.
+        End sites have no channels.
+    """
+    return [name for name, node in skeleton.nodes.items() if len(node.children) > 0 and "EndSite" not in name]
+
+
+def add_fixed_joint_parameters(skeleton, frames):
+    """ Expands frames of the animated joints to frames of all joints. Fixed joints get their constant rotation. """
+    joints = get_joint_layout(skeleton)
+    full_frames = np.zeros((len(frames), 3 + 4 * len(joints)))
+    full_frames[:, :3] = frames[:, :3]
+    for joint_index, name in enumerate(joints):
+        node = skeleton.nodes[name]
+        dest = 3 + joint_index * 4
+        if name == skeleton.root:
+            full_frames[:, dest:dest+4] = frames[:, 3:7]
+        elif node.fixed:
+            full_frames[:, dest:dest+4] = node.rotation
+        else:
+            src = 3 + node.quaternion_frame_index * 4
+            full_frames[:, dest:dest+4] = frames[:, src:src+4]
+    return full_frames
+
+
+def get_reduced_reference_frame(skeleton):
+    """ Returns the reference frame of the skeleton with the root translation and a quaternion for each animated joint """
+    reference_frame = np.asarray(skeleton.reference_frame, dtype=np.float64)
+    frame = np.zeros(3 + 4 * len(skeleton.animated_joints))
+    if len(reference_frame) == len(frame):
+        frame[:] = reference_frame
+        return frame
+    frame[:3] = reference_frame[:3]
+    joint_indices = {name: idx for idx, name in enumerate(get_joint_layout(skeleton))}
+    for idx, name in enumerate(skeleton.animated_joints):
+        dest = 3 + idx * 4
+        if name in joint_indices:
+            src = 3 + joint_indices[name] * 4
+            frame[dest:dest+4] = reference_frame[src:src+4]
+        else:
+            frame[dest:dest+4] = skeleton.nodes[name].rotation
+    return frame
+
+
+def convert_quaternion_frames_to_euler(skeleton, frames):
+    """ Converts frames with the root translation and a quaternion for each joint of get_joint_layout
+        into frames with the root translation and Euler angles in degrees in the rotation order of each joint.
+    """
+    joints = get_joint_layout(skeleton)
+    n_frames = len(frames)
+    quaternions = np.asarray(frames[:, 3:3 + 4 * len(joints)]).reshape(n_frames, len(joints), 4)
+    matrices = quaternions_to_matrices(quaternions)
+    euler_frames = np.empty((n_frames, 3 + 3 * len(joints)))
+    euler_frames[:, :3] = frames[:, :3]
+    # joints with the same rotation order are converted together
+    joints_by_axes = dict()
+    for joint_index, name in enumerate(joints):
+        axes = rotation_order_to_axes(skeleton.nodes[name].rotation_order)
+        joints_by_axes.setdefault(axes, []).append(joint_index)
+    for axes, indices in joints_by_axes.items():
+        euler = np.degrees(matrices_to_euler(matrices[:, indices], axes))
+        for n, joint_index in enumerate(indices):
+            euler_frames[:, 3 + joint_index * 3:6 + joint_index * 3] = euler[:, n]
+    return euler_frames
+
+
+def format_frames(frames, float_format=BVH_FLOAT_FORMAT):
+    """ Formats all frames with one formatting operation instead of converting each value separately """
+    frames = np.asarray(frames)
+    if len(frames) == 0:
+        return ""
+    line_format = " ".join([float_format] * frames.shape[1]) + "\n"
+    return (line_format * len(frames)) % tuple(frames.ravel().tolist())
+
+
+def generate_motion_string(euler_frames, frame_time, float_format=BVH_FLOAT_FORMAT):
+    motion_str = "MOTION\n"
+    motion_str += "Frames: " + str(len(euler_frames)) + "\n"
+    motion_str += "Frame Time: " + str(frame_time) + "\n"
+    return motion_str + format_frames(euler_frames, float_format)
+
+
+def get_angle_difference(a, b):
+    """ Returns the absolute difference of angles in degrees, so that -180 and 180 are equal """
+    return np.abs((np.asarray(a) - np.asarray(b) + 180.0) % 360.0 - 180.0)
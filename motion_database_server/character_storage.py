@@ -22,21 +22,33 @@
 # USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 import os
+import shutil
 
 class CharacterStorage:
     def __init__(self, character_dir):
         self.character_dir = character_dir
 
-    def store_character_model(self, name, skeleton_type, data):
+    def get_character_model_filename(self, name, skeleton_type):
         if name[-4:] == ".glb":
             name = name[:-4]
         out_dir = self.character_dir + os.sep + skeleton_type 
         if not os.path.isdir(out_dir):
             os.makedirs(out_dir)
-        out_filename = out_dir+ os.sep + name + ".glb"
+        return out_dir+ os.sep + name + ".glb"
+
+    def store_character_model(self, name, skeleton_type, data):
+        out_filename = self.get_character_model_filename(name, skeleton_type)
         with open(out_filename, 'wb') as f:
             f.write(data)
         return True
+
+    def store_character_model_file(self, name, skeleton_type, file):
+        """ Copies an uploaded file in chunks instead of reading it into memory """
+        out_filename = self.get_character_model_filename(name, skeleton_type)
+        file.seek(0)
+        with open(out_filename, 'wb') as f:
+            shutil.copyfileobj(file, f)
+        return True
     
     def delete_character_model(self, name, skeleton_type):
         if name[-4:] == ".glb":
@@ -54,6 +66,20 @@ class CharacterStorage:
         print("model data", skeleton_type, file_list)
         return file_list
     
+    def open_character_model(self, name, skeleton_type):
+        """ Returns the open file, its size and an entity tag based on the modification time or None """
+        if name[-4:] == ".glb":
+            name = name[:-4]
+        in_filename = self.character_dir + os.sep + skeleton_type + os.sep + name + ".glb"
+        try:
+            file = open(in_filename, 'rb')
+        except FileNotFoundError:
+            print(in_filename,"is not a file")
+            return None
+        stat = os.fstat(file.fileno())
+        etag = "%x-%x" % (stat.st_mtime_ns, stat.st_size)
+        return file, stat.st_size, etag
+
     def get_character_model_data(self, name, skeleton_type):
         if name[-4:] == ".glb":
             name = name[:-4]
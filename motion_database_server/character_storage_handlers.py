@@ -23,6 +23,7 @@
 import json
 import tornado.web
 from motion_database_server.base_handler import BaseDBHandler
+from motion_database_server.upload_stream import StreamUploadHandler
 
 
 class GetCharacterModelListHandler(BaseDBHandler):
@@ -43,22 +44,23 @@ class GetCharacterModelListHandler(BaseDBHandler):
             self.finish()
 
 
-class UploadCharacterModelHandler(BaseDBHandler):
-    @tornado.gen.coroutine
-    def post(self):
+class UploadCharacterModelHandler(StreamUploadHandler):
+    async def post(self):
         try:
-            
-            input_str = self.request.body.decode("utf-8")
-            input_data = json.loads(input_str)
-            has_access = self.project_database.check_rights(input_data)
+            input_data, upload_files = self.get_upload_data()
+            has_access = await self.run_db(self.project_database.check_rights, input_data)
             success = False
             if has_access:
-                if "name" in input_data and "skeleton_type" in input_data and "data" in input_data:
+                if "name" in input_data and "skeleton_type" in input_data and "data" in upload_files:
+                    name = input_data['name']
+                    skeleton_type = input_data['skeleton_type'] 
+                    success = await self.run_db(self.motion_database.store_character_model_file, name, skeleton_type, upload_files["data"])
+                elif "name" in input_data and "skeleton_type" in input_data and "data" in input_data:
                     name = input_data['name']
                     skeleton_type = input_data['skeleton_type'] 
                     data = input_data['data']
                     data = bytearray(data) # https://www.w3resource.com/python-exercises/python-basic-exercise-118.php
-                    success = self.motion_database.store_character_model(name, skeleton_type, data)
+                    success = await self.run_db(self.motion_database.store_character_model, name, skeleton_type, data)
                 else:
                     print("Error: Not all parameters provided")
             else:
@@ -93,17 +95,16 @@ class DeleteCharacterModelHandler(BaseDBHandler):
             self.finish()
 
 class DownloadCharacterModelHandler(BaseDBHandler):
-    @tornado.gen.coroutine
-    def post(self):
+    async def post(self):
         print("Post method for binary file loading")
         try:
             input_str = self.request.body.decode("utf-8")
             input_json = json.loads(input_str)
             name = input_json['name']
             skeleton_type = input_json['skeleton_type'] 
-            data = self.motion_database.get_character_model_data(name, skeleton_type)
-            if data is not None:
-                self.write(data)
+            data_file = await self.run_db(self.motion_database.open_character_model, name, skeleton_type)
+            if data_file is not None:
+                await self.write_data_file(data_file)
             else:
                 print("Error: could not read file")
         except Exception as e:
@@ -20,21 +20,28 @@
 # DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
 # OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE
 # USE OR OTHER DEALINGS IN THE SOFTWARE.
+from motion_database_server.schema import COLLECTION_ANCESTORS_TABLE
+from motion_database_server.query_builder import build_join_str
 
 
 class CollectionDatabase:
     collections_table = "collections" 
         
-    def get_collection_list_by_id(self, parent_id, owner=-1, public=-1):
+    def get_collection_list_by_id(self, parent_id, owner=-1, public=-1, limit=None, after_id=None, with_count=False):
         filter_conditions =  [("parent",parent_id)]
         intersection_list = []
         if owner >= 0:
             intersection_list.append(("owner",owner))
         if public >= 0:
             intersection_list.append(("public",public))
-        return self.tables[self.collections_table].get_record_list(["ID","name","type", "owner", "public"], filter_conditions)
+        cols = ["ID","name","type", "owner", "public"]
+        if limit is not None:
+            return self.tables[self.collections_table].get_record_page(cols, filter_conditions, limit=limit, after_id=after_id, with_count=with_count)
+        return self.tables[self.collections_table].get_record_list(cols, filter_conditions)
     
     def get_collection_tree(self, parent_id, owner=-1, public=-1):
+        if self.has_table(COLLECTION_ANCESTORS_TABLE):
+            return self.get_collection_tree_from_ancestors(parent_id)
         col_dict = dict()
         for c in self.get_collection_list_by_id(parent_id, owner, public):
             col_id = c[0]
@@ -46,6 +53,32 @@ class CollectionDatabase:
             col_data["sub_tree"] = self.get_collection_tree(col_id, owner, public)
             col_dict[col_id] = col_data
         return col_dict
+
+    def get_collection_tree_from_ancestors(self, parent_id):
+        """ Fetches the subtree below parent_id with a single query on the closure table """
+        t_name = COLLECTION_ANCESTORS_TABLE
+        cols = ["collections.ID", "collections.name", "collections.type", "collections.owner", "collections.public", "collections.parent"]
+        # the children of parent_id and all of their descendants
+        join_statement = build_join_str(self.collections_table, "collections.ID", t_name + ".descendant", "INNER")
+        join_statement += " " + build_join_str(self.collections_table + " AS tops", "tops.ID", t_name + ".ancestor", "INNER")
+        filter_conditions = [("tops.parent", parent_id)]
+        order = [t_name + ".depth", "collections.ID"]
+        records = self.query_table(t_name, cols, filter_conditions, join_statement=join_statement, order=order)
+        col_dict = dict()
+        sub_trees = {parent_id: col_dict}
+        # parents are returned before their children
+        for c in records:
+            col_id = c[0]
+            col_data = dict()
+            col_data["name"] = c[1]
+            col_data["type"] = c[2]
+            col_data["owner"] = c[3]
+            col_data["public"] = c[4]
+            col_data["sub_tree"] = dict()
+            if c[5] in sub_trees:
+                sub_trees[c[5]][col_id] = col_data
+            sub_trees[col_id] = col_data["sub_tree"]
+        return col_dict
       
     def add_new_collection_by_id(self, name, collection_type, parent_id, owner, public=0):
         owner = max(0, owner)
@@ -64,14 +97,14 @@ class CollectionDatabase:
         return self.tables[self.collections_table].get_value_of_column_by_id(collection_id, "owner")
 
     def get_collection_by_name(self, name, parent=-1, owner=-1, public=-1, exact_match=False):
-        filter_conditions =  [("name",name, exact_match)]
+        filter_conditions =  []
         if parent >= 0:
             filter_conditions.append(("parent",parent, True))
         if owner >= 0:
             filter_conditions.append(("owner",owner, True))
         if public >= 0:
             filter_conditions.append(("public",public, True))
-        return self.tables[self.collections_table].get_record_list(["ID","name","type", "owner", "public"], filter_conditions)
+        return self.tables[self.collections_table].search_records_by_name(name, ["ID","name","type", "owner", "public"], exact_match, filter_conditions)
 
 
     def get_collection_by_id(self, collection_id):
@@ -81,6 +114,13 @@ class CollectionDatabase:
         self.tables[self.collections_table].update_record(collection_id, input_data)
     
     def get_root_of_collection_tree(self, collection_id):
+        """ Looks up the root in the closure table with one query and walks the parents on databases without it """
+        if self.has_table(COLLECTION_ANCESTORS_TABLE):
+            query_str = "SELECT ancestor FROM " + COLLECTION_ANCESTORS_TABLE + " WHERE descendant = ? ORDER BY depth DESC LIMIT 1;"
+            records = self.fetch_records(query_str, (collection_id,))
+            if len(records) > 0:
+                return records[0][0]
+            return collection_id
         parent = collection_id
         while parent > 0:
             record = self.tables[self.collections_table].get_record_by_id(collection_id,["parent"])
@@ -89,4 +129,4 @@ class CollectionDatabase:
                 parent = record[0]
             else:
                 parent = -1
-        return collection_id
\ No newline at end of file
+        return collection_id
@@ -22,22 +22,21 @@
 # USE OR OTHER DEALINGS IN THE SOFTWARE.
 import time
 import json
-import tornado.web
 from motion_database_server.base_handler import BaseDBHandler
 
 
 
 class NewCollectionHandler(BaseDBHandler):
-    @tornado.gen.coroutine
-    def post(self):
+    async def post(self):
         try:
             success = False
             input_str = self.request.body.decode("utf-8")
             input_data = json.loads(input_str)
             parent_collection = input_data.get("parent_id", None)
             token = input_data.get("token", None)
-            if self.has_access_to_collection(parent_collection, token):
-                request_user_id = self.project_database.get_user_id_from_token(token)
+            has_access = await self.run_db(self.has_access_to_collection, parent_collection, token)
+            if has_access:
+                request_user_id = await self.run_db(self.project_database.get_user_id_from_token, token)
                 response_dict = dict()
                 name = input_data["name"]
                 collection_type = input_data["type"]
@@ -45,7 +44,7 @@ class NewCollectionHandler(BaseDBHandler):
                 owner = request_user_id
                 if "owner" in input_data:
                     owner = input_data["owner"]
-                response_dict["id"] = self.motion_database.add_new_collection_by_id(name, collection_type, parent_id, owner)
+                response_dict["id"] = await self.run_db(self.motion_database.add_new_collection_by_id, name, collection_type, parent_id, owner)
                 success = True
             else:
                 print("Error: no access rights")
@@ -62,16 +61,17 @@ class NewCollectionHandler(BaseDBHandler):
             self.finish()
 
 class GetCollectionListHandler(BaseDBHandler):
-    @tornado.gen.coroutine
-    def post(self):
+    async def post(self):
         try:
             input_str = self.request.body.decode("utf-8")
             input_data = json.loads(input_str)
-            owner, public = self.project_database.get_user_access_rights(input_data)
+            owner, public = await self.run_db(self.project_database.get_user_access_rights, input_data)
             cols_str = "[]"
             if "parent_id" in input_data:
                 parent_id = input_data["parent_id"]
-                cols = self.motion_database.get_collection_list_by_id(parent_id, owner, public)
+                limit, after_id, with_count = self.get_page_args(input_data)
+                cols = await self.run_db(self.motion_database.get_collection_list_by_id, parent_id, owner, public,
+                                         limit, after_id, with_count)
                 cols_str = json.dumps(cols)
             self.write(cols_str)
         except Exception as e:
@@ -83,16 +83,15 @@ class GetCollectionListHandler(BaseDBHandler):
 
 
 class GetCollectionTreeHandler(BaseDBHandler):
-    @tornado.gen.coroutine
-    def post(self):
+    async def post(self):
         try:
             input_str = self.request.body.decode("utf-8")
             input_data = json.loads(input_str)
-            owner, public = self.project_database.get_user_access_rights(input_data)
+            owner, public = await self.run_db(self.project_database.get_user_access_rights, input_data)
             cols_str = "{}"
             if "parent_id" in input_data:
                 parent_id = input_data["parent_id"]
-                col_tree = self.motion_database.get_collection_tree(parent_id, owner, public)
+                col_tree = await self.run_db(self.motion_database.get_collection_tree, parent_id, owner, public)
                 cols_str = json.dumps(col_tree)
             self.write(cols_str)
         except Exception as e:
@@ -104,15 +103,14 @@ class GetCollectionTreeHandler(BaseDBHandler):
 
 
 class GetCollectionHandler(BaseDBHandler):
-    @tornado.gen.coroutine
-    def post(self):
+    async def post(self):
         try:
             input_str = self.request.body.decode("utf-8")
             print("get collection", input_str)
             input_data = json.loads(input_str)
             if "id" in input_data:
                 collection_id = input_data["id"]
-                collection = self.motion_database.get_collection_by_id(collection_id)
+                collection = await self.run_db(self.motion_database.get_collection_by_id, collection_id)
                 collection_str = ""
                 if collection is not None:
                     collection_str = json.dumps(collection)
@@ -128,17 +126,17 @@ class GetCollectionHandler(BaseDBHandler):
 
 
 class EditCollectionHandler(BaseDBHandler):
-    @tornado.gen.coroutine
-    def post(self):
+    async def post(self):
         try:
             success = False
             input_str = self.request.body.decode("utf-8")
             input_data = json.loads(input_str)
             id = input_data.get("id", None)
             token = input_data.get("token", None)
-            if self.has_access_to_collection(id, token):
+            has_access = await self.run_db(self.has_access_to_collection, id, token)
+            if has_access:
                 collection_id = input_data["id"]
-                self.motion_database.edit_collection(input_data, collection_id)
+                await self.run_db(self.motion_database.edit_collection, input_data, collection_id)
                 success = True
             else:
                 print("Error: has no access rights")
@@ -158,8 +156,7 @@ class EditCollectionHandler(BaseDBHandler):
 
 
 class RemoveCollectionHandler(BaseDBHandler):
-    @tornado.gen.coroutine
-    def post(self):
+    async def post(self):
         try:
             success = False
             input_str = self.request.body.decode("utf-8")
@@ -167,8 +164,9 @@ class RemoveCollectionHandler(BaseDBHandler):
             input_data = json.loads(input_str)
             id = input_data.get("id", None)
             token = input_data.get("token", None)
-            if self.has_access_to_collection(id, token):
-                self.motion_database.remove_collection_by_id(input_data["id"])
+            has_access = await self.run_db(self.has_access_to_collection, id, token)
+            if has_access:
+                await self.run_db(self.motion_database.remove_collection_by_id, input_data["id"])
                 success = True
             else:
                 print("Error: has no access rights")
@@ -186,8 +184,7 @@ class RemoveCollectionHandler(BaseDBHandler):
 
 
 class GetCollectionsByNameHandler(BaseDBHandler):
-    @tornado.gen.coroutine
-    def post(self):
+    async def post(self):
         try:
             input_str = self.request.body.decode("utf-8")
             print("get collection", input_str)
@@ -195,7 +192,7 @@ class GetCollectionsByNameHandler(BaseDBHandler):
             if "name" in input_data:
                 name = input_data["name"]
                 exact_match = input_data.get("exact_match", False)
-                collection = self.motion_database.get_collection_by_name(name, exact_match=exact_match)
+                collection = await self.run_db(self.motion_database.get_collection_by_name, name, exact_match=exact_match)
                 collection_str = ""
                 if collection is not None:
                     collection_str = json.dumps(collection)
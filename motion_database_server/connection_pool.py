@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+#
+# Copyright 2019 DFKI GmbH.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to permit
+# persons to whom the Software is furnished to do so, subject to the
+# following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN
+# NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE
+# USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+Connection pool that is shared by all services using the same database file.
+Each thread gets its own read-only connection and all writes go through a
+single connection that is guarded by a lock. In WAL mode readers are not
+blocked by a writer, so queries can proceed while an upload is committed.
+"""
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from motion_database_server.query_builder import STATEMENT_CACHE_SIZE
+
+MEMORY_DB = ":memory:"
+DEFAULT_PROFILE = "default"
+
+PRAGMA_PROFILES = dict()
+# keep the sqlite defaults
+PRAGMA_PROFILES["default"] = {"busy_timeout": 5000}
+PRAGMA_PROFILES["server"] = {"journal_mode": "WAL",
+                            "synchronous": "NORMAL",
+                            "cache_size": -65536, # in KiB
+                            "mmap_size": 268435456,
+                            "temp_store": "MEMORY",
+                            "busy_timeout": 5000}
+PRAGMA_PROFILES["bulk_import"] = {"journal_mode": "WAL",
+                            "synchronous": "OFF",
+                            "cache_size": -262144,
+                            "mmap_size": 1073741824,
+                            "temp_store": "MEMORY",
+                            "busy_timeout": 30000}
+
+# pragmas that change the database file and can only be set by the writer
+WRITER_PRAGMAS = ["journal_mode"]
+
+
+def get_pragma_profile(profile=None, custom_profiles=None):
+    """ Returns the pragmas of a profile.
+
+    Args:
+        profile (str or dict): name of the profile or a dictionary of pragmas
+        custom_profiles (dict): additional profiles that override the built-in profiles
+
+    Returns:
+        dict: pragma names and values
+    """
+    if profile is None:
+        profile = DEFAULT_PROFILE
+    if isinstance(profile, dict):
+        return profile
+    if custom_profiles is not None and profile in custom_profiles:
+        return custom_profiles[profile]
+    if profile in PRAGMA_PROFILES:
+        return PRAGMA_PROFILES[profile]
+    print("Warning: unknown database profile", profile)
+    return PRAGMA_PROFILES[DEFAULT_PROFILE]
+
+
+def load_profile_from_config(config):
+    return get_pragma_profile(config.get("db_profile", None), config.get("db_profiles", None))
+
+
+def apply_pragmas(con, pragmas, read_only=False):
+    for name, value in pragmas.items():
+        if read_only and name in WRITER_PRAGMAS:
+            continue
+        con.execute("PRAGMA " + name + " = " + str(value) + ";")
+
+
+class ConnectionPool:
+    def __init__(self, path, pragmas=None):
+        self.path = path
+        self.pragmas = pragmas if pragmas is not None else get_pragma_profile()
+        self.write_lock = threading.RLock()
+        self.writer = self.open_connection(read_only=False)
+        self._local = threading.local()
+        self._readers = []
+        self._readers_lock = threading.Lock()
+        self.ref_count = 0
+        self.unit_of_work = None
+        self.unit_of_work_thread = None
+
+    def open_connection(self, read_only=False):
+        if read_only:
+            uri = Path(os.path.abspath(self.path)).as_uri() + "?mode=ro"
+            con = sqlite3.connect(uri, uri=True, check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE)
+        else:
+            con = sqlite3.connect(self.path, check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE)
+        apply_pragmas(con, self.pragmas, read_only)
+        if read_only:
+            con.execute("PRAGMA query_only = ON;")
+        return con
+
+    def get_read_connection(self):
+        """ Returns the read-only connection of the calling thread. In-memory databases
+            can not be shared between connections, so the writer is used instead. The writer
+            is also used by the thread that runs a unit of work to read its own changes.
+        """
+        if self.path == MEMORY_DB or self.get_unit_of_work() is not None:
+            return self.writer
+        con = getattr(self._local, "reader", None)
+        if con is None:
+            con = self.open_connection(read_only=True)
+            self._local.reader = con
+            with self._readers_lock:
+                self._readers.append(con)
+        return con
+
+    @contextmanager
+    def write_connection(self):
+        """ Serializes access to the single writer connection """
+        with self.write_lock:
+            yield self.writer
+
+    def get_unit_of_work(self):
+        """ Returns the active unit of work if it was started by the calling thread """
+        if self.unit_of_work is not None and self.unit_of_work_thread == threading.get_ident():
+            return self.unit_of_work
+        return None
+
+    def begin_unit_of_work(self, unit_of_work):
+        self.unit_of_work = unit_of_work
+        self.unit_of_work_thread = threading.get_ident()
+
+    def end_unit_of_work(self):
+        self.unit_of_work = None
+        self.unit_of_work_thread = None
+
+    def close(self):
+        with self._readers_lock:
+            for con in self._readers:
+                con.close()
+            self._readers = []
+        self._local = threading.local()
+        with self.write_lock:
+            self.writer.close()
+
+
+_POOLS = dict()
+_POOLS_LOCK = threading.Lock()
+
+
+def get_connection_pool(path, pragmas=None):
+    """ Returns the pool for a database file, so services that use the same file share one writer """
+    with _POOLS_LOCK:
+        key = path if path == MEMORY_DB else os.path.abspath(path)
+        if key not in _POOLS or path == MEMORY_DB:
+            pool = ConnectionPool(path, pragmas)
+            if path == MEMORY_DB:
+                pool.ref_count += 1
+                return pool
+            _POOLS[key] = pool
+        pool = _POOLS[key]
+        pool.ref_count += 1
+        return pool
+
+
+def release_connection_pool(pool):
+    with _POOLS_LOCK:
+        pool.ref_count -= 1
+        if pool.ref_count > 0:
+            return
+        key = pool.path if pool.path == MEMORY_DB else os.path.abspath(pool.path)
+        if _POOLS.get(key, None) is pool:
+            del _POOLS[key]
+    pool.close()
@@ -30,6 +30,7 @@ from motion_database_server.service_base import ServiceBase
 from motion_database_server.schema import DBSchema, TABLES
 from motion_database_server.table import Table
 from motion_database_server.utils import load_json_file
+from motion_database_server.connection_pool import load_profile_from_config
 
 
 class DataTransformDatabaseService(ServiceBase,  DataTransformDatabase, ExperimentDatabase):
@@ -50,7 +51,7 @@ class DataTransformDatabaseService(ServiceBase,  DataTransformDatabase, Experime
         schema = DBSchema(TABLES)
         DataTransformDatabase.__init__(self, schema)
         ExperimentDatabase.__init__(self)
-        self.connect_to_database(self.db_path)
+        self.connect_to_database(self.db_path, load_profile_from_config(kwargs))
         self.request_handler_list = []
         self.request_handler_list += DATA_TRANSFORM_HANDLER_LIST
         self.request_handler_list += EXPERIMENT_DB_HANDLER_LIST
\ No newline at end of file
@@ -30,82 +30,186 @@ http://stackoverflow.com/questions/23574614/appending-pandas-dataframe-to-sqlite
 http://www.sqlitetutorial.net/sqlite-python/delete/
 """
 import sqlite3
-import pandas as pd
+from contextlib import contextmanager
+from motion_database_server.connection_pool import get_connection_pool, release_connection_pool
+from motion_database_server.unit_of_work import UnitOfWork
+from motion_database_server.query_builder import get_conditions_shape, get_conditions_values, \
+        build_select_statement, build_update_statement, build_insert_statement, build_delete_statement, \
+        build_count_statement, build_join_str, get_fts_query, COND_MATCH
+from motion_database_server.schema import get_fts_table_name
+
+DEFAULT_FETCH_SIZE = 1000
 
 
 class DatabaseWrapper(object):
+    pool = None
     def __init__(self):
-        self.con = None
+        self.pool = None
+
+    def connect_to_database(self, path, pragmas=None):
+        """ Connects to the shared connection pool of the database file.
 
-    def connect_to_database(self, path):
-        self.con = sqlite3.connect(path)
+        Args:
+            path (str): path to the sqlite file
+            pragmas (dict): pragmas of the connection profile, see connection_pool.get_pragma_profile
+        """
+        self.pool = get_connection_pool(path, pragmas)
         print("connected to db",path)
 
+    @property
+    def con(self):
+        """ writer connection, use execute_write for statements that modify the database """
+        return self.pool.writer
+
+    def execute_write(self, query_str, values=(), many=False):
+        """ Executes a statement on the writer connection and commits it,
+            unless it is part of a unit of work.
+
+        Returns:
+            int: lastrowid of the cursor
+        """
+        with self.pool.write_connection() as con:
+            auto_commit = self.pool.get_unit_of_work() is None
+            cur = con.cursor()
+            try:
+                if many:
+                    cur.executemany(query_str, values)
+                else:
+                    cur.execute(query_str, values)
+                if auto_commit:
+                    con.commit()
+                return cur.lastrowid
+            except:
+                if auto_commit:
+                    con.rollback()
+                raise
+            finally:
+                cur.close()
+
+    @contextmanager
+    def transaction(self):
+        """ Unit of work that spans multiple statements and file operations.
+            The statements are committed once at the end and files are only deleted
+            after the commit. On an error the transaction is rolled back and files
+            written during the transaction are removed. Nested calls join the outer
+            unit of work. The writer connection is locked until the end of the block.
+
+            with db.transaction():
+                db.tables["files"].update_record(f_id, data)
+                db.tables["files"].delete_record_by_id(other_id)
+        """
+        with self.pool.write_connection() as con:
+            unit_of_work = self.pool.get_unit_of_work()
+            if unit_of_work is not None:
+                yield unit_of_work
+                return
+            unit_of_work = UnitOfWork()
+            self.pool.begin_unit_of_work(unit_of_work)
+            try:
+                if not con.in_transaction:
+                    con.execute("BEGIN;")
+                yield unit_of_work
+                con.commit()
+            except:
+                con.rollback()
+                self.pool.end_unit_of_work()
+                unit_of_work.rollback()
+                raise
+            self.pool.end_unit_of_work()
+            unit_of_work.commit()
+
+    def get_unit_of_work(self):
+        if self.pool is None:
+            return None
+        return self.pool.get_unit_of_work()
+
     def create_table(self,table_name, columns, replace=False):
         if replace:
-            self.con.execute(''' DROP TABLE IF EXISTS '''+table_name+''';''')
+            self.execute_write(''' DROP TABLE IF EXISTS '''+table_name+''';''')
         col_string = ''' (ID INTEGER PRIMARY KEY, '''
         for c_name, c_type in columns:
             col_string += "'"+c_name+"' "+c_type+"," 
         col_string += '''  timestamp DATETIME DEFAULT CURRENT_TIMESTAMP);'''
-        self.con.execute('''CREATE TABLE '''+table_name+col_string)
-        self.con.commit()
+        self.execute_write('''CREATE TABLE '''+table_name+col_string)
 
     def write_pd(self, table_name, data):
         print("write pandas data to sql table", table_name)
-        data.to_sql(table_name, self.con, if_exists="replace")
+        with self.pool.write_connection() as con:
+            data.to_sql(table_name, con, if_exists="replace")
 
     def get_column_names(self, table_name):
         query_str = "PRAGMA table_info(" + table_name + ");"
-        query = self.con.execute(query_str)
-        result = query.fetchall()
+        result = self.fetch_records(query_str)
         return [r[1] for r in result[1:]]
 
     def close(self):
-        self.con.close()
+        if self.pool is not None:
+            release_connection_pool(self.pool)
+            self.pool = None
         print("closed connection to db")
 
     def read_pd(self, table_name):
+        """ optional export path, pandas is only imported when it is used """
+        import pandas as pd
         print("read pandas data from sql table", table_name)
         query_str = "SELECT * From " + table_name
-        results = pd.read_sql_query(query_str, self.con)
+        results = pd.read_sql_query(query_str, self.pool.get_read_connection())
         return results
+
+    def get_cursor(self, named_rows=False):
+        cur = self.pool.get_read_connection().cursor()
+        if named_rows:
+            cur.row_factory = sqlite3.Row
+        return cur
+
+    def fetch_records(self, query_str, values=(), named_rows=False):
+        """ Executes a select statement and returns all rows.
+
+        Args:
+            query_str (str): SQL statement
+            values (tuple): parameters of the statement
+            named_rows (bool): return sqlite3.Row objects that also allow access by column name
+
+        Returns:
+            list: list of tuples or sqlite3.Row objects
+        """
+        cur = self.get_cursor(named_rows)
+        try:
+            cur.execute(query_str, values)
+            return cur.fetchall()
+        finally:
+            cur.close()
+
+    def iterate_records(self, query_str, values=(), named_rows=False, batch_size=DEFAULT_FETCH_SIZE):
+        """ Generator version of fetch_records that keeps at most batch_size rows in memory.
+        """
+        cur = self.get_cursor(named_rows)
+        try:
+            cur.execute(query_str, values)
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if len(rows) < 1:
+                    break
+                for r in rows:
+                    yield r
+        finally:
+            cur.close()
         
     def update_entry(self,  table_name, data, condition_key, condition_value):
-        query_str = ''' UPDATE '''+table_name+''' SET ''' 
-        n_entries = len(data)
-        count = 0
-        values = []
-        for key, value in data.items():
-            query_str += key  + '''= ?'''
-            count+=1
-            values.append(value)
-            if n_entries > count:
-                query_str +=''', '''
-        query_str +=  ''' WHERE '''+ condition_key +'''= ?;'''
-        values.append(condition_value)
-        cur = self.con.cursor()
-        cur.execute(query_str, tuple(values))
-        self.con.commit()
+        self.update_entry_by_condition(table_name, data, [(condition_key, condition_value)])
 
     def update_entry_by_condition(self, table_name, data, conditions):
-        query_str = ''' UPDATE '''+table_name+''' SET ''' 
-        n_entries = len(data)
-        count = 0
-        for key, value in data.items():
-            query_str +=self.get_filter_str((key, value))
-            count+=1
-            if n_entries > count:
-                query_str +=", "
-        query_str += self.get_condition_str(conditions, None)
-        query_str +=  ";"
-        cur = self.con.cursor()
-        cur.execute(query_str)
-        self.con.commit()
+        columns = tuple(data.keys())
+        query_str = build_update_statement(table_name, columns, get_conditions_shape(conditions))
+        values = list(data.values()) + get_conditions_values(conditions)
+        self.execute_write(query_str, values)
 
     def get_max_id(self, table):
         query_str = "SELECT max(ID) as ID FROM " + table + " ;"
-        return pd.read_sql_query(query_str, self.con)
+        records = self.fetch_records(query_str)
+        if len(records) < 1 or records[0][0] is None:
+            return -1
+        return records[0][0]
 
     def insert_records(self, table, columns, records):
         if len(records) < 1:
@@ -115,143 +219,114 @@ class DatabaseWrapper(object):
         if len(columns) != len(records[0]):
             print("Error: Column names list and record column length do not match",len(columns), len(records[0]))
             return
+        query_str = build_insert_statement(table, tuple(columns))
+        self.execute_write(query_str, records, many=True)
+
+    def insert_entries(self, table, entries):
+        """ Inserts a list of rows in a single transaction.
 
-        query_str = " INSERT INTO " + table + " ( "
-        for idx, c in enumerate(columns):
-            if idx > 0:
-                query_str += ","
-            query_str += c + " "
-        query_str += ") VALUES ("
-        for idx, c in enumerate(columns):
-            if idx > 0:
-                query_str += ","
-            query_str += "?"
-        query_str += ")"
-        print(query_str)
-        self.con.executemany(query_str, records)
-        self.con.commit()
+        Args:
+            table (str): table name
+            entries (list): list of dictionaries that map column names to values
+
+        Returns:
+            list: IDs of the new rows in the order of entries
+        """
+        new_ids = []
+        with self.transaction():
+            with self.pool.write_connection() as con:
+                cur = con.cursor()
+                try:
+                    for entry in entries:
+                        query_str = build_insert_statement(table, tuple(entry.keys()))
+                        cur.execute(query_str, tuple(entry.values()))
+                        new_ids.append(cur.lastrowid)
+                finally:
+                    cur.close()
+        return new_ids
 
     def get_records(self, table, columns, group=None, q_filter=None, order=None):
-        query_str = "SELECT "
         if group is not None:
-            query_str += "Max(Timestamp),"
-        for idx, c in enumerate(columns):
-            if idx > 0:
-                query_str += ", "
-            query_str += c
-
-        query_str +=" From " + table
-        if q_filter is not None:
-            query_str += " WHERE "
-            for idx, c in enumerate(q_filter):
-                if idx > 0:
-                    query_str += " AND "
-                query_str += c[0]+" = "+c[1]
+            group = tuple(group)
+        if order is not None:
+            order = tuple(order)
+        query_str = build_select_statement(table, tuple(columns), get_conditions_shape(q_filter), group=group, order=order)
+        return self.fetch_records(query_str, get_conditions_values(q_filter))
 
-        if group is not None:
-            query_str += " GROUP BY "
-            for idx, c in enumerate(group):
-                if idx > 0:
-                    query_str += ","
-                query_str += " " + c
+    def get_query_str(self, table_name, column_list, filter_list=None, intersection_list=None, join_statement=None, distinct=False, order=None, limit=None):
+        """ Returns a parameterized select statement and the values of its parameters.
+        """
         if order is not None:
-            query_str += " ORDER BY "
-            for idx, c in enumerate(order):
-                if idx > 0:
-                    query_str += ","
-                query_str += " " + c
-
-        query_str += ";"
-        return pd.read_sql_query(query_str, self.con)
-
-    def get_filter_str(self, c):
-        query_str = ""
-        if type(c[1]) == str:
-            if len(c) > 2 and not c[2]: # allow partial match
-                query_str = c[0]+" LIKE '%"+c[1]+"%'"
-            else:
-                query_str = c[0]+" = '"+c[1]+"'"
-        elif type(c[1]) == list:
-            list_str = "".join(["'"+str(v)+"', " for v in c[1][:-1]])
-            list_str = "(" + list_str
-            list_str +=  str(c[1][-1]) + ")"
-            query_str = c[0]+" IN " + list_str
-        else:
-            query_str = c[0]+" = "+str(c[1])
-        return query_str
-
-    def get_condition_str(self, filter_list=None, intersection_list=None):
-        query_str = ""
-        has_filter_list = filter_list is not None and len(filter_list) > 0
-        has_intersection_list = intersection_list is not None and len(intersection_list) > 0
-        if has_filter_list or has_intersection_list:
-            query_str += " WHERE "
-        if has_filter_list:
-            for idx, c in enumerate(filter_list):
-                if idx > 0:
-                    query_str += " AND "
-                query_str += self.get_filter_str(c)
-        if has_intersection_list:
-            if has_filter_list:
-                query_str += " AND ("
-            for idx, c in enumerate(intersection_list):
-                if idx > 0:
-                    query_str += " OR "
-                query_str += self.get_filter_str(c)
-            if has_filter_list:
-                query_str += ")"
-        return query_str
-
-    def query_table(self, table_name, column_list, filter_list=None, intersection_list=None, join_statement=None, distinct=False):
-        query_str = "SELECT "
-        if distinct:
-            query_str += " DISTINCT "
-        last_idx = len(column_list)-1
-        for idx, c in enumerate(column_list):
-            query_str += c
-            if idx < last_idx:
-                query_str += ", "  
-            else:
-                query_str += " "  
-        query_str += "FROM  " + table_name
-        if join_statement is not None:
-            query_str += " "+join_statement
-        query_str += self.get_condition_str(filter_list, intersection_list)
-        query_str += ";"
+            order = tuple(order)
+        query_str = build_select_statement(table_name, tuple(column_list),
+                                        get_conditions_shape(filter_list),
+                                        get_conditions_shape(intersection_list),
+                                        join_statement, distinct, order=order, limit=limit is not None)
+        values = get_conditions_values(filter_list, intersection_list)
+        if limit is not None:
+            values.append(limit)
+        return query_str, values
+
+    def query_table(self, table_name, column_list, filter_list=None, intersection_list=None, join_statement=None, distinct=False, named_rows=False, order=None, limit=None):
+        query_str, values = self.get_query_str(table_name, column_list, filter_list, intersection_list, join_statement, distinct, order, limit)
         #print(query_str)
-        records = pd.read_sql_query(query_str, self.con)
-        results = []
-        for idx, r in records.iterrows():
-            record = []
-            for k, v in r.items():
-                #print(k, v)
-                record.append(v)
-            results.append(tuple(record))
-        return results
+        return self.fetch_records(query_str, values, named_rows=named_rows)
+
+    def has_table(self, table_name):
+        query_str = "SELECT name FROM sqlite_master WHERE type='table' AND name = ?;"
+        return len(self.fetch_records(query_str, (table_name,))) > 0
+
+    def has_fts_index(self, table_name):
+        return self.has_table(get_fts_table_name(table_name))
+
+    def search_table(self, table_name, column_list, text, filter_list=None, prefix=True, fts_columns=None, limit=None):
+        """ Full text search using the FTS5 index of the table. The results are ordered by relevance.
+
+        Args:
+            table_name (str): table with a full text index, see schema.FTS_INDICES
+            column_list (list): columns of the table to return
+            text (str): search text, all tokens have to match
+            filter_list (list): additional conditions on columns of the table
+            prefix (bool): match tokens that start with the search tokens
+            fts_columns (list): indexed columns to search, by default all indexed columns are searched
+            limit (int): maximum number of results
+
+        Returns:
+            list: list of tuples
+        """
+        query = get_fts_query(text, prefix, fts_columns)
+        if query is None:
+            return []
+        fts_name = get_fts_table_name(table_name)
+        join_statement = build_join_str(fts_name, fts_name + ".rowid", table_name + ".ID", join_type="INNER")
+        column_list = [table_name + "." + c for c in column_list]
+        filter_list = [(table_name + "." + c[0],) + tuple(c[1:]) for c in filter_list or []]
+        filter_list.append((fts_name, query, COND_MATCH))
+        order = ["bm25(" + fts_name + ")"]
+        return self.query_table(table_name, column_list, filter_list, join_statement=join_statement, order=order, limit=limit)
+
+    def count_records(self, table_name, column_list, filter_list=None, intersection_list=None, join_statement=None, distinct=False):
+        """ Returns the number of rows that query_table would return without a limit """
+        query_str, values = self.get_query_str(table_name, column_list, filter_list, intersection_list, join_statement, distinct)
+        records = self.fetch_records(build_count_statement(query_str), values)
+        return records[0][0]
+
+    def iterate_table(self, table_name, column_list, filter_list=None, intersection_list=None, join_statement=None, distinct=False, named_rows=False, batch_size=DEFAULT_FETCH_SIZE):
+        query_str, values = self.get_query_str(table_name, column_list, filter_list, intersection_list, join_statement, distinct)
+        return self.iterate_records(query_str, values, named_rows=named_rows, batch_size=batch_size)
 
     def delete_entry_by_id(self, table_name, motion_id):
-        query_str = "DELETE FROM " + table_name + \
-                    " WHERE ID="+ str(motion_id) + ";"
-        print(query_str)
-        self.con.execute(query_str)
-        self.con.commit()
+        self.delete_entry_by_condition(table_name, [("ID", motion_id)])
     
     def delete_entry_by_name(self, table_name, name):
-        query_str = "DELETE FROM " + table_name + \
-                    " WHERE name='"+ str(name) + "';"
-        print(query_str)
-        self.con.execute(query_str)
-        self.con.commit()
+        self.delete_entry_by_condition(table_name, [("name", str(name))])
     
     def delete_entry_by_condition(self, table_name, filter_list=None, intersection_list=None):
-        query_str = "DELETE FROM " + table_name
-        query_str += self.get_condition_str(filter_list, intersection_list)
-        query_str += ";"
-        print(query_str)
-        self.con.execute(query_str)
-        self.con.commit()
+        query_str = build_delete_statement(table_name, get_conditions_shape(filter_list), get_conditions_shape(intersection_list))
+        values = get_conditions_values(filter_list, intersection_list)
+        print(query_str, values)
+        self.execute_write(query_str, values)
 
     def get_name_list(self, table_name):
         query_str = "SELECT name  FROM " + table_name +" ;"
-        results = pd.read_sql_query(query_str, self.con)
-        return results
+        return [r[0] for r in self.fetch_records(query_str)]
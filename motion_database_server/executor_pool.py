@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+#
+# Copyright 2019 DFKI GmbH.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to permit
+# persons to whom the Software is furnished to do so, subject to the
+# following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN
+# NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE
+# USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+Executors that keep blocking work off the Tornado IOLoop. Database queries and
+file access run in a thread pool. CPU heavy work like decompressing and converting
+motion data runs in a process pool, so it is not limited by the GIL. Functions
+passed to the process pool and their arguments have to be picklable.
+"""
+import functools
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import tornado.ioloop
+from motion_database_server.blob_codecs import DEFAULT_CODEC, set_default_codec
+
+DEFAULT_DB_THREADS = 8
+# None uses the number of CPUs and 0 runs CPU work in the database thread pool
+DEFAULT_CPU_PROCESSES = None
+
+
+class ExecutorPool:
+    def __init__(self, n_db_threads=DEFAULT_DB_THREADS, n_cpu_processes=DEFAULT_CPU_PROCESSES, initializer=None, initargs=()):
+        self.n_db_threads = n_db_threads
+        self.n_cpu_processes = n_cpu_processes
+        self.db_executor = ThreadPoolExecutor(max_workers=n_db_threads, thread_name_prefix="db")
+        self.cpu_executor = None
+        if n_cpu_processes is None or n_cpu_processes > 0:
+            # spawn avoids forking a process that holds sqlite connections and locks
+            context = multiprocessing.get_context("spawn")
+            # spawned processes do not inherit module state, e.g. the default codec, so it is set by the initializer
+            self.cpu_executor = ProcessPoolExecutor(max_workers=n_cpu_processes, mp_context=context,
+                                                    initializer=initializer, initargs=initargs)
+
+    def run_db(self, func, *args, **kwargs):
+        """ Returns an awaitable future of func(*args, **kwargs) executed in the thread pool """
+        return tornado.ioloop.IOLoop.current().run_in_executor(self.db_executor, functools.partial(func, *args, **kwargs))
+
+    def run_cpu(self, func, *args, **kwargs):
+        """ Returns an awaitable future of func(*args, **kwargs) executed in the process pool """
+        if self.cpu_executor is None:
+            return self.run_db(func, *args, **kwargs)
+        return tornado.ioloop.IOLoop.current().run_in_executor(self.cpu_executor, functools.partial(func, *args, **kwargs))
+
+    def shutdown(self):
+        self.db_executor.shutdown(wait=True)
+        if self.cpu_executor is not None:
+            self.cpu_executor.shutdown(wait=True)
+
+
+def load_executor_pool_from_config(config):
+    n_db_threads = config.get("db_threads", DEFAULT_DB_THREADS)
+    n_cpu_processes = config.get("cpu_processes", DEFAULT_CPU_PROCESSES)
+    codec = config.get("blob_codec", DEFAULT_CODEC)
+    return ExecutorPool(n_db_threads, n_cpu_processes, set_default_codec, (codec,))
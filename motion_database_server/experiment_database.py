@@ -77,11 +77,12 @@ class ExperimentDatabase:
         model_id = record[1]
         filename = self.data_dir + os.sep + self.experiments_table + os.sep + logfile
         print("remve experiment", filename)
-        if os.path.isfile(filename):
-            os.remove(filename)
-        self.tables[self.experiments_table].delete_record_by_id(exp_id)
-        if model_id > -1:
-            self.tables[self.files_table].delete_record_by_id(model_id)
+        with self.transaction() as unit_of_work:
+            # the log file is only removed if the records were deleted
+            unit_of_work.add_deleted_file(filename)
+            self.tables[self.experiments_table].delete_record_by_id(exp_id)
+            if model_id > -1:
+                self.tables[self.files_table].delete_record_by_id(model_id)
 
     def edit_experiment(self, exp_id, data):
         self.tables[self.experiments_table].update_record(exp_id, data)
@@ -125,7 +126,7 @@ class ExperimentDatabase:
         else:
             return None
 
-    def get_experiment_list(self, project=None, collection=None, skeleton=None):
+    def get_experiment_list(self, project=None, collection=None, skeleton=None, limit=None, after_id=None, with_count=False):
         intersection_list = []
         if project is not None:
             intersection_list += [("project", project)]
@@ -133,6 +134,9 @@ class ExperimentDatabase:
             intersection_list += [("collection", collection)]
         if skeleton is not None:
             intersection_list += [ ("skeleton", skeleton)]
+        if limit is not None:
+            return self.tables[self.experiments_table].get_record_page(["ID", "name"], intersection_list=intersection_list, distinct=True,
+                                                                        limit=limit, after_id=after_id, with_count=with_count)
         return self.tables[self.experiments_table].get_record_list(["ID", "name"], intersection_list=intersection_list,distinct=True)
     
     def get_experiment_info(self, exp_id):
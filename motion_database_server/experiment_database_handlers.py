@@ -55,7 +55,8 @@ class GetExperimentList(BaseDBHandler):
            project = input_data.get("project",None)
            collection = input_data.get("collection",None)
            skeleton = input_data.get("skeleton",None)
-           exp_list = self.data_transform_service.get_experiment_list(project, collection, skeleton)
+           limit, after_id, with_count = self.get_page_args(input_data)
+           exp_list = self.data_transform_service.get_experiment_list(project, collection, skeleton, limit, after_id, with_count)
            response = json.dumps(exp_list)
            self.write(response)
         except Exception as e:
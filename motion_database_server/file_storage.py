@@ -24,16 +24,65 @@
 import os
 from hashlib import sha512
 from datetime import datetime
+from motion_database_server.schema import BLOB_REFS_TABLE, PACK_INDEX_TABLE
+from motion_database_server.pack_storage import PackStorage, DEFAULT_SEGMENT_SIZE, DEFAULT_COMPACTION_RATIO
+from motion_database_server.blob_cache import BlobCache
 
 MAX_FILENAME_LENGTH = 40
+# number of hash characters per directory level of the fan out layout
+FAN_OUT_WIDTH = 2
+BACKEND_FILES = "files"
+BACKEND_PACK = "pack"
+
+
+def get_data_file_path(data_dir, table_name, name, fan_out=0):
+    """ Returns the path of a data file. With fan_out levels > 0 the file is stored in
+        sub directories named after the first characters of its hash, e.g. ab/cd/abcd...data
+    """
+    directory = data_dir + os.sep + table_name
+    if len(name) >= fan_out * FAN_OUT_WIDTH:
+        for level in range(fan_out):
+            directory += os.sep + name[level*FAN_OUT_WIDTH:(level+1)*FAN_OUT_WIDTH]
+    return directory + os.sep + name
+
 
 class FileStorage:
-    def __init__(self, data_dir) -> None:
+    """ Stores the data columns of tables as files in data_dir/<table>/.
+
+    In the content addressed mode the filename is the digest of the data, so identical
+    data is stored once. The blob_refs table counts the records that reference a file
+    and the file is only removed with its last reference. The mode requires the
+    database, so it can only be used in combination with DatabaseWrapper.
+
+    storage_fan_out sets the number of directory levels of the fan out layout. Files
+    that were not moved yet by migrate_file_layout.py are found in the flat layout.
+
+    With the storage_backend "pack" new data is appended to the segment files of a
+    PackStorage instead. Data files that were written before are still read from the
+    directories until they are removed.
+
+    Loaded data is kept in a BlobCache of blob_cache_size bytes.
+    """
+    def __init__(self, data_dir, config=None) -> None:
         self.data_dir = data_dir
+        if config is None:
+            config = dict()
+        self.content_addressed = config.get("content_addressed_storage", False)
+        self.has_blob_refs = None
+        self.fan_out = config.get("storage_fan_out", 0)
+        self.storage_backend = config.get("storage_backend", BACKEND_FILES)
+        self.pack_segment_size = config.get("pack_segment_size", DEFAULT_SEGMENT_SIZE)
+        self.pack_compaction_interval = config.get("pack_compaction_interval", 0)
+        self.pack_compaction_ratio = config.get("pack_compaction_ratio", DEFAULT_COMPACTION_RATIO)
+        self.pack_storage = None
+        self.has_pack_index = None
+        self.blob_cache = BlobCache(config.get("blob_cache_size", 0))
 
     def save_hashed_file(self, directory, data_type, data):
         if data == "":
             return ""
+        if self.use_content_addressing():
+            return self.save_content_addressed_file(directory, data_type, data)
         hash_filename = self.generate_filename(data) + "." + data_type
         self.save_data_file(directory, hash_filename, data)
         return hash_filename
@@ -45,26 +94,199 @@ class FileStorage:
         hash_filename = hash.hexdigest()[:MAX_FILENAME_LENGTH]
         return hash_filename
 
+    def generate_content_filename(self, data):
+        return sha512(data).hexdigest()[:MAX_FILENAME_LENGTH]
+
+    def use_content_addressing(self):
+        if not self.content_addressed:
+            return False
+        if self.has_blob_refs is None:
+            self.has_blob_refs = self.has_table(BLOB_REFS_TABLE)
+            if not self.has_blob_refs:
+                print("Warning: content addressed storage requires a database migration, use create_database.py --migrate")
+        return self.has_blob_refs
+
+    def get_pack_storage(self):
+        """ Returns the PackStorage or None if the backend is not used """
+        if self.storage_backend != BACKEND_PACK:
+            return None
+        if self.has_pack_index is None:
+            self.has_pack_index = self.has_table(PACK_INDEX_TABLE)
+            if not self.has_pack_index:
+                print("Warning: the pack storage backend requires a database migration, use create_database.py --migrate")
+            else:
+                self.pack_storage = PackStorage(self.data_dir, self, self.pack_segment_size)
+        return self.pack_storage
+
+    def start_pack_compaction(self):
+        """ Starts the background compaction of the pack storage if an interval is configured """
+        pack_storage = self.get_pack_storage()
+        if pack_storage is None or self.pack_compaction_interval <= 0:
+            return
+        pack_storage.start_compaction_thread(self.pack_compaction_interval, self.pack_compaction_ratio)
+
+    def save_content_addressed_file(self, directory, data_type, data):
+        hash_filename = self.generate_content_filename(data) + "." + data_type
+        pack_storage = self.get_pack_storage()
+        with self.transaction() as unit_of_work:
+            exists = pack_storage is not None and pack_storage.contains(directory, hash_filename)
+            filename = self.find_data_file(directory, hash_filename)
+            if filename is not None:
+                # the file might be scheduled for removal by an earlier step of the transaction
+                unit_of_work.cancel_deleted_file(filename)
+                exists = True
+            self.add_blob_reference(directory, hash_filename)
+            if not exists:
+                self.save_data_file(directory, hash_filename, data)
+        return hash_filename
+
+    def add_blob_reference(self, table_name, name):
+        query_str = "INSERT INTO " + BLOB_REFS_TABLE + " (tableName, name, refCount) VALUES (?, ?, 1) " \
+                    + "ON CONFLICT (tableName, name) DO UPDATE SET refCount = refCount + 1;"
+        self.execute_write(query_str, (table_name, name))
+
+    def remove_blob_reference(self, table_name, name):
+        """ Returns the number of remaining references or None if the file is not reference counted """
+        query_str = "SELECT refCount FROM " + BLOB_REFS_TABLE + " WHERE tableName = ? AND name = ?;"
+        records = self.fetch_records(query_str, (table_name, name))
+        if len(records) < 1:
+            return None
+        ref_count = records[0][0] - 1
+        if ref_count > 0:
+            query_str = "UPDATE " + BLOB_REFS_TABLE + " SET refCount = ? WHERE tableName = ? AND name = ?;"
+            self.execute_write(query_str, (ref_count, table_name, name))
+        else:
+            query_str = "DELETE FROM " + BLOB_REFS_TABLE + " WHERE tableName = ? AND name = ?;"
+            self.execute_write(query_str, (table_name, name))
+        return ref_count
+
+    def get_unit_of_work(self):
+        """ overwritten by DatabaseWrapper when both classes are combined """
+        return None
+
+    def get_data_file_path(self, table_name, name):
+        return get_data_file_path(self.data_dir, table_name, name, self.fan_out)
+
+    def find_data_file(self, table_name, name):
+        """ Returns the path of an existing data file in the current or the flat layout or None """
+        filename = self.get_data_file_path(table_name, name)
+        if os.path.isfile(filename):
+            return filename
+        if self.fan_out == 0:
+            return None
+        legacy_filename = get_data_file_path(self.data_dir, table_name, name)
+        if os.path.isfile(legacy_filename):
+            return legacy_filename
+        # the file might have been moved by the migration in the meantime
+        if os.path.isfile(filename):
+            return filename
+        return None
+
+    def get_blob_cache_stats(self):
+        return self.blob_cache.get_stats()
+
     def save_data_file(self, directory, name, data):
-        filename = self.data_dir + os.sep + directory+os.sep+name
+        self.blob_cache.invalidate((directory, name))
+        pack_storage = self.get_pack_storage()
+        if pack_storage is not None:
+            pack_storage.save(directory, name, data)
+            return
+        filename = self.get_data_file_path(directory, name)
+        if self.fan_out > 0:
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
         with open(filename, "wb") as file:
             file.write(data)
+        unit_of_work = self.get_unit_of_work()
+        if unit_of_work is not None:
+            unit_of_work.add_created_file(filename)
 
     def load_data_file(self, table_name, name):
         if name is None:
             return None
-        filename = self.data_dir + os.sep + table_name + os.sep + name
-        
-        if not os.path.isfile(filename):
+        data = self.blob_cache.get((table_name, name))
+        if data is not None:
+            return data
+        data = self.read_data_file(table_name, name)
+        self.blob_cache.put((table_name, name), data)
+        return data
+
+    def read_data_file(self, table_name, name):
+        pack_storage = self.get_pack_storage()
+        if pack_storage is not None:
+            data = pack_storage.load(table_name, name)
+            if data is not None:
+                return data
+        filename = self.find_data_file(table_name, name)
+        if filename is None:
             return None
         with open(filename, "rb") as file:
             data = file.read()
         return data
 
+    def get_data_file_location(self, table_name, name):
+        """ Returns path, offset and length of the stored data or None if it does not exist """
+        pack_storage = self.get_pack_storage()
+        if pack_storage is not None:
+            location = pack_storage.get_location(table_name, name)
+            if location is not None:
+                segment_id, offset, length, _ = location
+                return pack_storage.get_segment_path(segment_id), offset, length
+        filename = self.find_data_file(table_name, name)
+        if filename is None:
+            return None
+        return filename, 0, os.path.getsize(filename)
+
+    def open_data_file(self, table_name, name):
+        """ Opens the stored data for streaming, so it does not have to be loaded into memory at once.
+
+        Returns:
+            tuple: file positioned at the start of the data, the length of the data and an
+                   entity tag or None. Data files are named by a hash, so the name is the tag.
+        """
+        if name is None:
+            return None
+        for retry in range(2):
+            location = self.get_data_file_location(table_name, name)
+            if location is None:
+                return None
+            filename, offset, length = location
+            try:
+                file = open(filename, "rb")
+            except FileNotFoundError:
+                # the file was moved by a migration or compaction after the lookup
+                continue
+            file.seek(offset)
+            return file, length, name
+        return None
+
     def delete_data_file(self, table_name, name):
         if name is None:
             return
-        filename = self.data_dir + os.sep + table_name + os.sep + name
-        if not os.path.isfile(filename):
+        if self.use_content_addressing():
+            with self.transaction():
+                ref_count = self.remove_blob_reference(table_name, name)
+                if ref_count is not None and ref_count > 0:
+                    return
+                self.remove_data_file(table_name, name)
+        else:
+            self.remove_data_file(table_name, name)
+
+    def remove_data_file(self, table_name, name):
+        self.blob_cache.invalidate((table_name, name))
+        unit_of_work = self.get_unit_of_work()
+        if unit_of_work is not None:
+            # the data might be cached again by a reader until the transaction is committed
+            unit_of_work.add_commit_callback(lambda: self.blob_cache.invalidate((table_name, name)))
+        pack_storage = self.get_pack_storage()
+        if pack_storage is not None and pack_storage.contains(table_name, name):
+            pack_storage.remove(table_name, name)
+            return
+        filename = self.find_data_file(table_name, name)
+        if filename is None:
+            return
+        unit_of_work = self.get_unit_of_work()
+        if unit_of_work is not None:
+            # delete the file when the transaction is committed
+            unit_of_work.add_deleted_file(filename)
             return
-        os.remove(filename)
\ No newline at end of file
+        os.remove(filename)
@@ -1,6 +1,7 @@
 import os
 from pathlib import Path
 from .table import Table
+from .query_builder import build_join_str
 
 class FilesDatabase:
     files_table = "files"   
@@ -13,11 +14,15 @@ class FilesDatabase:
         for name in self.tables_desc:
             self.tables[name] = Table(self, name, self.tables_desc[name])
 
-    def get_file_list(self, collection=None, skeleton=None, dataType=None, tags=None):
+    def get_file_list(self, collection=None, skeleton=None, dataType=None, tags=None, limit=None, after_id=None, with_count=False):
+        """ Returns all matching files or a page of files if a limit is given.
+            See Table.get_record_page for the format of a page.
+        """
         filter_conditions = []
         intersection_list = []
         join_statement = None
         cols = ["ID","name", "dataType"]
+        id_col = "ID"
         if collection is not None:
             filter_conditions+=[("collection", str(collection))]
         if skeleton is not None:
@@ -25,17 +30,35 @@ class FilesDatabase:
         if dataType is not None:
             filter_conditions+=[("dataType", dataType)]
         if tags is not None:# join data types and tagging tables to filter data types based on tags
-            join_statement = " LEFT JOIN "+self.data_types_table+" ON  "+self.files_table+".dataType = "+self.data_types_table+".name"
-            join_statement += " LEFT JOIN "+self.data_type_taggings_table+" ON "+self.data_types_table+".name = "+ self.data_type_taggings_table + ".dataType"
+            join_statement = build_join_str(self.data_types_table, self.files_table+".dataType", self.data_types_table+".name")
+            join_statement += " " + build_join_str(self.data_type_taggings_table, self.data_types_table+".name", self.data_type_taggings_table + ".dataType")
             #filter_conditions += [(self.data_types_table+".isModel", int(is_model)) ]
             cols = [self.files_table+".ID",self.files_table+".name", self.files_table+".dataType"]
+            id_col = self.files_table+".ID"
             
             for tag in tags:
                 intersection_list += [(self.data_type_taggings_table+".tag", tag) ]
+        if limit is not None:
+            return self.tables[self.files_table].get_record_page(cols, filter_conditions, intersection_list, join_statement, True,
+                                                                  limit, after_id, with_count, id_col)
         return self.tables[self.files_table].get_record_list(cols, filter_conditions=filter_conditions,intersection_list=intersection_list, join_statement=join_statement, distinct=True)
     
+    def search_files(self, text, collection=None, skeleton=None, dataType=None, prefix=True, limit=100):
+        """ Full text search over name, comment and subject ranked by relevance """
+        filter_conditions = []
+        if collection is not None:
+            filter_conditions+=[("collection", str(collection))]
+        if skeleton is not None:
+            filter_conditions+=[("skeleton", skeleton)]
+        if dataType is not None:
+            filter_conditions+=[("dataType", dataType)]
+        return self.tables[self.files_table].search_records(text, ["ID","name", "dataType"], filter_conditions, prefix, limit)
+
     def create_file(self, data):
-        return self.tables[self.files_table].create_record(data)
+        return self.create_files([data])[0]
+
+    def create_files(self, data_list):
+        return self.tables[self.files_table].create_records(data_list)
 
     def get_file_by_id(self, f_id):
         r = self.tables[self.files_table].get_record_by_id(f_id, ["data"])
@@ -46,6 +69,14 @@ class FilesDatabase:
             print("Error in get file data",f_id)
         return data
 
+    def open_file_by_id(self, f_id, column="data"):
+        """ Returns the open data file, its length and entity tag, see FileStorage.open_data_file """
+        records = self.query_table(self.files_table, [column], [("ID", f_id)])
+        if len(records) < 1:
+            print("Error in get file data",f_id)
+            return None
+        return self.open_data_file(self.files_table, records[0][0])
+
     def edit_file(self, f_id, data):
         self.tables[self.files_table].update_record(f_id, data)
 
@@ -78,7 +109,7 @@ class FilesDatabase:
         filter_conditions = []
         join_statement = None
         if tags is not None:
-            join_statement = " LEFT JOIN "+self.data_type_taggings_table+" ON  "+self.data_types_table+".dataType = "+self.data_type_taggings_table+".dataType"
+            join_statement = build_join_str(self.data_type_taggings_table, self.data_types_table+".dataType", self.data_type_taggings_table+".dataType")
             for tag in tags:
                 filter_conditions += [(self.data_type_taggings_table+".tag", tag) ]
         return self.tables[self.data_types_table].get_record_list(["name"], filter_conditions=filter_conditions, join_statement=join_statement, distinct=True)
@@ -96,27 +127,29 @@ class FilesDatabase:
 
     def remove_data_type(self, dt):
         print("remove dataType", dt)
-        self.tables[self.data_types_table].delete_record_by_name(dt)
-        condition_list = [("dataType", dt)]
-        self.tables[self.data_loader_table].delete_record_by_condition(condition_list)
+        with self.transaction():
+            self.tables[self.data_types_table].delete_record_by_name(dt)
+            condition_list = [("dataType", dt)]
+            self.tables[self.data_loader_table].delete_record_by_condition(condition_list)
     
     def edit_data_type(self, dt, data):
-        self.tables[self.data_types_table].update_record_by_name(dt, data)#
-        conditions = [("dataType", dt)]
-        if "name" not in data:
-            return
-        # rename in other tables
-        input_data = dict()
-        input_data["dataType"] = data["name"]
-        self.tables[self.files_table].update_record_by_condition(conditions, input_data)
-
-        input_data = dict()
-        input_data["dataType"] = data["name"]
-        self.tables[self.data_loader_table].update_record_by_condition(conditions, input_data)
-
-        input_data = dict()
-        input_data["dataType"] = data["name"]
-        self.tables[self.data_type_taggings_table].update_record_by_condition(conditions, input_data)
+        with self.transaction():
+            self.tables[self.data_types_table].update_record_by_name(dt, data)#
+            conditions = [("dataType", dt)]
+            if "name" not in data:
+                return
+            # rename in other tables
+            input_data = dict()
+            input_data["dataType"] = data["name"]
+            self.tables[self.files_table].update_record_by_condition(conditions, input_data)
+
+            input_data = dict()
+            input_data["dataType"] = data["name"]
+            self.tables[self.data_loader_table].update_record_by_condition(conditions, input_data)
+
+            input_data = dict()
+            input_data["dataType"] = data["name"]
+            self.tables[self.data_type_taggings_table].update_record_by_condition(conditions, input_data)
         
 
     def get_data_type_info(self, dt):
@@ -156,19 +189,21 @@ class FilesDatabase:
         return self.tables[self.tags_table].create_record(data)
     
     def rename_tag(self, old_tag, new_tag):
-        data = dict()
-        data["name"] = new_tag
-        self.tables[self.tags_table].update_record_by_name(old_tag, data)
-        data = dict()
-        data["tag"] = new_tag
-        conditions = [("tag", old_tag)]
-        self.tables[self.data_type_taggings_table].update_record_by_condition(conditions, data)
+        with self.transaction():
+            data = dict()
+            data["name"] = new_tag
+            self.tables[self.tags_table].update_record_by_name(old_tag, data)
+            data = dict()
+            data["tag"] = new_tag
+            conditions = [("tag", old_tag)]
+            self.tables[self.data_type_taggings_table].update_record_by_condition(conditions, data)
         
     
     def remove_tag(self, tag):
-        self.tables[self.tags_table].delete_record_by_name(tag)
-        condition = [("tag",tag)]
-        return self.tables[self.data_type_taggings_table].delete_record_by_condition(condition)
+        with self.transaction():
+            self.tables[self.tags_table].delete_record_by_name(tag)
+            condition = [("tag",tag)]
+            return self.tables[self.data_type_taggings_table].delete_record_by_condition(condition)
     
     def get_data_type_tag_list(self, data_type):
         filter_conditions=[("dataType", data_type)]
@@ -211,8 +246,12 @@ class FilesDatabase:
         print("missing_meta_references",missing_meta_references)
 
     def get_file_references(self):
-        records = self.tables[self.files_table].db.query_table(self.files_table, ["data", "metaData"], [])
-        return zip(*records)
+        data_files_ref = []
+        meta_data_files_ref = []
+        for data_file, meta_data_file in self.tables[self.files_table].iterate_record_list(["data", "metaData"]):
+            data_files_ref.append(data_file)
+            meta_data_files_ref.append(meta_data_file)
+        return data_files_ref, meta_data_files_ref
     
     def has_data_file(self, file_name):        
         condition = [("data",file_name)]
@@ -3,6 +3,7 @@ import json
 import base64
 import tornado.web
 from motion_database_server.base_handler import BaseDBHandler
+from motion_database_server.upload_stream import StreamUploadHandler
 
 
 class FileDBHandler(BaseDBHandler):
@@ -24,8 +25,7 @@ class FileDBHandler(BaseDBHandler):
         return self.has_access_to_file(file_id, token)
 
 class GetFileList(FileDBHandler):
-    @tornado.gen.coroutine
-    def post(self):
+    async def post(self):
         try:
             input_str = self.request.body.decode("utf-8")
             input_data = json.loads(input_str)
@@ -33,7 +33,9 @@ class GetFileList(FileDBHandler):
             data_type = input_data.get("data_type", None)
             skeleton = input_data.get("skeleton", None)
             tags = input_data.get("tags", None)
-            files = self.motion_database.get_file_list(collection, skeleton, data_type, tags=tags)
+            limit, after_id, with_count = self.get_page_args(input_data)
+            files = await self.run_db(self.motion_database.get_file_list, collection, skeleton, data_type, tags=tags,
+                                      limit=limit, after_id=after_id, with_count=with_count)
             files_str = json.dumps(files)
             self.write(files_str)
         except Exception as e:
@@ -43,19 +45,56 @@ class GetFileList(FileDBHandler):
         finally:
             self.finish()
 
-class AddFileHandler(FileDBHandler):
-    @tornado.gen.coroutine
-    def post(self):
+class SearchFilesHandler(FileDBHandler):
+    async def post(self):
         try:
             input_str = self.request.body.decode("utf-8")
             input_data = json.loads(input_str)
+            query = input_data.get("query", "")
+            collection = input_data.get("collection", None)
+            data_type = input_data.get("data_type", None)
+            skeleton = input_data.get("skeleton", None)
+            prefix = bool(input_data.get("prefix", True))
+            limit = int(input_data.get("limit", 100))
+            files = await self.run_db(self.motion_database.search_files, query, collection, skeleton, data_type, prefix, limit)
+            files_str = json.dumps(files)
+            self.write(files_str)
+        except Exception as e:
+            print("caught exception in post")
+            self.write("Caught an exception: %s" % e)
+            raise
+        finally:
+            self.finish()
+
+class AddFileHandler(StreamUploadHandler, FileDBHandler):
+    async def post(self):
+        try:
+            input_data, upload_files = self.get_upload_data()
             response_dict = dict()
             success = False
-            if "collection" in input_data and "data" in input_data and self.project_database.check_rights(input_data):
-                input_data["data"] = base64.b64decode(input_data["data"])
-                new_id = self.motion_database.create_file(input_data)
+            has_data = "data" in input_data or "data" in upload_files or "upload_id" in input_data
+            has_rights = "collection" in input_data and has_data and await self.run_db(self.project_database.check_rights, input_data)
+            if has_rights and ("data" in input_data or "data" in upload_files):
+                if "data" in upload_files:
+                    input_data["data"] = await self.run_db(self.read_upload_file, upload_files["data"])
+                else:
+                    input_data["data"] = base64.b64decode(input_data["data"])
+                if "metaData" in upload_files:
+                    input_data["metaData"] = await self.run_db(self.read_upload_file, upload_files["metaData"])
+                new_id = await self.run_db(self.motion_database.create_file, input_data)
                 response_dict["id"] = new_id
                 success = True
+            elif has_rights:
+                # finalize a resumable upload
+                session_id = await self.run_db(self.get_upload_session, input_data)
+                if session_id is not None:
+                    del input_data["upload_id"]
+                    input_data["data"] = await self.run_db(self.motion_database.upload_sessions.read_data, session_id)
+                    new_id = await self.run_db(self.motion_database.create_file, input_data)
+                    response_dict["id"] = new_id
+                    success = True
+                else:
+                    print("Error: unknown upload session")
             else:
                 print("Error: did not find expected input data")
             response_dict["success"] = success
@@ -71,16 +110,16 @@ class AddFileHandler(FileDBHandler):
 
 
 class RemoveFileHandler(FileDBHandler):
-    @tornado.gen.coroutine
-    def post(self):
+    async def post(self):
         try:
             input_str = self.request.body.decode("utf-8")
             input_data = json.loads(input_str)
             success = False
             response_dict = dict()
-            if self.has_access(input_data):
+            has_access = await self.run_db(self.has_access, input_data)
+            if has_access:
                 m_id = input_data["file_id"]
-                self.motion_database.delete_file_by_id(m_id)
+                await self.run_db(self.motion_database.delete_file_by_id, m_id)
                 success = True
             else:
                 print("Error: has no access rights")
@@ -102,16 +141,15 @@ class DownloadFileHandler(FileDBHandler):
         super(DownloadFileHandler, self).set_default_headers()
         self.set_header('Content-Type', 'application/octet-stream')
 
-    @tornado.gen.coroutine
-    def post(self):
+    async def post(self):
         try:
             input_str = self.request.body.decode("utf-8")
             print(input_str)
 
             input_data = json.loads(input_str)
-            data = self.motion_database.get_file_by_id(input_data["file_id"])
-            if data is not None:
-                self.write(data)
+            data_file = await self.run_db(self.motion_database.open_file_by_id, input_data["file_id"])
+            if data_file is not None:
+                await self.write_data_file(data_file)
             else:
                 self.write("")
                         
@@ -123,22 +161,22 @@ class DownloadFileHandler(FileDBHandler):
             self.finish()
 
 
-class ReplaceFileHandler(FileDBHandler):
-    @tornado.gen.coroutine
-    def post(self):
+class ReplaceFileHandler(StreamUploadHandler, FileDBHandler):
+    async def post(self):
         try:
-            input_str = self.request.body.decode("utf-8")
-            input_data = json.loads(input_str)
+            input_data, upload_files = self.get_upload_data()
             response_dict = dict()
             success = False
-            if self.has_access(input_data):
+            has_access = await self.run_db(self.has_access, input_data)
+            if has_access:
                 success = True
                 m_id = input_data["file_id"]
-                if "data" in input_data:
-                    input_data["data"] = base64.b64decode(input_data["data"])
-                if "metaData" in input_data:
-                    input_data["metaData"] = base64.b64decode(input_data["metaData"])
-                self.motion_database.edit_file(m_id, input_data)
+                for key in ["data", "metaData"]:
+                    if key in upload_files:
+                        input_data[key] = await self.run_db(self.read_upload_file, upload_files[key])
+                    elif key in input_data:
+                        input_data[key] = base64.b64decode(input_data[key])
+                await self.run_db(self.motion_database.edit_file, m_id, input_data)
             response_dict["success"] = success
             response = json.dumps(response_dict)
             self.write(response)
@@ -322,6 +360,7 @@ class DataTypeImportHandler(BaseDBHandler):
 
 
 FILE_DB_HANDLER_LIST = [(r"/files", GetFileList),
+                            (r"/files/search", SearchFilesHandler),
                             (r"/files/add", AddFileHandler),
                             (r"/files/replace", ReplaceFileHandler),
                             (r"/files/remove", RemoveFileHandler),
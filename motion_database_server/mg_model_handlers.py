@@ -1,9 +1,8 @@
 
 import json
 import bson
-import bz2
 import tornado.web
-from motion_database_server.utils import get_bvh_string
+from motion_database_server.utils import get_bvh_string, compress_bson, extract_compressed_bson
 from motion_database_server.base_handler import BaseDBHandler
 USER_ROLE_ADMIN = "admin"
 
@@ -44,8 +43,7 @@ class UploadMotionModelHandler(BaseDBHandler):
             output_str = "done"
             print("upload motion primitive model")
             if "collection" in input_data and "data" in input_data and self.project_database.check_rights(input_data):
-                mm_data_str = bson.dumps(input_data["data"])
-                mm_data_str = bz2.compress(mm_data_str)
+                mm_data_str = compress_bson(input_data["data"])
                 data = dict()
                 data["id"] = self.motion_database.upload_motion_model(input_data["name"],
                                                         input_data["collection"], 
@@ -104,8 +102,7 @@ class UploadClusterTreeHandler(BaseDBHandler):
                 return
             print("upload cluster tree")
             if "model_id" in input_data and "cluster_tree_data" in input_data:
-                cluster_tree_data_str = bson.dumps(json.loads(input_data["cluster_tree_data"]))
-                cluster_tree_data_str = bz2.compress(cluster_tree_data_str)
+                cluster_tree_data_str = compress_bson(json.loads(input_data["cluster_tree_data"]))
                 self.motion_database.upload_cluster_tree(input_data["model_id"],
                                                         cluster_tree_data_str)
             else:
@@ -121,16 +118,15 @@ class UploadClusterTreeHandler(BaseDBHandler):
 
 
 class DownloadMotionModelHandler(BaseDBHandler):
-    @tornado.gen.coroutine
-    def post(self):
+    async def post(self):
         try:
             input_str = self.request.body.decode("utf-8")
             print(input_str)
 
             input_data = json.loads(input_str)
-            data, cluster_tree_data, skeleton_name = self.motion_database.get_motion_primitive_model_by_id(input_data["model_id"])
-            if data is not None:
-                self.write(data)
+            data_file = await self.run_db(self.motion_database.open_file_by_id, input_data["model_id"])
+            if data_file is not None:
+                await self.write_data_file(data_file)
             else:
                 self.write("")
 
@@ -231,8 +227,7 @@ class GetTimeFunctionHandler(BaseDBHandler):
             m_id = input_data["clip_id"]
             data, meta_data, skeleton_name = self.motion_database.get_motion_by_id(m_id)
             if meta_data is not None and meta_data != b"x00" and meta_data != "":
-                meta_data = bz2.decompress(meta_data)
-                meta_data = bson.loads(meta_data)
+                meta_data = extract_compressed_bson(meta_data)
                 if "time_function" in meta_data:
                     time_function_str = json.dumps(meta_data["time_function"])
                     self.write(time_function_str)
@@ -21,8 +21,6 @@
 # OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE
 # USE OR OTHER DEALINGS IN THE SOFTWARE.
 import json
-import bson
-import bz2
 import tornado.web
 from motion_database_server.base_handler import BaseDBHandler
 import base64
@@ -1,8 +1,7 @@
 
 
-import bson
-import bz2
 import numpy as np
+from motion_database_server.utils import extract_compressed_bson
 
 class ModelGraphDatabase(): 
     graph_table = "model_graphs"
@@ -30,8 +29,7 @@ class ModelGraphDatabase():
         data = None
         if len(records) > 0:
             data = records[0]
-            data = bz2.decompress(data)
-            data = bson.loads(data)
+            data = extract_compressed_bson(data)
         return data
 
     def remove_graph_by_id(self, graph_id):
@@ -1,9 +1,8 @@
 
 import json
-import bson
-import bz2
 import tornado.web
 from motion_database_server.base_handler import BaseDBHandler
+from motion_database_server.utils import compress_bson
 USER_ROLE_ADMIN = "admin"
 
 
@@ -47,8 +46,7 @@ class UploadGraphHandler(BaseDBHandler):
                 name = input_data["name"]
                 skeleton = input_data["skeleton"]
                 project = input_data["project"]
-                data = bson.dumps(input_data["data"])
-                data = bz2.compress(data)
+                data = compress_bson(input_data["data"])
                 result_id = self.motion_database.add_new_graph(name, project, skeleton, data)
                 response_dict["id"] = result_id
             response_dict["success"] = success
@@ -77,8 +75,7 @@ class ReplaceGraphHandler(BaseDBHandler):
                 return
             if "id" in input_data and "data" in input_data:
                 graph_id = input_data["id"]
-                data = bson.dumps(input_data["data"])
-                input_data["data"] = bz2.compress(data)
+                input_data["data"] = compress_bson(input_data["data"])
                 self.motion_database.replace_graph(graph_id, input_data)
                 success = True
             response_dict["success"] = success
@@ -21,10 +21,7 @@
 # OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE
 # USE OR OTHER DEALINGS IN THE SOFTWARE.
 import os
-import bson
-import bz2
-import base64
-from motion_database_server.utils import get_bvh_from_str, extract_compressed_bson
+from motion_database_server.utils import get_bvh_from_str, extract_compressed_bson, compress_bson
 from motion_database_server.project_database import ProjectDatabase
 from motion_database_server.skeleton_database import SkeletonDatabase
 from motion_database_server.model_graph_database import ModelGraphDatabase
@@ -35,7 +32,7 @@ from anim_utils.animation_data.motion_vector import MotionVector
 from motion_database_server.character_storage import CharacterStorage
 from motion_database_server.file_storage import FileStorage
 from motion_database_server.model_types_database import ModelTypesDatabase
-from motion_database_server.upload_buffer import UploadBuffer
+from motion_database_server.upload_sessions import load_upload_session_store, get_session_id
 from motion_database_server.schema import DBSchema, TABLES3
 
 
@@ -49,7 +46,7 @@ class MotionDatabase(ProjectDatabase, SkeletonDatabase, ModelGraphDatabase, MGMo
         FileStorage.__init__(self, data_dir)
         CharacterStorage.__init__(self, data_dir + os.sep +"characters")
         MGModelDatabase.__init__(self)
-        self.upload_buffer = UploadBuffer()
+        self.upload_sessions = load_upload_session_store(data_dir)
         ProjectDatabase.__init__(self, schema, server_secret)
     
     def load_skeletons(self):
@@ -161,20 +158,17 @@ class MotionDatabase(ProjectDatabase, SkeletonDatabase, ModelGraphDatabase, MGMo
    
     def upload_motion(self, part_idx, n_parts, collection, skeleton_name, name, base64_data_str, meta_data, processed=0):
         print("upload motion", name)
-        self.upload_buffer.update_buffer(name, part_idx, n_parts,base64_data_str)
-        if not self.upload_buffer.is_complete(name):
+        session_id = get_session_id(name)
+        if not self.upload_sessions.add_part(session_id, part_idx, n_parts, base64_data_str):
             return
-        base64_data_str = self.upload_buffer.get_data(name)
-        self.upload_buffer.delete_data(name)
 
         #extract n frames
-        data = base64.decodebytes(base64_data_str.encode('utf-8'))
-        data = extract_compressed_bson(data)
+        with self.upload_sessions.open_data(session_id) as file:
+            data = extract_compressed_bson(file.read())
         n_frames = 0
         if "poses" in data:
             n_frames = len(data["poses"])
-        data = bson.dumps(data)
-        data = bz2.compress(data)
+        data = compress_bson(data)
         return self.insert_motion(collection, skeleton_name, name, data, meta_data, n_frames, processed)
 
     def load_motion_vector_from_bvh_str(self, bvh_str):
@@ -189,8 +183,7 @@ class MotionDatabase(ProjectDatabase, SkeletonDatabase, ModelGraphDatabase, MGMo
         motion_vector = self.load_motion_vector_from_bvh_str(bvh_str)
         data = motion_vector.to_db_format()
         n_frames = len(data["poses"])
-        data = bson.dumps(data)
-        data = bz2.compress(data)
+        data = compress_bson(data)
         self.insert_motion(collection, skeleton_name, name, data, None, n_frames)
             
     def insert_motion(self, collection, skeleton_name, name, motion_data, meta_data, n_frames, processed=0):
@@ -22,9 +22,8 @@
 # USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 import os
-import bson
-import bz2
 from motion_database_server.utils import get_bvh_from_str, extract_compressed_bson, get_bvh_string, save_json_file
+from motion_database_server.motion_format import load_motion_data
 
 from anim_utils.animation_data.motion_vector import MotionVector
 
@@ -132,16 +131,20 @@ class MotionDatabaseExporter:
         data, meta_data, skeleton_name = self.get_motion_by_id(motion_id)
         if data is None:
             return
-        motion_dict = extract_compressed_bson(data)
-        motion_vector = MotionVector()
-        motion_vector.from_custom_db_format(motion_dict)
+        cache_key = self.get_bvh_cache_key(motion_id)
+        bvh_data = self.render_cache.get(cache_key)
         try:
-            bvh_str = get_bvh_string(skeleton, motion_vector.frames)
+            if bvh_data is None:
+                motion_dict = load_motion_data(data)
+                motion_vector = MotionVector()
+                motion_vector.from_custom_db_format(motion_dict)
+                bvh_data = get_bvh_string(skeleton, motion_vector.frames).encode("utf-8")
+                self.render_cache.put(cache_key, bvh_data)
             filename = directory+os.sep+name
             if not name.endswith(".bvh"):
                 filename += ".bvh"
             with open(filename, "wt") as out_file:
-                out_file.write(bvh_str)
+                out_file.write(bvh_data.decode("utf-8"))
             print("wrote file", filename)
         except Exception as e :
             print("Error: writing file", motion_id, name, e.args)
@@ -150,8 +153,7 @@ class MotionDatabaseExporter:
         if export_annotation and meta_data is not None and meta_data != b"x00" and meta_data != "":
             meta_filename = filename+".meta"
             try:
-                meta_data = bz2.decompress(meta_data)
-                meta_data = bson.loads(meta_data)
+                meta_data = extract_compressed_bson(meta_data)
                 save_json_file(meta_data, meta_filename)
             except:
                 print("Error could not decode",meta_data)
@@ -20,14 +20,84 @@
 # DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
 # OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE
 # USE OR OTHER DEALINGS IN THE SOFTWARE.
+import io
 import time
 import json
-import bson
-import bz2
-import tornado.web
-from motion_database_server.utils import get_bvh_string
+import threading
+import numpy as np
+from collections import OrderedDict
+from motion_database_server.utils import get_bvh_string, compress_bson, extract_compressed_bson
 from anim_utils.animation_data import MotionVector
 from motion_database_server.base_handler import BaseDBHandler
+from motion_database_server.upload_stream import StreamUploadHandler
+from motion_database_server.bvh_serializer import get_reduced_reference_frame
+from motion_database_server.motion_format import load_motion_frames, convert_motion_blob, \
+    slice_motion_blob, get_joint_channels, get_motion_blob_format, MOTION_FORMAT_BSON, MOTION_FORMATS
+
+
+def get_frame_selection(input_data):
+    """ Returns the start frame, end frame, stride and joints of a request or None if the whole motion is requested """
+    start_frame = input_data.get("start_frame", None)
+    end_frame = input_data.get("end_frame", None)
+    stride = int(input_data.get("stride", 1))
+    joints = input_data.get("joints", None)
+    if start_frame is None and end_frame is None and stride == 1 and joints is None:
+        return None
+    if start_frame is not None:
+        start_frame = int(start_frame)
+    if end_frame is not None:
+        end_frame = int(end_frame)
+    return start_frame, end_frame, stride, joints
+
+
+def convert_motion_to_bvh_str(skeleton, data, selection=None):
+    if selection is None:
+        selection = (None, None, 1, None)
+    start_frame, end_frame, stride, joints = selection
+    data = load_motion_frames(data, start_frame, end_frame, stride)
+    frames = np.asarray(data["poses"])
+    if joints is not None:
+        # joints that were not requested are kept in the reference pose of the skeleton
+        channels = get_joint_channels(skeleton.animated_joints, joints, frames.shape[1])
+        rest_frames = np.empty(frames.shape)
+        rest_frames[:] = get_reduced_reference_frame(skeleton)[:frames.shape[1]]
+        rest_frames[:, channels] = frames[:, channels]
+        data["poses"] = rest_frames
+    motion_vector = MotionVector()
+    motion_vector.from_custom_db_format(data)
+    frame_time = skeleton.frame_time * stride
+    return get_bvh_string(skeleton, motion_vector.frames, frame_time)
+
+
+# skeletons that a worker process received for the BVH export by the data file name of the skeleton
+WORKER_SKELETON_CACHE_SIZE = 16
+_worker_skeletons = OrderedDict()
+_worker_skeletons_lock = threading.Lock()
+
+
+def convert_motion_to_bvh_str_in_worker(skeleton_key, data, selection=None, skeleton=None):
+    """ Converts the motion with a skeleton that the worker keeps by skeleton_key, so the skeleton
+        is only sent once to each worker process and not pickled with every request.
+
+    Returns:
+        str: BVH string or None if skeleton is None and the worker does not have the skeleton
+    """
+    with _worker_skeletons_lock:
+        if skeleton is None:
+            skeleton = _worker_skeletons.get(skeleton_key, None)
+            if skeleton is None:
+                return None
+            _worker_skeletons.move_to_end(skeleton_key)
+        elif skeleton_key is not None:
+            _worker_skeletons[skeleton_key] = skeleton
+            while len(_worker_skeletons) > WORKER_SKELETON_CACHE_SIZE:
+                _worker_skeletons.popitem(last=False)
+    return convert_motion_to_bvh_str(skeleton, data, selection)
+
+
+def convert_annotation_to_json_str(meta_data):
+    meta_data = extract_compressed_bson(meta_data)
+    return json.dumps(meta_data)
 
 
 class MotionDBHandler(BaseDBHandler):
@@ -41,21 +111,44 @@ class MotionDBHandler(BaseDBHandler):
         return self.has_access_to_collection(collection_id, token)
 
 class GetMotionHandler(BaseDBHandler):
-    def post(self):
+    async def post(self):
         input_str = self.request.body.decode("utf-8")
         start = time.time()
         input_data = json.loads(input_str)
-        data = self.motion_database.get_motion_from_file(input_data["clip_id"])
-        
-        self.write(data)
+        # clients that do not request a format expect compressed bson
+        motion_format = input_data.get("format", MOTION_FORMAT_BSON)
+        if motion_format not in MOTION_FORMATS:
+            motion_format = MOTION_FORMAT_BSON
+        selection = get_frame_selection(input_data)
+        data_file = None
+        if selection is None:
+            data_file = await self.run_db(self.motion_database.open_motion_file, input_data["clip_id"], motion_format)
+        if data_file is not None:
+            await self.write_data_file(data_file)
+        elif selection is not None:
+            data = await self.run_db(self.motion_database.get_motion_from_file, input_data["clip_id"])
+            if data is not None:
+                start_frame, end_frame, stride, joints = selection
+                animated_joints = None
+                if joints is not None:
+                    skeleton = await self.run_db(self.motion_database.get_motion_skeleton, input_data["clip_id"])
+                    animated_joints = skeleton.animated_joints if skeleton is not None else []
+                data = await self.run_cpu(slice_motion_blob, data, start_frame, end_frame, stride, joints, animated_joints,
+                                          motion_format, self.motion_database.motion_dtype, self.motion_database.motion_block_frames)
+            self.write(data)
+        else:
+            data = await self.run_db(self.motion_database.get_motion_from_file, input_data["clip_id"])
+            if data is not None and get_motion_blob_format(data) != motion_format:
+                data = await self.run_cpu(convert_motion_blob, data, motion_format, self.motion_database.motion_dtype,
+                                          self.motion_database.motion_block_frames)
+            self.write(data)
 
         delta = time.time()- start
         print("retrieved clip in", delta, "seconds")
 
 
 class GetMotionInfoHandler(BaseDBHandler):
-    @tornado.gen.coroutine
-    def post(self):
+    async def post(self):
         input_str = self.request.body.decode("utf-8")
         print("get motion info",input_str)
         start = time.time()
@@ -68,7 +161,7 @@ class GetMotionInfoHandler(BaseDBHandler):
         if "clip_ids" in input_data:
             clip_ids = input_data["clip_ids"]
         if len(clip_ids) > 0 and len(columns):
-            data = self.motion_database.get_motion_info(columns, clip_ids)
+            data = await self.run_db(self.motion_database.get_motion_info, columns, clip_ids)
             json_str = json.dumps(data)
             self.write(json_str)
         delta = time.time()- start
@@ -76,24 +169,33 @@ class GetMotionInfoHandler(BaseDBHandler):
 
 
 class DownloadBVHHandler(BaseDBHandler):
-    @tornado.gen.coroutine
-    def post(self):
+    async def post(self):
         try:
             input_str = self.request.body.decode("utf-8")
             print(input_str)
 
             input_data = json.loads(input_str)
+            selection = get_frame_selection(input_data)
+            render_cache = self.motion_database.render_cache
+            cache_key = await self.run_db(self.motion_database.get_bvh_cache_key, input_data["clip_id"], selection)
+            data_file = await self.run_db(render_cache.open, cache_key)
+            if data_file is not None:
+                await self.write_data_file(data_file)
+                return
 
-            data, meta_data, skeleton_name = self.motion_database.get_motion_by_id(input_data["clip_id"])
+            data, meta_data, skeleton_name = await self.run_db(self.motion_database.get_motion_by_id, input_data["clip_id"])
           
             # bvh_str = motion_record["BVHString"]
             if data is not None:
-                data = bz2.decompress(data)
-                data = bson.loads(data)
-                motion_vector = MotionVector()
-                motion_vector.from_custom_db_format(data)
-                skeleton = self.motion_database.get_skeleton(skeleton_name)
-                bvh_str = get_bvh_string(skeleton, motion_vector.frames)
+                # the data file name of the skeleton changes when the skeleton is replaced
+                skeleton_key = cache_key[1] if cache_key is not None else None
+                bvh_str = None
+                if skeleton_key is not None:
+                    bvh_str = await self.run_cpu(convert_motion_to_bvh_str_in_worker, skeleton_key, data, selection)
+                if bvh_str is None:
+                    skeleton = self.motion_database.get_skeleton(skeleton_name)
+                    bvh_str = await self.run_cpu(convert_motion_to_bvh_str_in_worker, skeleton_key, data, selection, skeleton)
+                await self.run_db(render_cache.put, cache_key, bvh_str.encode("utf-8"))
                 self.write(bvh_str)
             else:
                 self.write("Not found")
@@ -107,20 +209,17 @@ class DownloadBVHHandler(BaseDBHandler):
 
 
 class DownloadAnnotationHandler(BaseDBHandler):
-    @tornado.gen.coroutine
-    def post(self):
+    async def post(self):
         try:
             input_str = self.request.body.decode("utf-8")
             print("get annotation", input_str)
             input_data = json.loads(input_str)
             m_id = input_data["clip_id"]
-            data, meta_data, skeleton_name = self.motion_database.get_motion_by_id(m_id)
+            data, meta_data, skeleton_name = await self.run_db(self.motion_database.get_motion_by_id, m_id)
 
             if meta_data is not None and meta_data != b"x00" and meta_data != "":
                 try:
-                    meta_data = bz2.decompress(meta_data)
-                    meta_data = bson.loads(meta_data)
-                    annotation_str = json.dumps(meta_data)
+                    annotation_str = await self.run_cpu(convert_annotation_to_json_str, meta_data)
                     self.write(annotation_str)
                 except:
                     print("could not decode annotation", m_id)
@@ -136,13 +235,12 @@ class DownloadAnnotationHandler(BaseDBHandler):
             self.finish()
 
 
-class UploadMotionHandler(MotionDBHandler):
-    @tornado.gen.coroutine
-    def post(self):
+class UploadMotionHandler(StreamUploadHandler, MotionDBHandler):
+    async def post(self):
         try:
-            input_str = self.request.body.decode("utf-8")
-            input_data = json.loads(input_str)
-            if not self.has_access(input_data):
+            input_data, upload_files = self.get_upload_data()
+            has_access = await self.run_db(self.has_access, input_data)
+            if not has_access:
                 print("Error: has no access rights")
                 self.write("Done")
                 return
@@ -166,15 +264,36 @@ class UploadMotionHandler(MotionDBHandler):
                 n_parts = input_data["n_parts"]
                 part_idx = input_data["part_idx"]
             if meta_data is not None:
-                meta_data = bson.dumps(meta_data)
-                meta_data = bz2.compress(meta_data)
-            data = input_data["data"]
-            #data = base64.decodebytes(data.encode('utf-8'))
-            new_id = self.motion_database.upload_motion(part_idx, n_parts, collection,
+                meta_data = await self.run_cpu(compress_bson, meta_data)
+            if "data" in upload_files:
+                blob = await self.run_db(self.read_upload_file, upload_files["data"])
+                new_id = await self.run_db(self.motion_database.insert_motion_blob, blob, collection,
+                                            input_data["skeleton_name"],
+                                            input_data["name"],
+                                            meta_data, is_processed)
+            elif "data" not in input_data:
+                # finalize a resumable upload
+                new_id = None
+                session_id = await self.run_db(self.get_upload_session, input_data)
+                if session_id is not None:
+                    new_id = await self.run_db(self.motion_database.insert_uploaded_motion, session_id, collection,
                                                 input_data["skeleton_name"],
                                                 input_data["name"],
-                                                data,
                                                 meta_data, is_processed)
+                else:
+                    print("Error: unknown upload session")
+            else:
+                data = input_data["data"]
+                # parts of uploads by different users or to different collections do not collide
+                if "upload_id" in input_data:
+                    upload_key = (input_data["token"], input_data["upload_id"])
+                else:
+                    upload_key = (input_data["token"], collection, input_data["skeleton_name"], input_data["name"], n_parts)
+                new_id = await self.run_db(self.motion_database.upload_motion, part_idx, n_parts, collection,
+                                                    input_data["skeleton_name"],
+                                                    input_data["name"],
+                                                    data,
+                                                    meta_data, is_processed, upload_key)
             if new_id is not None:
                 response = {"id":new_id}
                 res_str = json.dumps(response)
@@ -189,26 +308,31 @@ class UploadMotionHandler(MotionDBHandler):
         finally:
             self.finish()
 
-class UploadBVHClipHandler(MotionDBHandler):
-    @tornado.gen.coroutine
-    def post(self):
+class UploadBVHClipHandler(StreamUploadHandler, MotionDBHandler):
+    """ Accepts the BVH text as bvh_data in a JSON body or streamed as raw or multipart body.
+        Streamed files are parsed from the spooled upload without reading the whole text.
+    """
+    async def post(self):
         try:
-            input_str = self.request.body.decode("utf-8")
             print("call upload from bvh")
-            input_data = json.loads(input_str)
-            if not self.has_access(input_data):
+            input_data, upload_files = self.get_upload_data()
+            has_access = await self.run_db(self.has_access, input_data)
+            if not has_access:
                 print("Error: has no access rights")
                 self.write("Done")
                 return
             name = input_data["name"]
-            bvh_data = input_data["bvh_data"]
             skeleton = input_data["skeleton"]
             collection = input_data["collection"]
             print("a", name, skeleton, collection)
-            res_str = self.motion_database.upload_bvh_clip(collection,
+            upload_file = upload_files.get("bvh_data", upload_files.get("data", None))
+            if upload_file is not None:
+                await self.run_db(self.upload_bvh_file, upload_file, collection, skeleton, name)
+            else:
+                await self.run_db(self.motion_database.upload_bvh_clip, collection,
                                                 skeleton,
                                                 name,
-                                                bvh_data)
+                                                input_data["bvh_data"])
      
             self.write("done")
 
@@ -219,16 +343,25 @@ class UploadBVHClipHandler(MotionDBHandler):
         finally:
             self.finish()
 
+    def upload_bvh_file(self, file, collection, skeleton, name):
+        file.seek(0)
+        text_file = io.TextIOWrapper(file, encoding="utf-8")
+        try:
+            return self.motion_database.upload_bvh_file(collection, skeleton, name, text_file)
+        finally:
+            # the upload file is closed in on_finish
+            text_file.detach()
+
 
 class ReplaceMotionHandler(BaseDBHandler):
-    @tornado.gen.coroutine
-    def post(self):
+    async def post(self):
         try:
             input_str = self.request.body.decode("utf-8")
             input_data = json.loads(input_str)
             motion_id = input_data.get("motion_id", None)
             token = input_data.get("token", None)
-            if not self.has_access_to_file(motion_id, token):
+            has_access = await self.run_db(self.has_access_to_file, motion_id, token)
+            if not has_access:
                 print("Error: has no access rights")
                 self.write("Done")
                 return
@@ -241,8 +374,7 @@ class ReplaceMotionHandler(BaseDBHandler):
             if "meta_data" in input_data:
                 try:
                     meta_data = json.loads(input_data["meta_data"])
-                    meta_data = bson.dumps(meta_data)
-                    meta_data = bz2.compress(meta_data)
+                    meta_data = await self.run_cpu(compress_bson, meta_data)
                 except:
                     print("Warning: could not read meta data")
                     meta_data = None
@@ -252,11 +384,11 @@ class ReplaceMotionHandler(BaseDBHandler):
             skeleton_name = None
             if "skeleton_name" in input_data:
                 skeleton_name = input_data["skeleton_name"]
+            motion_data = None
             if "data" in input_data:
-                motion_data = bson.dumps(input_data["data"])
-                motion_data = bz2.compress(motion_data)
+                motion_data = await self.run_db(self.motion_database.encode_motion_data, input_data["data"])
             
-            result_str = self.motion_database.replace_motion(motion_id,
+            result_str = await self.run_db(self.motion_database.replace_motion, motion_id,
                                                                 collection,
                                                                 skeleton_name,
                                                                 name,
@@ -278,17 +410,17 @@ class ReplaceMotionHandler(BaseDBHandler):
 
 
 class DeleteMotionHandler(BaseDBHandler):
-    @tornado.gen.coroutine
-    def post(self):
+    async def post(self):
         try:
             input_str = self.request.body.decode("utf-8")
     
             input_data = json.loads(input_str)
             clip_id = input_data.get("clip_id", None)
             token = input_data.get("token", None)
-            if self.has_access_to_file(clip_id, token):
+            has_access = await self.run_db(self.has_access_to_file, clip_id, token)
+            if has_access:
                 print("delete",clip_id)
-                self.motion_database.delete_file_by_id(clip_id)
+                await self.run_db(self.motion_database.delete_file_by_id, clip_id)
             else:
                 print("Error: has no access rights")
                 self.write("Done")
@@ -305,8 +437,7 @@ class DeleteMotionHandler(BaseDBHandler):
 
 
 class GetMotionListHandler(BaseDBHandler):
-    @tornado.gen.coroutine
-    def post(self):
+    async def post(self):
         try:
             input_str = self.request.body.decode("utf-8")
             print(input_str)
@@ -320,7 +451,9 @@ class GetMotionListHandler(BaseDBHandler):
                 collection_id = input_data["collection_id"]
             if collection_id is not None:
                 is_processed = int(input_data.get("is_processed", 0))
-                motions = self.motion_database.get_motion_list_by_collection(collection_id, skeleton_name, is_processed)
+                limit, after_id, with_count = self.get_page_args(input_data)
+                motions = await self.run_db(self.motion_database.get_motion_list_by_collection, collection_id, skeleton_name, is_processed,
+                                            limit, after_id, with_count)
                     
             motions_str = json.dumps(motions)
             self.write(motions_str)
@@ -336,8 +469,7 @@ class GetMotionListHandler(BaseDBHandler):
 
 
 class GetMotionListByNameHandler(BaseDBHandler):
-    @tornado.gen.coroutine
-    def post(self):
+    async def post(self):
         try:
             input_str = self.request.body.decode("utf-8")
             print("get motion list", input_str)
@@ -347,7 +479,7 @@ class GetMotionListByNameHandler(BaseDBHandler):
                 skeleton = input_data.get("skeleton", None)
                 exact_match = input_data.get("exact_match", False)
                 is_processed = int(input_data.get("is_processed", None))
-                collection = self.motion_database.get_motion_list_by_name(name, skeleton, is_processed, exact_match)
+                collection = await self.run_db(self.motion_database.get_motion_list_by_name, name, skeleton, is_processed, exact_match)
                 collection_str = ""
                 if collection is not None:
                     collection_str = json.dumps(collection)
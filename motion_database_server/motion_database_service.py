@@ -33,7 +33,10 @@ from motion_database_server.files_database_handlers import FILE_DB_HANDLER_LIST
 from motion_database_server.motion_database_handlers import MOTION_DB_HANDLER_LIST
 from motion_database_server.model_database_handlers import MODEL_DB_HANDLER_LIST
 from motion_database_server.collection_database_handlers import COLLECTION_DB_HANDLER_LIST
+from motion_database_server.upload_session_handlers import UPLOAD_SESSION_HANDLER_LIST
 from motion_database_server.service_base import ServiceBase
+from motion_database_server.connection_pool import load_profile_from_config
+from motion_database_server.blob_codecs import load_codec_from_config
 
 
 
@@ -49,14 +52,17 @@ class MotionDatabaseService(ServiceBase):
             self.k8s_namespace = kube_config["namespace"]
         else:
             self.k8s_namespace = ""
-        self.motion_database = MotionFileDatabase(data_dir="data",port=8888)
-        self.motion_database.connect_to_database(self.db_path)
+        load_codec_from_config(kwargs)
+        self.motion_database = MotionFileDatabase(data_dir="data",port=8888, storage_config=kwargs)
+        self.motion_database.connect_to_database(self.db_path, load_profile_from_config(kwargs))
         self.motion_database.load_skeletons()
+        self.motion_database.start_pack_compaction()
         self.request_handler_list = []
         self.request_handler_list += SKELETON_DB_HANDLER_LIST
         self.request_handler_list += COLLECTION_DB_HANDLER_LIST
         self.request_handler_list += FILE_DB_HANDLER_LIST
         self.request_handler_list += MODEL_GRAPH_HANDLER_LIST
+        self.request_handler_list += UPLOAD_SESSION_HANDLER_LIST
 
         # legacy
         self.request_handler_list += CHARACTER_HANDLER_LIST
@@ -21,10 +21,12 @@
 # OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE
 # USE OR OTHER DEALINGS IN THE SOFTWARE.
 import os
-import bson
-import bz2
-import base64
-from motion_database_server.utils import get_bvh_from_str, extract_compressed_bson
+from motion_database_server.utils import compress_bson
+from motion_database_server.bvh_serializer import BVH_FORMAT_VERSION
+from motion_database_server.bvh_parser import load_bvh_reader, load_bvh_reader_from_str
+from motion_database_server.render_cache import load_render_cache_from_config
+from motion_database_server.motion_format import load_motion_data, encode_motion_data, convert_motion_blob, get_n_frames, \
+    load_motion_format_from_config, MOTION_MAGIC, MOTION_FORMAT_BSON, MOTION_FORMAT_COLUMNAR
 from motion_database_server.database_wrapper import DatabaseWrapper
 from motion_database_server.files_database import FilesDatabase
 from motion_database_server.collection_database import CollectionDatabase
@@ -35,7 +37,7 @@ from anim_utils.animation_data.skeleton_builder import SkeletonBuilder
 from anim_utils.animation_data.motion_vector import MotionVector
 from motion_database_server.character_storage import CharacterStorage
 from motion_database_server.file_storage import FileStorage
-from motion_database_server.upload_buffer import UploadBuffer
+from motion_database_server.upload_sessions import load_upload_session_store, get_session_id
 from motion_database_server.schema import DBSchema, TABLES
 from motion_database_server.table import Table
 from motion_database_server.utils import load_json_file
@@ -43,8 +45,7 @@ from motion_db_interface.model_db_session import ModelDBSession
 from motion_db_interface.model_registry import ModelRegistry
 
 
-def load_motion_vector_from_bvh_str(bvh_str):
-    bvh_reader = get_bvh_from_str(bvh_str)
+def load_motion_vector_from_bvh_reader(bvh_reader):
     animated_joints = list(bvh_reader.get_animated_joints())
     motion_vector = MotionVector()
     motion_vector.from_bvh_reader(bvh_reader, False)
@@ -52,9 +53,18 @@ def load_motion_vector_from_bvh_str(bvh_str):
     return motion_vector
 
 
+def load_motion_vector_from_bvh_str(bvh_str):
+    return load_motion_vector_from_bvh_reader(load_bvh_reader_from_str(bvh_str))
+
+
+def load_motion_vector_from_bvh_file(file):
+    """ file is a BVH file opened in text mode """
+    return load_motion_vector_from_bvh_reader(load_bvh_reader(file))
+
+
 class MotionFileDatabase(DatabaseWrapper, CollectionDatabase, FileStorage, FilesDatabase, SkeletonDatabase, ModelGraphDatabase, MGModelDatabase, CharacterStorage):
     
-    def __init__(self, schema=None, data_dir="data",port=8888):
+    def __init__(self, schema=None, data_dir="data",port=8888, storage_config=None):
         if schema is None:
             schema = DBSchema(TABLES)
         self.schema =schema
@@ -62,12 +72,14 @@ class MotionFileDatabase(DatabaseWrapper, CollectionDatabase, FileStorage, Files
         for name in self.schema.tables:
             self.tables[name] = Table(self, name, self.schema.tables[name])
         SkeletonDatabase.__init__(self)
-        FileStorage.__init__(self, data_dir)
+        FileStorage.__init__(self, data_dir, storage_config)
         CharacterStorage.__init__(self, data_dir + os.sep +"characters")
         MGModelDatabase.__init__(self)
         self.model_loader = ModelRegistry.get_instance()
         #ProjectDatabase.__init__(self, schema, server_secret)
-        self.upload_buffer = UploadBuffer()
+        self.upload_sessions = load_upload_session_store(data_dir, storage_config)
+        self.render_cache = load_render_cache_from_config(data_dir, storage_config)
+        self.motion_format, self.motion_dtype, self.motion_block_frames = load_motion_format_from_config(storage_config)
         #create local session for data transforms
         session_file = "session.json"
         if os.path.isfile(session_file):
@@ -79,33 +91,60 @@ class MotionFileDatabase(DatabaseWrapper, CollectionDatabase, FileStorage, Files
         for skel_name, in self.tables["skeletons"].get_record_list(["name"]): 
             self.skeletons[skel_name] = self.load_skeleton(skel_name)
 
-    def upload_motion(self, part_idx, n_parts, collection, skeleton_name, name, base64_data_str, meta_data, processed=0):
+    def upload_motion(self, part_idx, n_parts, collection, skeleton_name, name, base64_data_str, meta_data, processed=0, upload_key=None):
+        """ Adds a part of a base64 encoded motion and inserts the motion once all parts were received.
+            upload_key identifies the upload session, by default the name of the motion is used.
+        """
         print("upload motion", name)
-        self.upload_buffer.update_buffer(name, part_idx, n_parts,base64_data_str)
-        if not self.upload_buffer.is_complete(name):
+        if upload_key is None:
+            upload_key = (name,)
+        session_id = get_session_id(*upload_key)
+        if not self.upload_sessions.add_part(session_id, part_idx, n_parts, base64_data_str):
             return
-        base64_data_str = self.upload_buffer.get_data(name)
-        self.upload_buffer.delete_data(name)
+        return self.insert_uploaded_motion(session_id, collection, skeleton_name, name, meta_data, processed)
 
+    def insert_uploaded_motion(self, session_id, collection, skeleton_name, name, meta_data, processed=0):
+        """ Inserts the motion of a complete upload session """
+        with self.upload_sessions.open_data(session_id) as file:
+            return self.insert_motion_blob(file.read(), collection, skeleton_name, name, meta_data, processed)
+
+    def insert_motion_blob(self, blob, collection, skeleton_name, name, meta_data, processed=0):
+        """ Inserts a motion that was uploaded as compressed bson or in the columnar format
+            and stores it in the configured motion format.
+        """
         #extract n frames
-        data = base64.decodebytes(base64_data_str.encode('utf-8'))
-        data = extract_compressed_bson(data)
-        n_frames = 0
-        if "poses" in data:
-            n_frames = len(data["poses"])
-        data = bson.dumps(data)
-        data = bz2.compress(data)
+        data = load_motion_data(blob)
+        n_frames = get_n_frames(data)
+        data = self.encode_motion_data(data)
         return self.insert_motion(collection, skeleton_name, name, data, meta_data, n_frames, processed)
 
+    def encode_motion_data(self, data):
+        return encode_motion_data(data, self.motion_format, self.motion_dtype, self.motion_block_frames)
+
     def upload_bvh_clip(self, collection, skeleton_name, name, bvh_str):
         motion_vector = load_motion_vector_from_bvh_str(bvh_str)
+        return self.insert_motion_vector(collection, skeleton_name, name, motion_vector)
+
+    def upload_bvh_file(self, collection, skeleton_name, name, file):
+        """ Parses the frames of a BVH file opened in text mode without reading the whole text """
+        motion_vector = load_motion_vector_from_bvh_file(file)
+        return self.insert_motion_vector(collection, skeleton_name, name, motion_vector)
+
+    def insert_motion_vector(self, collection, skeleton_name, name, motion_vector):
         data = motion_vector.to_db_format()
         n_frames = len(data["poses"])
-        data = bson.dumps(data)
-        data = bz2.compress(data)
-        self.insert_motion(collection, skeleton_name, name, data, None, n_frames)
+        data = self.encode_motion_data(data)
+        return self.insert_motion(collection, skeleton_name, name, data, None, n_frames)
             
     def insert_motion(self, collection, skeleton_name, name, motion_data, meta_data, n_frames, processed=0):
+        record_data = self.get_motion_record(collection, skeleton_name, name, motion_data, meta_data, n_frames, processed)
+        return self.create_file(record_data)
+
+    def insert_motions(self, record_list):
+        """ Inserts a list of records created by get_motion_record in a single transaction """
+        return self.create_files(record_list)
+
+    def get_motion_record(self, collection, skeleton_name, name, motion_data, meta_data, n_frames, processed=0):
         record_data = dict()
         record_data["name"] = name
         record_data["collection"] = collection
@@ -117,15 +156,20 @@ class MotionFileDatabase(DatabaseWrapper, CollectionDatabase, FileStorage, Files
         record_data["dataType"] = "motion"
         if processed:
             record_data["dataType"] = "aligned_motion"
-        return self.create_file(record_data)
+        return record_data
 
-    def get_motion_by_id(self, m_id):
+    def get_motion_by_id(self, m_id, motion_format=None):
+        """ Returns the data, meta data and skeleton name of a motion.
+            The data is converted if motion_format is given, otherwise it is returned as stored.
+        """
         r = self.tables[self.files_table].get_record_by_id(m_id, ["data", "metaData", "skeleton"])
         data = None
         meta_data = None
         skeleton_name = ""
         if r is not None:
             data = r[0]
+            if motion_format is not None and data is not None:
+                data = convert_motion_blob(data, motion_format, self.motion_dtype, self.motion_block_frames)
             meta_data = r[1]
             skeleton_name = r[2]
         else:
@@ -149,7 +193,7 @@ class MotionFileDatabase(DatabaseWrapper, CollectionDatabase, FileStorage, Files
             result[r_id] = row
         return result
        
-    def get_motion_list_by_collection(self, collection, skeleton=None, processed=None):
+    def get_motion_list_by_collection(self, collection, skeleton=None, processed=None, limit=None, after_id=None, with_count=False):
         filter_conditions =[("collection",str(collection))]
         if skeleton is not None:
             filter_conditions+=[("skeleton", skeleton)]
@@ -157,6 +201,8 @@ class MotionFileDatabase(DatabaseWrapper, CollectionDatabase, FileStorage, Files
             filter_conditions+=[("dataType", "aligned_motion")]
         else:
             filter_conditions+=[("dataType", "motion")]
+        if limit is not None:
+            return self.tables[self.files_table].get_record_page(["ID","name"], filter_conditions, limit=limit, after_id=after_id, with_count=with_count)
         return self.tables[self.files_table].get_record_list( ["ID","name"], filter_conditions)
 
     def get_motion_list_by_name(self, name, skeleton=None, processed=None, exact_match=False):
@@ -170,23 +216,17 @@ class MotionFileDatabase(DatabaseWrapper, CollectionDatabase, FileStorage, Files
         return self.tables[self.files_table].search_records_by_name(name, ["ID","name"], exact_match, filter_conditions)
 
    
-    def upload_motion(self, part_idx, n_parts, collection, skeleton_name, name, base64_data_str, meta_data, processed=0):
+    def upload_motion(self, part_idx, n_parts, collection, skeleton_name, name, base64_data_str, meta_data, processed=0, upload_key=None):
+        """ Adds a part of a base64 encoded motion and inserts the motion once all parts were received.
+            upload_key identifies the upload session, by default the name of the motion is used.
+        """
         print("upload motion", name)
-        self.upload_buffer.update_buffer(name, part_idx, n_parts,base64_data_str)
-        if not self.upload_buffer.is_complete(name):
+        if upload_key is None:
+            upload_key = (name,)
+        session_id = get_session_id(*upload_key)
+        if not self.upload_sessions.add_part(session_id, part_idx, n_parts, base64_data_str):
             return
-        base64_data_str = self.upload_buffer.get_data(name)
-        self.upload_buffer.delete_data(name)
-
-        #extract n frames
-        data = base64.decodebytes(base64_data_str.encode('utf-8'))
-        data = extract_compressed_bson(data)
-        n_frames = 0
-        if "poses" in data:
-            n_frames = len(data["poses"])
-        data = bson.dumps(data)
-        data = bz2.compress(data)
-        return self.insert_motion(collection, skeleton_name, name, data, meta_data, n_frames, processed)
+        return self.insert_uploaded_motion(session_id, collection, skeleton_name, name, meta_data, processed)
     
     def get_motion_from_file(self, file_id):
         record = self.tables[self.files_table].get_record_by_id(file_id, ["data", "dataType", "skeleton"])
@@ -201,13 +241,59 @@ class MotionFileDatabase(DatabaseWrapper, CollectionDatabase, FileStorage, Files
             return data
         return self.sample_motion_from_model(data, data_type_info["script"], data_type, skeleton_name)
     
+    def get_bvh_cache_key(self, m_id, selection=None):
+        """ Returns the key of the BVH string of a motion in the render cache or None if the motion has no data.
+            The key consists of the data file names of the motion and its skeleton, the version of the
+            BVH formatting and the frame selection.
+        """
+        records = self.query_table(self.files_table, ["data", "skeleton"], [("ID", m_id)])
+        if len(records) < 1 or records[0][0] is None:
+            return None
+        data_name, skeleton_name = records[0]
+        skeleton_records = self.query_table("skeletons", ["data"], [("name", skeleton_name)])
+        if len(skeleton_records) < 1:
+            return None
+        return data_name, skeleton_records[0][0], ("bvh", BVH_FORMAT_VERSION, selection)
+
+    def remove_data_file(self, table_name, name):
+        FileStorage.remove_data_file(self, table_name, name)
+        # BVH strings of removed or replaced motions and skeletons
+        self.render_cache.invalidate(name)
+
+    def get_motion_skeleton(self, file_id):
+        records = self.query_table(self.files_table, ["skeleton"], [("ID", file_id)])
+        if len(records) < 1:
+            return None
+        return self.get_skeleton(records[0][0])
+
+    def open_motion_file(self, file_id, motion_format=None):
+        """ Returns the open data file of a motion or None if the motion is sampled from a model
+            or is not stored in motion_format.
+        """
+        records = self.query_table(self.files_table, ["data", "dataType"], [("ID", file_id)])
+        if len(records) < 1:
+            return None
+        name, data_type = records[0]
+        if self.get_data_loader_info(data_type, "db") is not None:
+            return None
+        data_file = self.open_data_file(self.files_table, name)
+        if data_file is None or motion_format is None:
+            return data_file
+        file = data_file[0]
+        magic = file.read(len(MOTION_MAGIC))
+        file.seek(-len(magic), os.SEEK_CUR)
+        stored_format = MOTION_FORMAT_COLUMNAR if magic == MOTION_MAGIC else MOTION_FORMAT_BSON
+        if stored_format != motion_format:
+            file.close()
+            return None
+        return data_file
+
     def sample_motion_from_model(self, model_data, loader_script, data_type, skeleton_name):
         print("motion_from_model", data_type)
         loader_script = loader_script.replace("\r\n", "\n")
         self.model_loader.load_dynamic_module(data_type, loader_script)
         skeleton = self.get_skeleton(skeleton_name)
         data = self.model_loader.sample_motion_from_model(data_type, model_data, skeleton)
-        data = bson.dumps(data)
-        data = bz2.compress(data)
+        data = compress_bson(data)
         return data
     
\ No newline at end of file
@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+#
+# Copyright 2019 DFKI GmbH.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to permit
+# persons to whom the Software is furnished to do so, subject to the
+# following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN
+# NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE
+# USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+Storage formats of motion clips. The legacy format is a compressed BSON dict
+with the frames as nested lists in "poses". The columnar format stores the
+frames as one contiguous array, so they are decoded with np.frombuffer instead
+of building a Python float for each value:
+
+    magic (4 bytes) | version (1 byte) | codec id (1 byte) | header length (4 bytes, little endian)
+    header: BSON dict with the other fields of the motion and dtype, shape and blocks of each array
+    payload: arrays aligned to 8 bytes
+
+The arrays are split into blocks of frames that are compressed separately,
+so a range of frames can be decoded without decompressing the whole clip.
+The payload of the codec "none" is not copied when it is decoded, so the arrays are read-only
+views of the blob.
+"""
+import struct
+import bson
+import numpy as np
+from motion_database_server.blob_codecs import CODECS, CODEC_NAMES, get_default_codec
+from motion_database_server.utils import extract_compressed_bson, compress_bson
+
+MOTION_FORMAT_BSON = "bson"
+MOTION_FORMAT_COLUMNAR = "columnar"
+MOTION_FORMATS = [MOTION_FORMAT_BSON, MOTION_FORMAT_COLUMNAR]
+DEFAULT_MOTION_FORMAT = MOTION_FORMAT_BSON
+DEFAULT_MOTION_DTYPE = "float64"
+MOTION_DTYPES = ["float32", "float64"]
+DEFAULT_BLOCK_FRAMES = 512
+
+MOTION_MAGIC = b"\x89MDM"
+MOTION_FORMAT_VERSION = 2
+# magic, version, codec id and header length
+PREFIX_FORMAT = "<4sBBI"
+PREFIX_SIZE = struct.calcsize(PREFIX_FORMAT)
+ALIGNMENT = 8
+# fields that are stored as arrays
+ARRAY_FIELDS = ["poses"]
+# the frames start with the root translation followed by a quaternion for each animated joint
+ROOT_CHANNELS = 3
+JOINT_CHANNELS = 4
+
+
+def align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def is_columnar_motion(blob):
+    return blob is not None and blob[:len(MOTION_MAGIC)] == MOTION_MAGIC
+
+
+def get_motion_blob_format(blob):
+    if is_columnar_motion(blob):
+        return MOTION_FORMAT_COLUMNAR
+    return MOTION_FORMAT_BSON
+
+
+def encode_columnar_motion(data, dtype=None, codec=None, block_frames=None):
+    """ Converts a motion dict into the columnar format.
+
+    Args:
+        data (dict): motion in the format of MotionVector.to_db_format
+        dtype (str): float32 or float64
+        codec (str): codec of the blocks, by default the default codec of blob_codecs
+        block_frames (int): number of frames that are compressed together
+
+    Returns:
+        bytes: encoded motion
+    """
+    if dtype is None:
+        dtype = DEFAULT_MOTION_DTYPE
+    if codec is None:
+        codec = get_default_codec()
+    if block_frames is None:
+        block_frames = DEFAULT_BLOCK_FRAMES
+    codec_id, compress, _ = CODECS[codec]
+    fields = dict()
+    arrays = dict()
+    buffers = []
+    offset = 0
+    for key, value in data.items():
+        if key not in ARRAY_FIELDS:
+            fields[key] = value
+            continue
+        array = np.ascontiguousarray(value, dtype=np.dtype(dtype).newbyteorder("<"))
+        padding = align(offset) - offset
+        if padding > 0:
+            buffers.append(b"\x00" * padding)
+        offset += padding
+        blocks = []
+        for start in range(0, max(len(array), 1), block_frames):
+            block = compress(array[start:start+block_frames].tobytes())
+            blocks.append([offset, len(block)])
+            buffers.append(block)
+            offset += len(block)
+        arrays[key] = {"dtype": array.dtype.str, "shape": list(array.shape), "block_frames": block_frames, "blocks": blocks}
+    header = bson.dumps({"fields": fields, "arrays": arrays})
+    header_end = PREFIX_SIZE + len(header)
+    prefix = struct.pack(PREFIX_FORMAT, MOTION_MAGIC, MOTION_FORMAT_VERSION, codec_id, len(header))
+    return prefix + header + b"\x00" * (align(header_end) - header_end) + b"".join(buffers)
+
+
+def read_columnar_header(blob):
+    """ Returns the codec, header dict and payload of a blob in the columnar format """
+    magic, version, codec_id, header_length = struct.unpack_from(PREFIX_FORMAT, blob)
+    if magic != MOTION_MAGIC:
+        raise ValueError("Blob is not a columnar motion")
+    if version != MOTION_FORMAT_VERSION:
+        raise ValueError("Unsupported motion format version %d" % version)
+    codec = CODEC_NAMES.get(codec_id, None)
+    if codec is None:
+        raise ValueError("Motion was written with a codec that is not available")
+    header_end = PREFIX_SIZE + header_length
+    header = bson.loads(bytes(blob[PREFIX_SIZE:header_end]))
+    payload = memoryview(blob)[align(header_end):]
+    return codec, header, payload
+
+
+def decode_array_rows(desc, codec, payload, start, end):
+    """ Decodes rows start to end of an array that was stored in blocks """
+    dtype = np.dtype(desc["dtype"])
+    shape = tuple(desc["shape"])
+    row_shape = shape[1:]
+    row_size = int(np.prod(row_shape)) * dtype.itemsize
+    block_frames = desc["block_frames"]
+    blocks = desc["blocks"]
+    if end <= start:
+        return np.empty((0,) + row_shape, dtype=dtype)
+    first_block = start // block_frames
+    last_block = (end - 1) // block_frames
+    if codec == "none":
+        # uncompressed blocks are contiguous
+        offset = blocks[first_block][0] + (start - first_block * block_frames) * row_size
+        count = (end - start) * row_size // dtype.itemsize
+        return np.frombuffer(payload, dtype=dtype, count=count, offset=offset).reshape((end - start,) + row_shape)
+    _, _, decompress = CODECS[codec]
+    buffers = [decompress(payload[o:o+n]) for o, n in blocks[first_block:last_block+1]]
+    data = buffers[0] if len(buffers) == 1 else b"".join(buffers)
+    rows = np.frombuffer(data, dtype=dtype).reshape((-1,) + row_shape)
+    block_start = first_block * block_frames
+    return rows[start - block_start:end - block_start]
+
+
+def decode_columnar_motion(blob, start_frame=None, end_frame=None):
+    """ Returns the motion dict of a blob in the columnar format with numpy arrays as values of ARRAY_FIELDS.
+        If a frame range is given, only the blocks of the range are decompressed.
+    """
+    codec, header, payload = read_columnar_header(blob)
+    data = header["fields"]
+    for key, desc in header["arrays"].items():
+        start, end, _ = slice(start_frame, end_frame).indices(desc["shape"][0])
+        end = max(start, end)
+        data[key] = decode_array_rows(desc, codec, payload, start, end)
+    return data
+
+
+def load_motion_data(blob):
+    """ Decodes a motion blob in the columnar or the legacy BSON format """
+    if is_columnar_motion(blob):
+        return decode_columnar_motion(blob)
+    return extract_compressed_bson(blob)
+
+
+def get_joint_channels(animated_joints, joints, n_channels):
+    """ Returns the indices of the channels of joints in frames of the animated joints.
+        The root translation is included if the root is one of the joints.
+    """
+    if n_channels != ROOT_CHANNELS + JOINT_CHANNELS * len(animated_joints):
+        raise ValueError("Frames do not match the animated joints of the skeleton")
+    channels = []
+    for joint in joints:
+        if joint not in animated_joints:
+            raise ValueError("Unknown joint %s" % joint)
+        idx = animated_joints.index(joint)
+        if idx == 0:
+            channels += list(range(ROOT_CHANNELS))
+        offset = ROOT_CHANNELS + JOINT_CHANNELS * idx
+        channels += list(range(offset, offset + JOINT_CHANNELS))
+    return channels
+
+
+def load_motion_frames(blob, start_frame=None, end_frame=None, stride=1, joints=None, animated_joints=None):
+    """ Decodes a part of a motion in either format.
+        Motions in the columnar format only decompress the blocks of the frame range.
+
+    Args:
+        blob (bytes): motion in the columnar or the legacy BSON format
+        start_frame (int): first frame
+        end_frame (int): frame after the last frame
+        stride (int): step between returned frames
+        joints (list): names of the joints whose channels are returned, by default all channels
+        animated_joints (list): names of the joints in the frames, required if joints is given
+
+    Returns:
+        dict: motion dict with the selected frames as numpy array in "poses"
+    """
+    if stride < 1:
+        raise ValueError("stride has to be at least 1")
+    if is_columnar_motion(blob):
+        data = decode_columnar_motion(blob, start_frame, end_frame)
+    else:
+        data = extract_compressed_bson(blob)
+        for key in ARRAY_FIELDS:
+            if key in data:
+                data[key] = np.asarray(data[key])[start_frame:end_frame]
+    for key in ARRAY_FIELDS:
+        if key not in data:
+            continue
+        data[key] = data[key][::stride]
+        if joints is not None:
+            # motions without frames are stored as empty list without channels
+            if data[key].ndim > 1:
+                channels = get_joint_channels(animated_joints, joints, data[key].shape[-1])
+                data[key] = data[key][:, channels]
+            data["joints"] = list(joints)
+    if "n_frames" in data and "poses" in data:
+        data["n_frames"] = len(data["poses"])
+    if "frame_time" in data and stride > 1:
+        data["frame_time"] = data["frame_time"] * stride
+    return data
+
+
+def slice_motion_blob(blob, start_frame=None, end_frame=None, stride=1, joints=None, animated_joints=None,
+                      motion_format=None, dtype=None, block_frames=None):
+    """ Returns the selected frames and joints of a motion blob encoded in motion_format """
+    data = load_motion_frames(blob, start_frame, end_frame, stride, joints, animated_joints)
+    return encode_motion_data(data, motion_format, dtype, block_frames)
+
+
+def encode_motion_data(data, motion_format=None, dtype=None, block_frames=None):
+    """ Encodes a motion dict in the columnar or the legacy BSON format """
+    if motion_format is None:
+        motion_format = DEFAULT_MOTION_FORMAT
+    if motion_format == MOTION_FORMAT_COLUMNAR:
+        return encode_columnar_motion(data, dtype, block_frames=block_frames)
+    data = dict(data)
+    for key in ARRAY_FIELDS:
+        if isinstance(data.get(key, None), np.ndarray):
+            data[key] = data[key].tolist()
+    return compress_bson(data)
+
+
+def convert_motion_blob(blob, motion_format, dtype=None, block_frames=None):
+    """ Converts a motion blob into the format or returns it unchanged if it already has the format """
+    if get_motion_blob_format(blob) == motion_format:
+        return blob
+    return encode_motion_data(load_motion_data(blob), motion_format, dtype, block_frames)
+
+
+def get_n_frames(data):
+    if "poses" in data:
+        return len(data["poses"])
+    return 0
+
+
+def load_motion_format_from_config(config=None):
+    """ Returns the format, dtype and frames per block of new motions """
+    if config is None:
+        config = dict()
+    motion_format = config.get("motion_format", DEFAULT_MOTION_FORMAT)
+    if motion_format not in MOTION_FORMATS:
+        print("Warning: unknown motion format", motion_format, "use", DEFAULT_MOTION_FORMAT)
+        motion_format = DEFAULT_MOTION_FORMAT
+    dtype = config.get("motion_dtype", DEFAULT_MOTION_DTYPE)
+    if dtype not in MOTION_DTYPES:
+        print("Warning: unknown motion dtype", dtype, "use", DEFAULT_MOTION_DTYPE)
+        dtype = DEFAULT_MOTION_DTYPE
+    block_frames = max(int(config.get("motion_block_frames", DEFAULT_BLOCK_FRAMES)), 1)
+    return motion_format, dtype, block_frames
@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+#
+# Copyright 2019 DFKI GmbH.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to permit
+# persons to whom the Software is furnished to do so, subject to the
+# following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN
+# NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE
+# USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+Append-only storage of data files in large segment files. Small blobs do not
+need a file each, which saves inodes and directory lookups. The position of
+each blob is kept in the pack_index table, so writes and removals are part of
+the database transaction. Removed blobs stay in their segment until the
+segment is compacted.
+"""
+import os
+import time
+import zlib
+import threading
+from motion_database_server.schema import PACK_INDEX_TABLE
+
+PACK_DIR = "packs"
+PACK_SUFFIX = ".pack"
+DEFAULT_SEGMENT_SIZE = 256 * 1024 * 1024
+# segments with a larger share of removed blobs are compacted
+DEFAULT_COMPACTION_RATIO = 0.5
+# index entries of copied blobs that are updated in one transaction
+COMPACTION_BATCH_SIZE = 256
+
+
+class PackStorage:
+    """ Appends blobs to the active segment in data_dir/packs/ and reads them with pread.
+        A new segment is started once the active segment exceeds segment_size.
+        Each blob is stored with a crc32 checksum that is verified on reads.
+
+    Args:
+        data_dir (str): data directory of the FileStorage
+        db (DatabaseWrapper): database with the pack_index table
+        segment_size (int): size in bytes after which a new segment is started
+    """
+    def __init__(self, data_dir, db, segment_size=DEFAULT_SEGMENT_SIZE):
+        self.directory = data_dir + os.sep + PACK_DIR
+        os.makedirs(self.directory, exist_ok=True)
+        self.db = db
+        self.segment_size = segment_size
+        self.lock = threading.Lock()
+        self.readers = dict()
+        self.writer = None
+        self.active_segment = max(self.get_segment_ids(), default=0)
+        self.compaction_thread = None
+
+    def get_segment_ids(self):
+        segment_ids = []
+        for name in os.listdir(self.directory):
+            if name.endswith(PACK_SUFFIX) and name[:-len(PACK_SUFFIX)].isdigit():
+                segment_ids.append(int(name[:-len(PACK_SUFFIX)]))
+        return segment_ids
+
+    def get_segment_path(self, segment_id):
+        return self.directory + os.sep + "%08d" % segment_id + PACK_SUFFIX
+
+    def get_writer(self):
+        """ Returns the file of the active segment and starts a new segment if it is full """
+        if self.writer is not None and self.writer.tell() >= self.segment_size:
+            self.writer.close()
+            self.writer = None
+            self.active_segment += 1
+        if self.writer is None:
+            if self.active_segment == 0:
+                self.active_segment = 1
+            self.writer = open(self.get_segment_path(self.active_segment), "ab")
+        return self.writer
+
+    def append(self, data):
+        """ Returns segment, offset and checksum of the data """
+        with self.lock:
+            writer = self.get_writer()
+            offset = writer.tell()
+            writer.write(data)
+            writer.flush()
+            return self.active_segment, offset, zlib.crc32(data)
+
+    def get_reader(self, segment_id):
+        with self.lock:
+            reader = self.readers.get(segment_id, None)
+            if reader is None:
+                reader = open(self.get_segment_path(segment_id), "rb")
+                self.readers[segment_id] = reader
+            return reader
+
+    def close_reader(self, segment_id):
+        with self.lock:
+            reader = self.readers.pop(segment_id, None)
+        if reader is not None:
+            reader.close()
+
+    def read_blob(self, segment_id, offset, length, checksum):
+        """ Returns the data or None if the segment was removed or the data does not match the checksum """
+        try:
+            reader = self.get_reader(segment_id)
+            data = os.pread(reader.fileno(), length, offset)
+        except (OSError, ValueError):
+            # the segment was removed or its reader was closed by a compaction
+            return None
+        if len(data) != length or zlib.crc32(data) != checksum:
+            return None
+        return data
+
+    def save(self, table_name, name, data):
+        segment_id, offset, checksum = self.append(data)
+        query_str = "INSERT OR REPLACE INTO " + PACK_INDEX_TABLE + " (tableName, name, segment, offset, length, checksum) VALUES (?, ?, ?, ?, ?, ?);"
+        self.db.execute_write(query_str, (table_name, name, segment_id, offset, len(data), checksum))
+
+    def get_location(self, table_name, name):
+        query_str = "SELECT segment, offset, length, checksum FROM " + PACK_INDEX_TABLE + " WHERE tableName = ? AND name = ?;"
+        records = self.db.fetch_records(query_str, (table_name, name))
+        if len(records) < 1:
+            return None
+        return records[0]
+
+    def contains(self, table_name, name):
+        return self.get_location(table_name, name) is not None
+
+    def load(self, table_name, name):
+        """ Returns the data or None if the blob is not in the index """
+        location = self.get_location(table_name, name)
+        while location is not None:
+            data = self.read_blob(*location)
+            if data is not None:
+                return data
+            # the blob may have been moved by a compaction after the lookup
+            new_location = self.get_location(table_name, name)
+            if new_location == location:
+                print("Error: could not read", table_name, name, "in segment", location[0])
+                return None
+            location = new_location
+        return None
+
+    def remove(self, table_name, name):
+        """ Removes the blob from the index. The space is reclaimed by compact. """
+        query_str = "DELETE FROM " + PACK_INDEX_TABLE + " WHERE tableName = ? AND name = ?;"
+        self.db.execute_write(query_str, (table_name, name))
+
+    def get_garbage_ratios(self):
+        """ Returns the share of unreferenced bytes of each segment except the active segment """
+        query_str = "SELECT segment, SUM(length) FROM " + PACK_INDEX_TABLE + " GROUP BY segment;"
+        live_bytes = dict(self.db.fetch_records(query_str))
+        ratios = dict()
+        for segment_id in self.get_segment_ids():
+            if segment_id == self.active_segment:
+                continue
+            size = os.path.getsize(self.get_segment_path(segment_id))
+            if size > 0:
+                ratios[segment_id] = 1.0 - live_bytes.get(segment_id, 0) / size
+            else:
+                ratios[segment_id] = 1.0
+        return ratios
+
+    def compact_segment(self, segment_id):
+        """ Copies the blobs that are still referenced into the active segment and removes the segment.
+            The blobs are copied without holding the writer lock. The index is updated in batches and only
+            for blobs that are still at their old location, so blobs that were removed or replaced during
+            the copy keep their new entry.
+        """
+        query_str = "SELECT tableName, name, offset, length, checksum FROM " + PACK_INDEX_TABLE + " WHERE segment = ?;"
+        update_str = "UPDATE " + PACK_INDEX_TABLE + " SET segment = ?, offset = ? WHERE tableName = ? AND name = ? AND segment = ? AND offset = ?;"
+        records = self.db.fetch_records(query_str, (segment_id,))
+        moved = []
+        n_copied = 0
+        for table_name, name, offset, length, checksum in records:
+            data = self.read_blob(segment_id, offset, length, checksum)
+            if data is None:
+                # corrupt blobs are not copied, so the segment is kept
+                print("Error: checksum mismatch of", table_name, name, "in segment", segment_id)
+                continue
+            new_segment_id, new_offset, _ = self.append(data)
+            moved.append((new_segment_id, new_offset, table_name, name, segment_id, offset))
+            if len(moved) >= COMPACTION_BATCH_SIZE:
+                self.db.execute_write(update_str, moved, many=True)
+                n_copied += len(moved)
+                moved = []
+        if len(moved) > 0:
+            self.db.execute_write(update_str, moved, many=True)
+            n_copied += len(moved)
+        count_str = "SELECT COUNT(*) FROM " + PACK_INDEX_TABLE + " WHERE segment = ?;"
+        with self.db.transaction() as unit_of_work:
+            n_remaining = self.db.fetch_records(count_str, (segment_id,))[0][0]
+            if n_remaining == 0:
+                unit_of_work.add_deleted_file(self.get_segment_path(segment_id))
+                unit_of_work.add_commit_callback(lambda: self.close_reader(segment_id))
+        if n_remaining > 0:
+            print("Warning: kept segment", segment_id, "with", n_remaining, "blobs")
+        print("compacted segment", segment_id, "copied", n_copied, "blobs")
+
+    def compact(self, min_ratio=DEFAULT_COMPACTION_RATIO):
+        """ Compacts all segments that contain at least min_ratio removed bytes """
+        for segment_id, ratio in self.get_garbage_ratios().items():
+            if ratio >= min_ratio:
+                self.compact_segment(segment_id)
+
+    def start_compaction_thread(self, interval, min_ratio=DEFAULT_COMPACTION_RATIO):
+        """ Runs compact every interval seconds in a daemon thread """
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.compact(min_ratio)
+                except Exception as e:
+                    print("Error: compaction failed", e)
+        self.compaction_thread = threading.Thread(target=run, daemon=True)
+        self.compaction_thread.start()
+
+    def close(self):
+        with self.lock:
+            if self.writer is not None:
+                self.writer.close()
+                self.writer = None
+            readers = list(self.readers.values())
+            self.readers = dict()
+        for reader in readers:
+            reader.close()
@@ -22,6 +22,7 @@
 # USE OR OTHER DEALINGS IN THE SOFTWARE.
 from motion_database_server.user_database import UserDatabase
 from motion_database_server.collection_database import CollectionDatabase
+from motion_database_server.query_builder import build_join_str
 
 JWT_ALGORITHM = 'HS256'
 
@@ -52,14 +53,15 @@ class ProjectDatabase(UserDatabase, CollectionDatabase):
     def create_project(self, name, owner, public):
         collection_type = "root"
         parent_id = 0
-        new_id = self.add_new_collection_by_id(name, collection_type, parent_id, owner, public)
-        data = dict()
-        data["name"] = name
-        data["owner"] = owner
-        data["public"] = public
-        data["collection"] = new_id
-        new_id = self.tables[self.projects_table].create_record(data)
-        self.add_project_membership(owner, new_id)
+        with self.transaction():
+            new_id = self.add_new_collection_by_id(name, collection_type, parent_id, owner, public)
+            data = dict()
+            data["name"] = name
+            data["owner"] = owner
+            data["public"] = public
+            data["collection"] = new_id
+            new_id = self.tables[self.projects_table].create_record(data)
+            self.add_project_membership(owner, new_id)
 
     def add_project_membership(self, user_id, project_id):
         data = dict()
@@ -68,8 +70,9 @@ class ProjectDatabase(UserDatabase, CollectionDatabase):
         self.tables[self.project_members_table].create_record(data)
 
     def remove_project(self, project_id):
-        self.tables[self.projects_table].delete_record_by_id(project_id)
-        self.tables[self.project_members_table].delete_record_by_id(project_id)
+        with self.transaction():
+            self.tables[self.projects_table].delete_record_by_id(project_id)
+            self.tables[self.project_members_table].delete_record_by_id(project_id)
 
     def edit_project(self, project_id, name, public, new_user_list):
         data = dict()
@@ -77,16 +80,17 @@ class ProjectDatabase(UserDatabase, CollectionDatabase):
             data["name"] = name
         if public is not None:
             data["public"] = public
-        self.tables[self.projects_table].update_record(project_id, data)
-        existing_user_list = self.get_project_member_list(project_id)
-        new_user_list = [user[0] for user in new_user_list]
-        existing_user_list = [user[0] for user in existing_user_list]
-        added_users = [user for user in new_user_list if user not in existing_user_list]
-        removed_users = [user for user in existing_user_list if user not in new_user_list]
-        for user_id in added_users:
-            self.add_project_membership(user_id, project_id)
-        for user_id in removed_users:
-            self.remove_user_from_project(user_id, project_id)
+        with self.transaction():
+            self.tables[self.projects_table].update_record(project_id, data)
+            existing_user_list = self.get_project_member_list(project_id)
+            new_user_list = [user[0] for user in new_user_list]
+            existing_user_list = [user[0] for user in existing_user_list]
+            added_users = [user for user in new_user_list if user not in existing_user_list]
+            removed_users = [user for user in existing_user_list if user not in new_user_list]
+            for user_id in added_users:
+                self.add_project_membership(user_id, project_id)
+            for user_id in removed_users:
+                self.remove_user_from_project(user_id, project_id)
 
     def get_project_id(self, project_name, owner_id=None):
         filter_conditions = [("name",project_name)]
@@ -127,7 +131,7 @@ class ProjectDatabase(UserDatabase, CollectionDatabase):
             # select cols where id in select id where user is user_id
             intersection_list += [("public", True) ]
             intersection_list += [(self.project_members_table+".user", user_id) ]
-            join_statement = " LEFT JOIN "+self.project_members_table+" ON  projects.ID = "+self.project_members_table+".project"
+            join_statement = build_join_str(self.project_members_table, "projects.ID", self.project_members_table+".project")
 
         #query_str = "select distinct p.ID, p.name from projects p left join project_members m ON  p.ID = m.project where m.user == %s or p.public == True;".format(user_id)
         
@@ -165,8 +169,9 @@ class ProjectDatabase(UserDatabase, CollectionDatabase):
         return success
         
     def remove_user(self, user_id):
-        self.delete_entry_by_id(self.user_table, user_id)
-        self.delete_entry_by_id(self.project_members_table, user_id)
+        with self.transaction():
+            self.delete_entry_by_id(self.user_table, user_id)
+            self.delete_entry_by_id(self.project_members_table, user_id)
 
     def get_user_info(self, user_id):
         data = super().get_user_info(user_id)
@@ -26,6 +26,7 @@ from motion_database_server.user_database_handlers import USER_DB_HANDLER_LIST
 from motion_database_server.project_database_handlers import PROJECT_DB_HANDLER_LIST
 from motion_database_server.service_base import ServiceBase
 from motion_database_server.schema import DBSchema, TABLES
+from motion_database_server.connection_pool import load_profile_from_config
 
 
 class ProjectDatabaseService(ServiceBase):
@@ -38,6 +39,6 @@ class ProjectDatabaseService(ServiceBase):
         self.activate_user_authentification = kwargs.get("activate_user_authentification", True)
         schema = DBSchema(TABLES)
         self.project_database = ProjectDatabase(schema, server_secret=server_secret)
-        self.project_database.connect(self.db_path)
+        self.project_database.connect(self.db_path, load_profile_from_config(kwargs))
         self.request_handler_list = USER_DB_HANDLER_LIST + PROJECT_DB_HANDLER_LIST
 
@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+#
+# Copyright 2019 DFKI GmbH.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to permit
+# persons to whom the Software is furnished to do so, subject to the
+# following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN
+# NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE
+# USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+Builds parameterized SQL statements from the filter tuples used by the Table class.
+A condition is a tuple (column, value) or (column, value, exact_match).
+The tuple (column, value, operator) is used for the operators in
+VALUE_OPERATORS, e.g. COND_GREATER for keyset pagination and COND_MATCH
+for full text search.
+Values are never part of the statement text, so statements only depend on the
+shape of the query and are kept in an LRU cache. sqlite3 caches the compiled
+statement for each statement text, so the query plan is reused across requests.
+"""
+import re
+from functools import lru_cache
+
+STATEMENT_CACHE_SIZE = 256
+
+COND_EQUALS = "="
+COND_LIKE = "LIKE"
+COND_IN = "IN"
+COND_GREATER = ">"
+COND_MATCH = "MATCH"
+VALUE_OPERATORS = [COND_GREATER, COND_MATCH]
+
+
+def get_in_list_length(n_values):
+    """ IN lists are padded to the next power of two to limit the number of statement shapes """
+    length = 1
+    while length < n_values:
+        length *= 2
+    return length
+
+
+def get_condition_shape(c):
+    if len(c) > 2 and c[2] in VALUE_OPERATORS:
+        return (c[0], c[2], 1)
+    elif type(c[1]) == str and len(c) > 2 and not c[2]: # allow partial match
+        return (c[0], COND_LIKE, 1)
+    elif type(c[1]) in [list, tuple]:
+        if len(c[1]) == 0:
+            return (c[0], COND_IN, 0)
+        return (c[0], COND_IN, get_in_list_length(len(c[1])))
+    else:
+        return (c[0], COND_EQUALS, 1)
+
+
+def get_condition_values(c):
+    if len(c) > 2 and c[2] in VALUE_OPERATORS:
+        return [c[1]]
+    elif type(c[1]) == str and len(c) > 2 and not c[2]:
+        return ["%" + c[1] + "%"]
+    elif type(c[1]) in [list, tuple]:
+        values = list(c[1])
+        if len(values) > 0:
+            # repeat the last value to fill the padded list
+            values += [values[-1]] * (get_in_list_length(len(values)) - len(values))
+        return values
+    else:
+        return [c[1]]
+
+
+def get_conditions_shape(conditions):
+    if conditions is None:
+        return tuple()
+    return tuple(get_condition_shape(c) for c in conditions)
+
+
+def get_conditions_values(filter_list=None, intersection_list=None):
+    values = []
+    for conditions in [filter_list, intersection_list]:
+        if conditions is None:
+            continue
+        for c in conditions:
+            values += get_condition_values(c)
+    return values
+
+
+def get_condition_str(shape):
+    col, op, n = shape
+    if op == COND_IN:
+        return col + " IN (" + ", ".join(["?"] * n) + ")"
+    return col + " " + op + " ?"
+
+
+@lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def build_where_str(filter_shape, intersection_shape):
+    query_str = ""
+    has_filter_list = len(filter_shape) > 0
+    has_intersection_list = len(intersection_shape) > 0
+    if has_filter_list or has_intersection_list:
+        query_str += " WHERE "
+    if has_filter_list:
+        query_str += " AND ".join([get_condition_str(s) for s in filter_shape])
+    if has_intersection_list:
+        if has_filter_list:
+            query_str += " AND ("
+        query_str += " OR ".join([get_condition_str(s) for s in intersection_shape])
+        if has_filter_list:
+            query_str += ")"
+    return query_str
+
+
+@lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def build_select_statement(table_name, columns, filter_shape=tuple(), intersection_shape=tuple(), join_statement=None, distinct=False, group=None, order=None, limit=False):
+    query_str = "SELECT "
+    if distinct:
+        query_str += "DISTINCT "
+    if group is not None:
+        query_str += "Max(Timestamp), "
+    query_str += ", ".join(columns)
+    query_str += " FROM " + table_name
+    if join_statement is not None:
+        query_str += " " + join_statement
+    query_str += build_where_str(filter_shape, intersection_shape)
+    if group is not None:
+        query_str += " GROUP BY " + ", ".join(group)
+    if order is not None:
+        query_str += " ORDER BY " + ", ".join(order)
+    if limit:
+        query_str += " LIMIT ?"
+    query_str += ";"
+    return query_str
+
+
+def build_count_statement(query_str):
+    """ counts the rows returned by a select statement """
+    return "SELECT COUNT(*) FROM (" + query_str.rstrip(";") + ");"
+
+
+@lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def build_update_statement(table_name, columns, filter_shape):
+    query_str = "UPDATE " + table_name + " SET "
+    query_str += ", ".join([c + " = ?" for c in columns])
+    query_str += build_where_str(filter_shape, tuple())
+    query_str += ";"
+    return query_str
+
+
+@lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def build_insert_statement(table_name, columns):
+    query_str = "INSERT INTO " + table_name + " (" + ", ".join(columns) + ")"
+    query_str += " VALUES (" + ", ".join(["?"] * len(columns)) + ");"
+    return query_str
+
+
+@lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def build_delete_statement(table_name, filter_shape, intersection_shape=tuple()):
+    query_str = "DELETE FROM " + table_name
+    query_str += build_where_str(filter_shape, intersection_shape)
+    query_str += ";"
+    return query_str
+
+
+def get_fts_query(text, prefix=True, columns=None):
+    """ Converts user input into an FTS5 query that matches rows containing all tokens.
+        Tokens are quoted, so FTS5 operators in the input are treated as text.
+
+    Args:
+        text (str): search text
+        prefix (bool): match tokens that start with the search tokens
+        columns (list): restrict the search to these columns of the index
+
+    Returns:
+        str: FTS5 query or None if the text contains no tokens
+    """
+    tokens = re.findall(r"[^\W_]+", text)
+    if len(tokens) < 1:
+        return None
+    suffix = "*" if prefix else ""
+    query = " ".join(['"' + t + '"' + suffix for t in tokens])
+    if columns is not None:
+        query = "{" + " ".join(columns) + "} : (" + query + ")"
+    return query
+
+
+def build_join_str(join_table, left_col, right_col, join_type="LEFT"):
+    """ join conditions only compare columns, so they do not need parameters """
+    return join_type + " JOIN " + join_table + " ON " + left_col + " = " + right_col
+
+
+def get_statement_cache_info():
+    return {"select": build_select_statement.cache_info(),
+            "update": build_update_statement.cache_info(),
+            "insert": build_insert_statement.cache_info(),
+            "delete": build_delete_statement.cache_info()}
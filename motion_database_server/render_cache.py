@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+#
+# Copyright 2019 DFKI GmbH.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to permit
+# persons to whom the Software is furnished to do so, subject to the
+# following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN
+# NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE
+# USE OR OTHER DEALINGS IN THE SOFTWARE.
+import os
+import tempfile
+import threading
+from hashlib import sha1
+from collections import OrderedDict
+
+KEY_PART_LENGTH = 20
+TMP_SUFFIX = ".tmp"
+
+
+def get_key_part_name(part):
+    return sha1(repr(part).encode("utf-8")).hexdigest()[:KEY_PART_LENGTH]
+
+
+class RenderCache:
+    """ Keeps derived artifacts like BVH strings of motions as files in a directory up to a budget of bytes.
+        Entries are identified by the names of their source data files and the output options, so an entry
+        of a replaced source is never returned. The least recently used entries are removed first and the
+        modification time of the files keeps this order across restarts.
+
+    Args:
+        directory (str): directory of the files
+        max_size (int): budget in bytes, 0 disables the cache
+        suffix (str): file extension of the entries
+    """
+    def __init__(self, directory, max_size=0, suffix=".bvh"):
+        self.directory = directory
+        self.max_size = max_size
+        self.suffix = suffix
+        self.size = 0
+        # filename -> size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if self.max_size > 0:
+            os.makedirs(self.directory, exist_ok=True)
+            self.load_entries()
+
+    def load_entries(self):
+        files = []
+        for filename in os.listdir(self.directory):
+            path = self.directory + os.sep + filename
+            if filename.endswith(TMP_SUFFIX):
+                # left over by an interrupted write
+                os.remove(path)
+            elif filename.endswith(self.suffix):
+                stat = os.stat(path)
+                files.append((stat.st_mtime, filename, stat.st_size))
+        for _, filename, size in sorted(files):
+            self.entries[filename] = size
+            self.size += size
+        self.evict()
+
+    def get_filename(self, key):
+        """ key is a tuple of the source names followed by the output options """
+        return "_".join(get_key_part_name(part) for part in key) + self.suffix
+
+    def open(self, key):
+        """ Returns the open file, its size and an entity tag or None if the key is not cached """
+        if self.max_size <= 0 or key is None:
+            return None
+        filename = self.get_filename(key)
+        path = self.directory + os.sep + filename
+        with self.lock:
+            if filename not in self.entries:
+                self.misses += 1
+                return None
+            try:
+                file = open(path, "rb")
+                os.utime(path)
+            except FileNotFoundError:
+                self.size -= self.entries.pop(filename)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(filename)
+            self.hits += 1
+            size = self.entries[filename]
+        return file, size, filename[:-len(self.suffix)]
+
+    def get(self, key):
+        """ Returns the data or None if the key is not cached """
+        data_file = self.open(key)
+        if data_file is None:
+            return None
+        with data_file[0] as file:
+            return file.read()
+
+    def put(self, key, data):
+        if self.max_size <= 0 or key is None or data is None or len(data) > self.max_size:
+            return
+        filename = self.get_filename(key)
+        fd, tmp_path = tempfile.mkstemp(suffix=TMP_SUFFIX, dir=self.directory)
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+        with self.lock:
+            os.replace(tmp_path, self.directory + os.sep + filename)
+            if filename in self.entries:
+                self.size -= self.entries.pop(filename)
+            self.entries[filename] = len(data)
+            self.size += len(data)
+            self.evict()
+
+    def evict(self):
+        while self.size > self.max_size:
+            filename, size = self.entries.popitem(last=False)
+            self.size -= size
+            self.evictions += 1
+            self.remove_file(filename)
+
+    def remove_file(self, filename):
+        try:
+            os.remove(self.directory + os.sep + filename)
+        except FileNotFoundError:
+            pass
+
+    def invalidate(self, source_name):
+        """ Removes the entries that were derived from a source data file """
+        if self.max_size <= 0 or source_name is None:
+            return
+        part_name = get_key_part_name(source_name)
+        with self.lock:
+            for filename in list(self.entries.keys()):
+                if part_name in filename[:-len(self.suffix)].split("_"):
+                    self.size -= self.entries.pop(filename)
+                    self.remove_file(filename)
+
+    def clear(self):
+        with self.lock:
+            for filename in self.entries:
+                self.remove_file(filename)
+            self.entries = OrderedDict()
+            self.size = 0
+
+    def get_stats(self):
+        with self.lock:
+            return {"max_size": self.max_size, "size": self.size, "entries": len(self.entries),
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+def load_render_cache_from_config(data_dir, config=None):
+    if config is None:
+        config = dict()
+    directory = config.get("bvh_cache_dir", data_dir + os.sep + "bvh_cache")
+    return RenderCache(directory, config.get("bvh_cache_size", 0))
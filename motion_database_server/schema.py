@@ -116,15 +116,161 @@ TABLES["data_type_taggings"] = [
             ("tag",INT_T)]
 import sqlite3
 
+# secondary indices for columns that are used in lookups and filters
+INDICES = dict()
+INDICES["files"] = [("collection", "dataType", "skeleton"),
+                    ("skeleton",),
+                    ("dataType",),
+                    ("name",)]
+INDICES["collections"] = [("parent",),
+                    ("name",)]
+INDICES["skeletons"] = [("name",)]
+INDICES["users"] = [("name",),
+                    ("email",)]
+INDICES["projects"] = [("collection",),
+                    ("name",)]
+INDICES["project_members"] = [("project", "user"),
+                    ("user",)]
+INDICES["data_types"] = [("name",)]
+INDICES["data_loaders"] = [("dataType", "engine")]
+INDICES["data_type_taggings"] = [("dataType",),
+                    ("tag",)]
+INDICES["data_transform_inputs"] = [("dataTransform",)]
+INDICES["experiments"] = [("collection",),
+                    ("name",)]
+INDICES["experiment_inputs"] = [("experiment",)]
+INDICES["model_graphs"] = [("project", "skeleton")]
+
+# closure table of the collection hierarchy with a row for each pair of
+# ancestor and descendant, including each collection as its own ancestor with depth 0
+COLLECTION_ANCESTORS_TABLE = "collection_ancestors"
+
+# number of rows that reference a content addressed data file
+BLOB_REFS_TABLE = "blob_refs"
+
+# position of the data files that are stored in the segments of the PackStorage
+PACK_INDEX_TABLE = "pack_index"
+
+# full text search indices that are kept in sync with the table by triggers
+FTS_INDICES = dict()
+FTS_INDICES["files"] = ("name", "comment", "subject")
+FTS_INDICES["collections"] = ("name",)
+# prefix indices make prefix queries of 2 and 3 characters fast
+FTS_OPTIONS = "tokenize = 'unicode61', prefix = '2 3'"
+
+
+def get_index_name(table_name, columns):
+    return "idx_" + table_name + "_" + "_".join(columns)
+
+
+def get_fts_table_name(table_name):
+    return table_name + "_fts"
+
+
+def create_missing_tables(schema, con):
+    for t_name in schema.tables:
+        if not schema.has_table(con, t_name):
+            print("create table", t_name)
+            schema.create_table(con, t_name, schema.tables[t_name])
+
+
+def create_indices(schema, con):
+    for t_name in schema.indices:
+        if not schema.has_table(con, t_name):
+            continue
+        existing_cols = schema.get_column_names(con, t_name)
+        for columns in schema.indices[t_name]:
+            if any(c not in existing_cols for c in columns):
+                print("Warning: skip index on missing columns", t_name, columns)
+                continue
+            schema.create_index(con, t_name, columns)
+
+
+def create_fts_indices(schema, con):
+    for t_name in schema.fts_indices:
+        if not schema.has_table(con, t_name):
+            continue
+        existing_cols = schema.get_column_names(con, t_name)
+        columns = schema.fts_indices[t_name]
+        if any(c not in existing_cols for c in columns):
+            print("Warning: skip full text index on missing columns", t_name, columns)
+            continue
+        try:
+            schema.create_fts_index(con, t_name, columns)
+        except sqlite3.OperationalError as e:
+            # sqlite was built without FTS5, search falls back to LIKE
+            print("Warning: could not create full text index", t_name, e)
+            return
+
+
+def create_collection_ancestors(schema, con):
+    if not schema.has_table(con, "collections"):
+        return
+    t_name = COLLECTION_ANCESTORS_TABLE
+    print("create table", t_name)
+    con.execute("CREATE TABLE IF NOT EXISTS " + t_name + " (ancestor INTEGER NOT NULL, descendant INTEGER NOT NULL, "
+                + "depth INTEGER NOT NULL, PRIMARY KEY (ancestor, descendant)) WITHOUT ROWID;")
+    schema.create_index(con, t_name, ("descendant", "depth"))
+    # new collections inherit the ancestors of their parent
+    con.execute("CREATE TRIGGER IF NOT EXISTS " + t_name + "_insert AFTER INSERT ON collections BEGIN "
+                + "INSERT INTO " + t_name + " (ancestor, descendant, depth) SELECT ancestor, new.ID, depth + 1 FROM "
+                + t_name + " WHERE descendant = new.parent UNION ALL SELECT new.ID, new.ID, 0; END;")
+    # detach the subtree from the ancestors of the collection
+    detach_str = "DELETE FROM " + t_name + " WHERE descendant IN (SELECT descendant FROM " + t_name + " WHERE ancestor = old.ID) " \
+                + "AND ancestor IN (SELECT ancestor FROM " + t_name + " WHERE descendant = old.ID AND ancestor != old.ID);"
+    # sub collections of a removed collection become roots of their own trees
+    con.execute("CREATE TRIGGER IF NOT EXISTS " + t_name + "_delete AFTER DELETE ON collections BEGIN "
+                + detach_str + " DELETE FROM " + t_name + " WHERE ancestor = old.ID OR descendant = old.ID; END;")
+    # moving a collection moves its subtree
+    attach_str = "INSERT INTO " + t_name + " (ancestor, descendant, depth) SELECT p.ancestor, s.descendant, p.depth + s.depth + 1 FROM " \
+                + t_name + " AS p, " + t_name + " AS s WHERE p.descendant = new.parent AND s.ancestor = new.ID;"
+    con.execute("CREATE TRIGGER IF NOT EXISTS " + t_name + "_update AFTER UPDATE OF parent ON collections "
+                + "WHEN old.parent IS NOT new.parent BEGIN " + detach_str + " " + attach_str + " END;")
+    # add the existing hierarchy, depth is limited to stop at cycles
+    con.execute("DELETE FROM " + t_name + ";")
+    con.execute("INSERT OR IGNORE INTO " + t_name + " (ancestor, descendant, depth) "
+                + "WITH RECURSIVE tree(ancestor, descendant, depth) AS ("
+                + "SELECT ID, ID, 0 FROM collections UNION ALL "
+                + "SELECT p.ID, tree.descendant, tree.depth + 1 FROM tree "
+                + "JOIN collections AS c ON c.ID = tree.ancestor JOIN collections AS p ON p.ID = c.parent "
+                + "WHERE tree.depth < 1000) SELECT ancestor, descendant, depth FROM tree;")
+
+
+def create_blob_refs(schema, con):
+    print("create table", BLOB_REFS_TABLE)
+    con.execute("CREATE TABLE IF NOT EXISTS " + BLOB_REFS_TABLE + " (tableName TEXT NOT NULL, name TEXT NOT NULL, "
+                + "refCount INTEGER NOT NULL, PRIMARY KEY (tableName, name)) WITHOUT ROWID;")
+
+
+def create_pack_index(schema, con):
+    print("create table", PACK_INDEX_TABLE)
+    con.execute("CREATE TABLE IF NOT EXISTS " + PACK_INDEX_TABLE + " (tableName TEXT NOT NULL, name TEXT NOT NULL, "
+                + "segment INTEGER NOT NULL, offset INTEGER NOT NULL, length INTEGER NOT NULL, checksum INTEGER NOT NULL, "
+                + "PRIMARY KEY (tableName, name)) WITHOUT ROWID;")
+    schema.create_index(con, PACK_INDEX_TABLE, ("segment",))
+
+
+# list of (version, description, function) that are applied in order
+MIGRATIONS = [(1, "create missing tables", create_missing_tables),
+              (2, "create indices for lookup columns", create_indices),
+              (3, "create full text search indices", create_fts_indices),
+              (4, "create closure table of the collection hierarchy", create_collection_ancestors),
+              (5, "create reference counts of data files", create_blob_refs),
+              (6, "create index of the pack storage", create_pack_index)]
+
+
 class DBSchema:
-    def __init__(self, tables):
+    def __init__(self, tables, indices=INDICES, migrations=MIGRATIONS, fts_indices=FTS_INDICES):
         self.tables = tables
+        self.indices = indices
+        self.migrations = migrations
+        self.fts_indices = fts_indices
 
     def create_database(self, path):
         con = sqlite3.connect(path)
         for t_name in self.tables:
             self.create_table(con, t_name, self.tables[t_name])
-        
+        self.migrate(con)
         con.close()
 
     def create_table(self, con, table_name, columns):
@@ -134,3 +280,83 @@ class DBSchema:
         col_string += '''  timestamp DATETIME DEFAULT CURRENT_TIMESTAMP);'''
         con.execute('''CREATE TABLE '''+table_name+col_string)
         con.commit()
+
+    def create_index(self, con, table_name, columns):
+        index_name = get_index_name(table_name, columns)
+        print("create index", index_name)
+        con.execute("CREATE INDEX IF NOT EXISTS " + index_name + " ON " + table_name + " (" + ", ".join(columns) + ");")
+
+    def create_fts_index(self, con, table_name, columns):
+        """ Creates an external content FTS5 table that only stores the index and
+            triggers that update the index when rows of the table change.
+        """
+        fts_name = get_fts_table_name(table_name)
+        print("create full text index", fts_name)
+        col_str = ", ".join(columns)
+        new_str = ", ".join(["new." + c for c in columns])
+        old_str = ", ".join(["old." + c for c in columns])
+        con.execute("CREATE VIRTUAL TABLE IF NOT EXISTS " + fts_name + " USING fts5(" + col_str
+                    + ", content = '" + table_name + "', content_rowid = 'ID', " + FTS_OPTIONS + ");")
+        insert_str = "INSERT INTO " + fts_name + " (rowid, " + col_str + ") VALUES (new.ID, " + new_str + ");"
+        delete_str = "INSERT INTO " + fts_name + " (" + fts_name + ", rowid, " + col_str + ") VALUES ('delete', old.ID, " + old_str + ");"
+        con.execute("CREATE TRIGGER IF NOT EXISTS " + fts_name + "_insert AFTER INSERT ON " + table_name
+                    + " BEGIN " + insert_str + " END;")
+        con.execute("CREATE TRIGGER IF NOT EXISTS " + fts_name + "_delete AFTER DELETE ON " + table_name
+                    + " BEGIN " + delete_str + " END;")
+        con.execute("CREATE TRIGGER IF NOT EXISTS " + fts_name + "_update AFTER UPDATE OF " + col_str + " ON " + table_name
+                    + " BEGIN " + delete_str + " " + insert_str + " END;")
+        # index the existing rows
+        con.execute("INSERT INTO " + fts_name + " (" + fts_name + ") VALUES ('rebuild');")
+
+    def has_table(self, con, table_name):
+        cur = con.execute("SELECT name FROM sqlite_master WHERE type='table' AND name = ?;", (table_name,))
+        return cur.fetchone() is not None
+
+    def get_column_names(self, con, table_name):
+        cur = con.execute("PRAGMA table_info(" + table_name + ");")
+        return [r[1] for r in cur.fetchall()]
+
+    def get_version(self, con):
+        return con.execute("PRAGMA user_version;").fetchone()[0]
+
+    def get_latest_version(self):
+        if len(self.migrations) < 1:
+            return 0
+        return self.migrations[-1][0]
+
+    def migrate(self, con):
+        """ Applies all migrations with a version higher than the version stored in the database.
+            Each migration is committed together with the update of the version. The migrations
+            are idempotent, so an interrupted run can be restarted.
+
+        Args:
+            con (sqlite3.Connection): connection to the database
+
+        Returns:
+            int: schema version of the database
+        """
+        version = self.get_version(con)
+        for m_version, description, func in self.migrations:
+            if m_version <= version:
+                continue
+            print("apply migration", m_version, description)
+            try:
+                if not con.in_transaction:
+                    con.execute("BEGIN;")
+                func(self, con)
+                con.execute("PRAGMA user_version = " + str(int(m_version)) + ";")
+                con.commit()
+            except:
+                con.rollback()
+                raise
+            version = m_version
+        return version
+
+    def migrate_database(self, path):
+        con = sqlite3.connect(path)
+        try:
+            version = self.migrate(con)
+        finally:
+            con.close()
+        print("database", path, "is at schema version", version)
+        return version
@@ -20,8 +20,6 @@
 # DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
 # OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE
 # USE OR OTHER DEALINGS IN THE SOFTWARE.
-import bson
-import bz2
 from motion_database_server.utils import extract_compressed_bson, get_bvh_from_str
 from anim_utils.animation_data.skeleton_builder import SkeletonBuilder
 
@@ -39,8 +37,7 @@ class SkeletonDatabase(object):
         
         if skeleton_model is not None:
             try:
-                skeleton_model = bz2.decompress(skeleton_model)
-                skeleton_model = bson.loads(skeleton_model)
+                skeleton_model = extract_compressed_bson(skeleton_model)
                 skeleton.skeleton_model = skeleton_model
             except Exception as e:
                 print("Could not load skeleton model", e.args)
@@ -48,7 +45,7 @@ class SkeletonDatabase(object):
     
     def add_new_skeleton(self, name, data, meta_data, owner=1):
         skeleton_list = self.get_name_list(self.skeleton_table)
-        if name != "" and name not in skeleton_list.values:
+        if name != "" and name not in skeleton_list:
             record = dict()
             record["name"] = name
             record["owner"] = owner
@@ -21,19 +21,16 @@
 # OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE
 # USE OR OTHER DEALINGS IN THE SOFTWARE.
 import json
-import bson
-import bz2
-import tornado.web
 from motion_database_server.base_handler import BaseDBHandler
+from motion_database_server.utils import compress_bson
 
 DEFAULT_SKELETON = "custom"
 
 
 class GetSkeletonListHandler(BaseDBHandler):
-    @tornado.gen.coroutine
-    def post(self):
+    async def post(self):
         try:
-            skeletons = self.motion_database.get_skeleton_list()
+            skeletons = await self.run_db(self.motion_database.get_skeleton_list)
             skeletons_str = json.dumps(skeletons)
             self.write(skeletons_str)
         except Exception as e:
@@ -45,8 +42,7 @@ class GetSkeletonListHandler(BaseDBHandler):
 
 
 class GetSkeletonHandler(BaseDBHandler):
-    @tornado.gen.coroutine
-    def post(self):
+    async def post(self):
         input_str = self.request.body.decode("utf-8")
         input_data = json.loads(input_str)
         
@@ -67,8 +63,7 @@ class GetSkeletonHandler(BaseDBHandler):
 
 
 class GetSkeletonModelHandler(BaseDBHandler):
-    @tornado.gen.coroutine
-    def post(self):
+    async def post(self):
         input_str = self.request.body.decode("utf-8")
         input_data = json.loads(input_str)
         skeleton_name = DEFAULT_SKELETON # default skeleton
@@ -86,31 +81,27 @@ class GetSkeletonModelHandler(BaseDBHandler):
 
 
 class NewSkeletonHandler(BaseDBHandler):
-    @tornado.gen.coroutine
-    def post(self):
+    async def post(self):
         try:
             input_str = self.request.body.decode("utf-8")
             input_data = json.loads(input_str)
             success = False
             if "name" in input_data and "data" in input_data and "token" in input_data:
                 token = input_data["token"]
-                request_user_id = self.project_database.get_user_id_from_token(token)
+                request_user_id = await self.run_db(self.project_database.get_user_id_from_token, token)
                 if request_user_id > -1:
                     data = None
                     if "data_type" in input_data and input_data["data_type"] == "bvh":
-                        skeleton = self.motion_database.load_skeleton_from_bvh_str(input_data["data"])
-                        data = bson.dumps(skeleton.to_unity_format(animated_joints=skeleton.animated_joints))
-                        data = bz2.compress(data)
+                        skeleton = await self.run_db(self.motion_database.load_skeleton_from_bvh_str, input_data["data"])
+                        data = await self.run_cpu(compress_bson, skeleton.to_unity_format(animated_joints=skeleton.animated_joints))
                     else:
-                        data = bson.dumps(json.loads(input_data["data"]))
-                        data = bz2.compress(data)
+                        data = await self.run_cpu(compress_bson, json.loads(input_data["data"]))
                     
                     meta_data = None
                     if "meta_data" in input_data:
-                        meta_data = bson.dumps(json.loads(input_data["meta_data"]))
-                        meta_data = bz2.compress(meta_data)
+                        meta_data = await self.run_cpu(compress_bson, json.loads(input_data["meta_data"]))
                     if data is not None:
-                        success = self.motion_database.add_new_skeleton(input_data["name"], data, meta_data, request_user_id)
+                        success = await self.run_db(self.motion_database.add_new_skeleton, input_data["name"], data, meta_data, request_user_id)
                 else:
                     print("Error: not all parameters were provided to create a skeleton entry")
             else:
@@ -128,8 +119,7 @@ class NewSkeletonHandler(BaseDBHandler):
 
 
 class ReplaceSkeletonHandler(BaseDBHandler):
-    @tornado.gen.coroutine
-    def post(self):
+    async def post(self):
         try:
             input_str = self.request.body.decode("utf-8")
             input_data = json.loads(input_str)
@@ -137,21 +127,19 @@ class ReplaceSkeletonHandler(BaseDBHandler):
             if "name" in input_data and "token" in input_data:
                 skeleton_name = input_data["name"]
                 token = input_data["token"]
-                owner_id = self.motion_database.get_owner_of_skeleton(skeleton_name)
-                request_user_id = self.project_database.get_user_id_from_token(token)
-                user_role = self.project_database.get_user_role(request_user_id)
+                owner_id = await self.run_db(self.motion_database.get_owner_of_skeleton, skeleton_name)
+                request_user_id = await self.run_db(self.project_database.get_user_id_from_token, token)
+                user_role = await self.run_db(self.project_database.get_user_role, request_user_id)
                 if request_user_id == owner_id or user_role.lower() == "admin":
                     data = None
                     meta_data = None
                     if "data" in input_data:
                         data = json.loads(input_data["data"])
-                        data = bson.dumps(data)
-                        data = bz2.compress(data)
+                        data = await self.run_cpu(compress_bson, data)
                     if "meta_data" in input_data:
-                        meta_data = bson.dumps(json.loads(input_data["meta_data"]))
-                        meta_data = bz2.compress(meta_data)
+                        meta_data = await self.run_cpu(compress_bson, json.loads(input_data["meta_data"]))
                     if data is not None or meta_data is not None:
-                        self.motion_database.replace_skeleton(skeleton_name, data, meta_data)
+                        await self.run_db(self.motion_database.replace_skeleton, skeleton_name, data, meta_data)
                         success = True
                 else:
                     print("Error: not enough access rights to modify skeleton entry")
@@ -171,8 +159,7 @@ class ReplaceSkeletonHandler(BaseDBHandler):
 
 
 class RemoveSkeletonHandler(BaseDBHandler):
-    @tornado.gen.coroutine
-    def post(self):
+    async def post(self):
         try:
             input_str = self.request.body.decode("utf-8")
             success = False
@@ -180,11 +167,11 @@ class RemoveSkeletonHandler(BaseDBHandler):
             if "name" in input_data and "token" in input_data:
                 skeleton_name = input_data["name"]
                 token = input_data["token"]
-                owner_id = self.motion_database.get_owner_of_skeleton(skeleton_name)
-                request_user_id = self.project_database.get_user_id_from_token(token)
-                user_role = self.project_database.get_user_role(request_user_id)
+                owner_id = await self.run_db(self.motion_database.get_owner_of_skeleton, skeleton_name)
+                request_user_id = await self.run_db(self.project_database.get_user_id_from_token, token)
+                user_role = await self.run_db(self.project_database.get_user_role, request_user_id)
                 if request_user_id == owner_id or user_role.lower() == "admin":
-                    self.motion_database.remove_skeleton(skeleton_name)
+                    await self.run_db(self.motion_database.remove_skeleton, skeleton_name)
                     success = True
                 else:
                     print("Error: not enough access rights to delete skeleton entry")
@@ -20,8 +20,10 @@
 # DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
 # OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE
 # USE OR OTHER DEALINGS IN THE SOFTWARE.
+from motion_database_server.query_builder import COND_GREATER
 
 DATA_COLS = ["data", "metaData"]
+MAX_PAGE_SIZE = 10000
 
 """
 Table interface that stores certain columns in the filesystem
@@ -36,16 +38,36 @@ class Table():
         self.db = db
 
     def search_records_by_name(self, name, cols=None, exact_match=False, filter_conditions=[]):
+        """ partial matches use the full text index of the table if it exists """
         if cols is None:
             cols = self.cols
-        filter_conditions += [("name", name, exact_match)]
-        records = self.db.query_table(self.table_name, cols, filter_conditions, None)
+        if not exact_match and self.db.has_fts_index(self.table_name):
+            records = self.db.search_table(self.table_name, cols, name, filter_conditions, fts_columns=["name"])
+        else:
+            filter_conditions = filter_conditions + [("name", name, exact_match)]
+            records = self.db.query_table(self.table_name, cols, filter_conditions, None)
         data_col_idx = [i for i, c in enumerate(cols) if c in self.data_cols]
         if len(data_col_idx) > 0:
             for i, r in enumerate(records):
                 records[i] = self.read_data_columns(r, data_col_idx)
         return records
     
+    def search_records(self, text, cols=None, filter_conditions=[], prefix=True, limit=None):
+        """ Returns records ranked by the relevance of the indexed text columns.
+            Without a full text index the name column is searched using LIKE.
+        """
+        if cols is None:
+            cols = self.cols
+        if not self.db.has_fts_index(self.table_name):
+            filter_conditions = filter_conditions + [("name", text, False)]
+            return self.get_record_list(cols, filter_conditions, limit=limit)
+        records = self.db.search_table(self.table_name, cols, text, filter_conditions, prefix, limit=limit)
+        data_col_idx = [i for i, c in enumerate(cols) if c in self.data_cols]
+        if len(data_col_idx) > 0:
+            for i, r in enumerate(records):
+                records[i] = self.read_data_columns(list(r), data_col_idx)
+        return records
+
     def get_full_record_by_name(self, entry_name):
         record = self.get_record_by_name(entry_name, self.cols)
         if record is None:
@@ -103,7 +125,6 @@ class Table():
 
     def read_data_columns(self, record, col_idx):
         for i in col_idx:
-            print("read", self.table_name, record[i])
             record[i] = self.db.load_data_file(self.table_name, record[i])
         return record
 
@@ -123,32 +144,20 @@ class Table():
         return data, modified_data_cols
 
     def update_record(self, entry_id, input_data):
-        
-        input_data = self.filter_columns(input_data)
-        if len(input_data) < 0:
-            return
-        data, modified_data_cols = self.write_data_columns(input_data)
-        if len(modified_data_cols) > 0:
-            self.delete_files_of_record([("ID",entry_id)], modified_data_cols)
-        self.db.update_entry(self.table_name, data, "ID", entry_id)
+        self.update_record_by_condition([("ID",entry_id)], input_data)
 
     def update_record_by_name(self, entry_name, input_data):
-        input_data = self.filter_columns(input_data)
-        if len(input_data) < 0:
-            return
-        data, modified_data_cols = self.write_data_columns(input_data)
-        if len(modified_data_cols) > 0:
-            self.delete_files_of_record([("name",entry_name)], modified_data_cols)
-        self.db.update_entry(self.table_name, data, "name", entry_name)
+        self.update_record_by_condition([("name",entry_name)], input_data)
    
     def update_record_by_condition(self, conditions, input_data):
         input_data = self.filter_columns(input_data)
         if len(input_data) < 0:
             return
-        data, modified_data_cols = self.write_data_columns(input_data)
-        if len(modified_data_cols) > 0:
-            self.delete_files_of_record(conditions, modified_data_cols)
-        self.db.update_entry_by_condition(self.table_name, data, conditions)
+        with self.db.transaction():
+            data, modified_data_cols = self.write_data_columns(input_data)
+            if len(modified_data_cols) > 0:
+                self.delete_files_of_record(conditions, modified_data_cols)
+            self.db.update_entry_by_condition(self.table_name, data, conditions)
 
     def filter_columns(self, input_data):
         new_data = dict()
@@ -158,27 +167,36 @@ class Table():
         return new_data
 
     def create_record(self, input_data):
-        input_data = self.filter_columns(input_data)
-        if len(input_data) < 0:
+        new_ids = self.create_records([input_data])
+        if len(new_ids) < 1:
             return -1
-        input_data, modified_data_cols = self.write_data_columns(input_data)
-        col_keys = []
-        cols_values = []
-        for key in input_data:
-            col_keys.append(key)
-            cols_values.append(input_data[key])
-        records = [cols_values]
-        self.db.insert_records(self.table_name, col_keys, records)
-        records = self.db.get_max_id(self.table_name)
-        new_id = -1
-        if len(records) > 0:
-            new_id = int(records.iloc[0]["ID"])
-        return new_id
+        return new_ids[0]
+
+    def create_records(self, input_data_list):
+        """ Writes the files of the data columns of all records and inserts the records
+            in a single transaction. If the insert fails the written files are removed
+            by the unit of work.
 
-    def get_record_list(self, cols=None, filter_conditions=[],intersection_list=[], load_data_files=True, join_statement=None, distinct=False):
+        Args:
+            input_data_list (list): list of dictionaries that map column names to values
+
+        Returns:
+            list: IDs of the new records in the order of input_data_list
+        """
+        entries = []
+        with self.db.transaction():
+            for input_data in input_data_list:
+                input_data = self.filter_columns(input_data)
+                data, modified_data_cols = self.write_data_columns(input_data)
+                entries.append(data)
+            if len(entries) < 1:
+                return []
+            return self.db.insert_entries(self.table_name, entries)
+
+    def get_record_list(self, cols=None, filter_conditions=[],intersection_list=[], load_data_files=True, join_statement=None, distinct=False, order=None, limit=None):
         if cols is None:
             cols = self.cols
-        records = self.db.query_table(self.table_name, cols, filter_conditions,intersection_list,join_statement, distinct)
+        records = self.db.query_table(self.table_name, cols, filter_conditions,intersection_list,join_statement, distinct, order=order, limit=limit)
         if load_data_files:
             data_col_idx = [i for i, c in enumerate(cols) if c in self.data_cols]
             if len(data_col_idx) > 0:
@@ -186,6 +204,46 @@ class Table():
                     records[i] = self.read_data_columns(list(r), data_col_idx)
         return records
 
+    def get_record_page(self, cols=None, filter_conditions=[], intersection_list=[], join_statement=None, distinct=False, limit=MAX_PAGE_SIZE, after_id=None, with_count=False, id_col="ID"):
+        """ Returns the records with an id greater than after_id ordered by id.
+            The cost of a page does not depend on its position in the result set.
+
+        Args:
+            cols (list): columns to return, has to contain id_col
+            limit (int): maximum number of records in the page
+            after_id (int): value of id_col of the last record of the previous page
+            with_count (bool): add the total number of records that match the conditions
+            id_col (str): name of the ID column, needs the table prefix in joins
+
+        Returns:
+            dict: records, next_after_id that is None for the last page and optionally count
+        """
+        if cols is None:
+            cols = self.cols
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        page_conditions = list(filter_conditions)
+        if after_id is not None:
+            page_conditions.append((id_col, after_id, COND_GREATER))
+        # request one more record to find out if there is a next page
+        records = self.get_record_list(cols, page_conditions, intersection_list, join_statement=join_statement,
+                                        distinct=distinct, order=[id_col], limit=limit+1)
+        next_after_id = None
+        if len(records) > limit:
+            records = records[:limit]
+            next_after_id = records[-1][cols.index(id_col)]
+        page = dict()
+        page["records"] = records
+        page["next_after_id"] = next_after_id
+        if with_count:
+            page["count"] = self.db.count_records(self.table_name, cols, filter_conditions, intersection_list, join_statement, distinct)
+        return page
+
+    def iterate_record_list(self, cols=None, filter_conditions=[], intersection_list=[], join_statement=None, distinct=False, batch_size=1000):
+        """ generator over the records that does not load data files and keeps at most batch_size rows in memory """
+        if cols is None:
+            cols = self.cols
+        return self.db.iterate_table(self.table_name, cols, filter_conditions, intersection_list, join_statement, distinct, batch_size=batch_size)
+
     def get_value_of_column_by_id(self, entry_id, col_name):
         value = None
         record = self.get_record_by_id(entry_id, [col_name])
@@ -208,26 +266,20 @@ class Table():
         return self.data_cols
 
     def delete_record_by_id(self, entry_id):
-        filter_conditions = [("ID",entry_id)]
-        if len(self.data_cols) > 0:
-            self.delete_files_of_record(filter_conditions, self.data_cols)
-        self.db.delete_entry_by_id(self.table_name, entry_id)
+        self.delete_record_by_condition([("ID",entry_id)])
 
     def delete_record_by_name(self, entry_name):
-        filter_conditions = [("name",entry_name)]
-        if len(self.data_cols) > 0:
-            self.delete_files_of_record(filter_conditions, self.data_cols)
-        self.db.delete_entry_by_name(self.table_name, entry_name)
+        self.delete_record_by_condition([("name",entry_name)])
 
     def delete_record_by_condition(self, filter_conditions):
-        if len(self.data_cols) > 0:
-            self.delete_files_of_record(filter_conditions, self.data_cols)
-        self.db.delete_entry_by_condition(self.table_name, filter_conditions)
+        with self.db.transaction():
+            if len(self.data_cols) > 0:
+                self.delete_files_of_record(filter_conditions, self.data_cols)
+            self.db.delete_entry_by_condition(self.table_name, filter_conditions)
         
     def delete_files_of_record(self, filter_conditions, data_cols):
         data_records = self.get_record_list(data_cols, filter_conditions, load_data_files=False)
-        if len(data_records) <1:
-            return
-        for data_file_name in data_records[0]:
-            print("delete file", self.table_name, data_file_name)
-            self.db.delete_data_file(self.table_name, data_file_name)
+        for data_record in data_records:
+            for data_file_name in data_record:
+                print("delete file", self.table_name, data_file_name)
+                self.db.delete_data_file(self.table_name, data_file_name)
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+#
+# Copyright 2019 DFKI GmbH.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to permit
+# persons to whom the Software is furnished to do so, subject to the
+# following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN
+# NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE
+# USE OR OTHER DEALINGS IN THE SOFTWARE.
+import os
+
+
+class UnitOfWork:
+    """ Collects the file operations of a database transaction.
+        Files are removed only after the transaction was committed and
+        files written during the transaction are removed on a rollback.
+    """
+    def __init__(self) -> None:
+        self.created_files = []
+        self.deleted_files = []
+        self.commit_callbacks = []
+
+    def add_created_file(self, filename):
+        self.created_files.append(filename)
+
+    def add_deleted_file(self, filename):
+        self.deleted_files.append(filename)
+
+    def cancel_deleted_file(self, filename):
+        """ keeps a file that was scheduled for removal, e.g. if its content was added again """
+        if filename in self.deleted_files:
+            self.deleted_files.remove(filename)
+
+    def add_commit_callback(self, func):
+        """ func is called after the transaction was committed """
+        self.commit_callbacks.append(func)
+
+    def commit(self):
+        for filename in self.deleted_files:
+            if filename in self.created_files:
+                continue
+            if os.path.isfile(filename):
+                os.remove(filename)
+        for func in self.commit_callbacks:
+            func()
+        self.reset()
+
+    def rollback(self):
+        for filename in self.created_files:
+            if os.path.isfile(filename):
+                print("remove orphaned file", filename)
+                os.remove(filename)
+        self.reset()
+
+    def reset(self):
+        self.created_files = []
+        self.deleted_files = []
+        self.commit_callbacks = []
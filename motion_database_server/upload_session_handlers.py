@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+#
+# Copyright 2019 DFKI GmbH.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to permit
+# persons to whom the Software is furnished to do so, subject to the
+# following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN
+# NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE
+# USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+Handlers of resumable uploads. A client creates an upload session, sends the
+base64 encoded parts in any order with their sha256 checksums and queries the
+missing parts to resume an interrupted upload. The upload is finalized by
+sending the upload_id instead of the data to /upload_motion or /files/add.
+"""
+import json
+from motion_database_server.base_handler import BaseDBHandler
+
+
+class CreateUploadHandler(BaseDBHandler):
+    async def post(self):
+        try:
+            input_str = self.request.body.decode("utf-8")
+            input_data = json.loads(input_str)
+            response_dict = dict()
+            success = False
+            user_id = await self.run_db(self.project_database.get_user_id_from_token, input_data.get("token", None))
+            if user_id >= 0 and "n_parts" in input_data:
+                upload_id = await self.run_db(self.motion_database.upload_sessions.create_upload, input_data["n_parts"], user_id)
+                response_dict["upload_id"] = upload_id
+                response_dict["n_parts"] = int(input_data["n_parts"])
+                success = True
+            else:
+                print("Error: has no access rights")
+            response_dict["success"] = success
+            self.write(json.dumps(response_dict))
+        except Exception as e:
+            print("caught exception in post")
+            self.write("Caught an exception: %s" % e)
+            raise
+        finally:
+            self.finish()
+
+
+class UploadPartHandler(BaseDBHandler):
+    async def post(self):
+        try:
+            input_str = self.request.body.decode("utf-8")
+            input_data = json.loads(input_str)
+            response_dict = dict()
+            success = False
+            session_id = await self.run_db(self.get_upload_session, input_data)
+            if session_id is not None and "data" in input_data and "part_idx" in input_data:
+                try:
+                    await self.run_db(self.motion_database.upload_sessions.add_part, session_id, input_data["part_idx"], None,
+                                      input_data["data"], input_data.get("sha256", None), False)
+                    success = True
+                except ValueError as e:
+                    print("Error: could not add part", e)
+                    response_dict["error"] = str(e)
+            else:
+                print("Error: unknown upload session")
+            response_dict["success"] = success
+            self.write(json.dumps(response_dict))
+        except Exception as e:
+            print("caught exception in post")
+            self.write("Caught an exception: %s" % e)
+            raise
+        finally:
+            self.finish()
+
+
+class GetUploadStatusHandler(BaseDBHandler):
+    async def post(self):
+        try:
+            input_str = self.request.body.decode("utf-8")
+            input_data = json.loads(input_str)
+            response_dict = dict()
+            session_id = await self.run_db(self.get_upload_session, input_data)
+            info = None
+            if session_id is not None:
+                info = await self.run_db(self.motion_database.upload_sessions.get_session_info, session_id)
+            if info is not None:
+                response_dict["n_parts"] = info["n_parts"]
+                response_dict["missing"] = info["missing"]
+                response_dict["complete"] = info["complete"]
+            response_dict["success"] = info is not None
+            self.write(json.dumps(response_dict))
+        except Exception as e:
+            print("caught exception in post")
+            self.write("Caught an exception: %s" % e)
+            raise
+        finally:
+            self.finish()
+
+
+class RemoveUploadHandler(BaseDBHandler):
+    async def post(self):
+        try:
+            input_str = self.request.body.decode("utf-8")
+            input_data = json.loads(input_str)
+            session_id = await self.run_db(self.get_upload_session, input_data)
+            if session_id is not None:
+                await self.run_db(self.motion_database.upload_sessions.remove_session, session_id)
+            self.write(json.dumps({"success": session_id is not None}))
+        except Exception as e:
+            print("caught exception in post")
+            self.write("Caught an exception: %s" % e)
+            raise
+        finally:
+            self.finish()
+
+
+UPLOAD_SESSION_HANDLER_LIST = [(r"/uploads/create", CreateUploadHandler),
+                            (r"/uploads/part", UploadPartHandler),
+                            (r"/uploads/status", GetUploadStatusHandler),
+                            (r"/uploads/remove", RemoveUploadHandler)]
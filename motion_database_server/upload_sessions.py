@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+#
+# Copyright 2019 DFKI GmbH.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to permit
+# persons to whom the Software is furnished to do so, subject to the
+# following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN
+# NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE
+# USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+Upload sessions of multi-part uploads. The parts are spooled to files in the
+upload directory, so they do not occupy memory and survive a restart of the
+server. Sessions without new parts expire after a time to live and the
+size of all spooled parts is limited by a quota.
+
+Resumable uploads create a session with create_upload first. Their parts can
+be sent in any order and in parallel with a sha256 checksum, and the parts that
+are still missing can be queried to resume an interrupted upload.
+"""
+import os
+import json
+import time
+import base64
+import uuid
+import shutil
+import threading
+from hashlib import sha1, sha256
+from contextlib import contextmanager
+
+DEFAULT_SESSION_TTL = 3600
+DEFAULT_UPLOAD_QUOTA = 1024 * 1024 * 1024
+SESSION_FILE = "session.json"
+PART_SUFFIX = ".part"
+DATA_FILE = "data.bin"
+CHUNK_SIZE = 1024 * 1024
+
+
+def get_session_id(*key):
+    """ Returns the id of the session of an upload that is identified by the key """
+    return sha1(":".join([str(k) for k in key]).encode("utf-8")).hexdigest()
+
+
+class UploadSessionStore:
+    """ Collects the base64 encoded parts of uploads in data files.
+
+    Args:
+        directory (str): directory of the spooled parts
+        ttl (float): seconds after which an incomplete session without new parts is removed
+        quota (int): maximum size of all spooled parts in bytes
+    """
+    def __init__(self, directory, ttl=DEFAULT_SESSION_TTL, quota=DEFAULT_UPLOAD_QUOTA):
+        self.directory = directory
+        self.ttl = ttl
+        self.quota = quota
+        self.sessions = dict()
+        self.size = 0
+        self.lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self.restore_sessions()
+
+    def get_session_dir(self, session_id):
+        return self.directory + os.sep + session_id
+
+    def get_part_path(self, session_id, part_idx):
+        return self.get_session_dir(session_id) + os.sep + str(part_idx) + PART_SUFFIX
+
+    def restore_sessions(self):
+        """ Adds the sessions that were spooled before a restart """
+        for session_id in os.listdir(self.directory):
+            session_dir = self.get_session_dir(session_id)
+            session_file = session_dir + os.sep + SESSION_FILE
+            if not os.path.isfile(session_file):
+                shutil.rmtree(session_dir, ignore_errors=True)
+                continue
+            with open(session_file, "rt") as file:
+                session_data = json.load(file)
+            session = self.get_new_session(session_data["n_parts"], session_data.get("owner", None))
+            session["last_access"] = os.path.getmtime(session_dir)
+            for name in os.listdir(session_dir):
+                if name.endswith(PART_SUFFIX) and name[:-len(PART_SUFFIX)].isdigit():
+                    session["parts"].add(int(name[:-len(PART_SUFFIX)]))
+                    session["size"] += os.path.getsize(session_dir + os.sep + name)
+            session["complete"] = len(session["parts"]) == session["n_parts"]
+            self.sessions[session_id] = session
+            self.size += session["size"]
+        self.remove_expired_sessions()
+
+    def get_new_session(self, n_parts, owner=None):
+        return {"n_parts": n_parts, "parts": set(), "size": 0, "last_access": time.time(),
+                "complete": False, "in_use": False, "owner": owner}
+
+    def create_session(self, session_id, n_parts, owner=None):
+        if n_parts < 1:
+            raise ValueError("Upload needs at least one part")
+        session = self.get_new_session(n_parts, owner)
+        session_dir = self.get_session_dir(session_id)
+        os.makedirs(session_dir, exist_ok=True)
+        with open(session_dir + os.sep + SESSION_FILE, "wt") as file:
+            json.dump({"n_parts": n_parts, "owner": owner}, file)
+        self.sessions[session_id] = session
+        return session
+
+    def create_upload(self, n_parts, owner=None):
+        """ Creates a session of a resumable upload and returns its id """
+        session_id = uuid.uuid4().hex
+        with self.lock:
+            self.remove_expired_sessions()
+            self.create_session(session_id, int(n_parts), owner)
+        return session_id
+
+    def get_session_info(self, session_id):
+        """ Returns the state of a session including the indices of missing parts or None """
+        with self.lock:
+            session = self.sessions.get(session_id, None)
+            if session is None:
+                return None
+            missing = [idx for idx in range(session["n_parts"]) if idx not in session["parts"]]
+            return {"n_parts": session["n_parts"], "missing": missing, "complete": session["complete"],
+                    "owner": session["owner"], "size": session["size"]}
+
+    def remove_expired_sessions(self):
+        now = time.time()
+        for session_id in list(self.sessions.keys()):
+            session = self.sessions[session_id]
+            if not session["in_use"] and now - session["last_access"] > self.ttl:
+                print("remove expired upload session", session_id)
+                self.delete_session(session_id)
+
+    def delete_session(self, session_id):
+        session = self.sessions.pop(session_id, None)
+        if session is not None:
+            self.size -= session["size"]
+        shutil.rmtree(self.get_session_dir(session_id), ignore_errors=True)
+
+    def remove_session(self, session_id):
+        with self.lock:
+            self.delete_session(session_id)
+
+    def add_part(self, session_id, part_idx, n_parts, base64_data_str, checksum=None, create=True):
+        """ Spools a part and returns True once all parts were received.
+            Parts can arrive on different threads, so only one caller gets True.
+            Parts that are sent again after the session is complete are ignored.
+
+        Args:
+            session_id (str): id of the session
+            part_idx (int): index of the part
+            n_parts (int): number of parts or None to use the number of the existing session
+            base64_data_str (str): base64 encoded part
+            checksum (str): optional sha256 hex digest of the base64 encoded part
+            create (bool): create the session if it does not exist
+        """
+        part_idx = int(part_idx)
+        data = base64_data_str.encode("utf-8")
+        if checksum is not None and sha256(data).hexdigest() != checksum.lower():
+            raise ValueError("Checksum mismatch of part %d" % part_idx)
+        with self.lock:
+            self.remove_expired_sessions()
+            if self.size + len(data) > self.quota:
+                raise ValueError("Upload quota exceeded")
+            session = self.sessions.get(session_id, None)
+            if session is None:
+                if not create or n_parts is None:
+                    raise ValueError("Unknown upload session")
+                session = self.create_session(session_id, int(n_parts))
+            if n_parts is None:
+                n_parts = session["n_parts"]
+            n_parts = int(n_parts)
+            if session["n_parts"] != n_parts or part_idx < 0 or part_idx >= n_parts:
+                raise ValueError("Invalid part %d of %d for upload session" % (part_idx, n_parts))
+            if session["complete"]:
+                # all parts were received, e.g. a client retries a part whose response was lost
+                session["last_access"] = time.time()
+                return False
+            # reserve the space before the part is written outside of the lock
+            self.size += len(data)
+            session["size"] += len(data)
+            session["last_access"] = time.time()
+        part_path = self.get_part_path(session_id, part_idx)
+        try:
+            with open(part_path + ".tmp", "wb") as file:
+                file.write(data)
+            os.replace(part_path + ".tmp", part_path)
+        except:
+            with self.lock:
+                self.release_space(session_id, session, len(data))
+            raise
+        with self.lock:
+            if self.sessions.get(session_id, None) is not session:
+                # the session expired while the part was written
+                return False
+            if part_idx in session["parts"]:
+                # the part was sent again
+                self.release_space(session_id, session, len(data))
+            session["parts"].add(part_idx)
+            if session["complete"] or len(session["parts"]) < session["n_parts"]:
+                return False
+            session["complete"] = True
+            return True
+
+    def release_space(self, session_id, session, n_bytes):
+        session["size"] -= n_bytes
+        if self.sessions.get(session_id, None) is session:
+            self.size -= n_bytes
+
+    def assemble(self, session_id):
+        """ Decodes the parts in order into a single data file. Part boundaries do not need to
+            align with base64 blocks, so characters are carried over to the next part.
+        """
+        session = self.sessions[session_id]
+        filename = self.get_session_dir(session_id) + os.sep + DATA_FILE
+        rest = b""
+        with open(filename, "wb") as out_file:
+            for part_idx in range(session["n_parts"]):
+                with open(self.get_part_path(session_id, part_idx), "rb") as file:
+                    while True:
+                        chunk = file.read(CHUNK_SIZE)
+                        if len(chunk) == 0:
+                            break
+                        chunk = rest + b"".join(chunk.split())
+                        n_bytes = len(chunk) - len(chunk) % 4
+                        out_file.write(base64.b64decode(chunk[:n_bytes]))
+                        rest = chunk[n_bytes:]
+            if len(rest) > 0:
+                out_file.write(base64.b64decode(rest))
+        return filename
+
+    @contextmanager
+    def open_data(self, session_id):
+        """ Yields the decoded data of a complete session as a file and removes the session afterwards """
+        with self.lock:
+            session = self.sessions.get(session_id, None)
+            if session is None or not session["complete"]:
+                raise ValueError("Upload session is not complete")
+            if session["in_use"]:
+                raise ValueError("Upload session is already used")
+            session["in_use"] = True
+        try:
+            filename = self.assemble(session_id)
+            with open(filename, "rb") as file:
+                yield file
+        finally:
+            self.remove_session(session_id)
+
+    def read_data(self, session_id):
+        """ Returns the decoded data of a complete session and removes the session """
+        with self.open_data(session_id) as file:
+            return file.read()
+
+    def get_stats(self):
+        with self.lock:
+            return {"sessions": len(self.sessions), "size": self.size, "quota": self.quota}
+
+
+def load_upload_session_store(data_dir, config=None):
+    if config is None:
+        config = dict()
+    directory = config.get("upload_dir", data_dir + os.sep + "uploads")
+    ttl = config.get("upload_session_ttl", DEFAULT_SESSION_TTL)
+    quota = config.get("upload_quota", DEFAULT_UPLOAD_QUOTA)
+    return UploadSessionStore(directory, ttl, quota)
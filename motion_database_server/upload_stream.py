@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+#
+# Copyright 2019 DFKI GmbH.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to permit
+# persons to whom the Software is furnished to do so, subject to the
+# following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN
+# NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE
+# USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+Request handlers that receive uploads as raw bytes instead of base64 encoded
+strings in JSON. The body is written to a spool file while it arrives, so it
+is never held in memory as a whole. Supported bodies are:
+
+- application/octet-stream: the body is the "data" file and the metadata is
+  sent as JSON in the X-Upload-Metadata header or as query arguments
+- multipart/form-data: parts with a filename are files named by the field,
+  a field "metadata" contains JSON and other fields are added as strings
+- application/json: the previous format, the body is parsed as before
+"""
+import re
+import json
+import tempfile
+import tornado.web
+from tornado.httputil import HTTPHeaders
+from motion_database_server.base_handler import BaseDBHandler
+
+METADATA_HEADER = "X-Upload-Metadata"
+METADATA_FIELD = "metadata"
+DEFAULT_MAX_UPLOAD_SIZE = 4 * 1024 * 1024 * 1024
+# fields without a filename are kept in memory
+MAX_FIELD_SIZE = 1024 * 1024
+MAX_HEADER_SIZE = 16 * 1024
+
+
+def get_header_param(header, name):
+    match = re.search(name + r'="([^"]*)"', header) or re.search(name + r'=([^;\s]+)', header)
+    if match is None:
+        return None
+    return match.group(1)
+
+
+class MultipartStreamParser:
+    """ Parses a multipart/form-data body that is fed in chunks of any size.
+        File parts are written to the files returned by open_file and the other
+        fields are collected in memory.
+    """
+    def __init__(self, boundary, open_file):
+        # the first delimiter is not preceded by a line break, so one is added
+        self.buffer = b"\r\n"
+        self.delimiter = b"\r\n--" + boundary.encode("latin-1")
+        self.open_file = open_file
+        self.state = "preamble"
+        self.fields = dict()
+        self.files = dict()
+        self.part_name = None
+        self.part_file = None
+        self.part_data = None
+
+    def feed(self, chunk):
+        self.buffer += chunk
+        while True:
+            if self.state == "preamble":
+                idx = self.buffer.find(self.delimiter)
+                if idx < 0:
+                    self.buffer = self.buffer[-len(self.delimiter):]
+                    return
+                self.buffer = self.buffer[idx+len(self.delimiter):]
+                self.state = "delimiter"
+            elif self.state == "delimiter":
+                if len(self.buffer) < 2:
+                    return
+                if self.buffer[:2] == b"--":
+                    self.state = "done"
+                    self.buffer = b""
+                    return
+                self.buffer = self.buffer[2:]
+                self.state = "headers"
+            elif self.state == "headers":
+                idx = self.buffer.find(b"\r\n\r\n")
+                if idx < 0:
+                    if len(self.buffer) > MAX_HEADER_SIZE:
+                        raise tornado.web.HTTPError(400, "Multipart header too large")
+                    return
+                self.start_part(self.buffer[:idx].decode("utf-8"))
+                self.buffer = self.buffer[idx+4:]
+                self.state = "body"
+            elif self.state == "body":
+                idx = self.buffer.find(self.delimiter)
+                if idx < 0:
+                    # keep enough bytes to find a delimiter that is split between chunks
+                    n_bytes = len(self.buffer) - len(self.delimiter)
+                    if n_bytes > 0:
+                        self.write_part(self.buffer[:n_bytes])
+                        self.buffer = self.buffer[n_bytes:]
+                    return
+                self.write_part(self.buffer[:idx])
+                self.end_part()
+                self.buffer = self.buffer[idx+len(self.delimiter):]
+                self.state = "delimiter"
+            else:
+                return
+
+    def start_part(self, header_str):
+        headers = HTTPHeaders.parse(header_str)
+        disposition = headers.get("Content-Disposition", "")
+        self.part_name = get_header_param(disposition, "name")
+        if get_header_param(disposition, "filename") is not None:
+            self.part_file = self.open_file()
+        else:
+            self.part_data = b""
+
+    def write_part(self, data):
+        if self.part_file is not None:
+            self.part_file.write(data)
+        else:
+            if len(self.part_data) + len(data) > MAX_FIELD_SIZE:
+                raise tornado.web.HTTPError(413, "Field %s is too large, send it as file" % self.part_name)
+            self.part_data += data
+
+    def end_part(self):
+        if self.part_file is not None:
+            self.files[self.part_name] = self.part_file
+        else:
+            self.fields[self.part_name] = self.part_data
+        self.part_file = None
+        self.part_data = None
+
+
+@tornado.web.stream_request_body
+class StreamUploadHandler(BaseDBHandler):
+    """ Base class of upload handlers. post calls get_upload_data to get the
+        metadata and the uploaded files by field name.
+    """
+    def prepare(self):
+        """ Only bodies that are written to disk may exceed the default body size of tornado,
+            JSON bodies are collected in memory.
+        """
+        self.body_parts = []
+        self.spool_file = None
+        self.multipart_parser = None
+        content_type = self.request.headers.get("Content-Type", "")
+        if content_type.startswith("application/octet-stream"):
+            self.set_max_upload_size()
+            self.spool_file = self.open_spool_file()
+        elif content_type.startswith("multipart/form-data"):
+            boundary = get_header_param(content_type, "boundary")
+            if boundary is None:
+                raise tornado.web.HTTPError(400, "Missing multipart boundary")
+            self.set_max_upload_size()
+            self.multipart_parser = MultipartStreamParser(boundary, self.open_spool_file)
+
+    def set_max_upload_size(self):
+        max_upload_size = getattr(self.application, "max_upload_size", DEFAULT_MAX_UPLOAD_SIZE)
+        self.request.connection.set_max_body_size(max_upload_size)
+
+    def open_spool_file(self):
+        """ Anonymous file in the upload directory that is removed when it is closed """
+        return tempfile.TemporaryFile(dir=self.motion_database.upload_sessions.directory)
+
+    async def data_received(self, chunk):
+        if self.spool_file is not None:
+            await self.run_db(self.spool_file.write, chunk)
+        elif self.multipart_parser is not None:
+            await self.run_db(self.multipart_parser.feed, chunk)
+        else:
+            self.body_parts.append(chunk)
+
+    def get_upload_data(self):
+        """ Returns the metadata of the request as dict and the uploaded files as dict of field names and files.
+            Requests with a JSON body have no files.
+        """
+        if self.spool_file is not None:
+            input_data = dict()
+            metadata = self.request.headers.get(METADATA_HEADER, None)
+            if metadata is not None:
+                input_data = json.loads(metadata)
+            for key in self.request.query_arguments:
+                input_data[key] = self.get_query_argument(key)
+            return input_data, {"data": self.spool_file}
+        elif self.multipart_parser is not None:
+            if self.multipart_parser.state != "done":
+                raise tornado.web.HTTPError(400, "Incomplete multipart body")
+            fields = dict(self.multipart_parser.fields)
+            input_data = dict()
+            if METADATA_FIELD in fields:
+                input_data = json.loads(fields.pop(METADATA_FIELD).decode("utf-8"))
+            for key, value in fields.items():
+                input_data[key] = value.decode("utf-8")
+            return input_data, self.multipart_parser.files
+        self.request.body = b"".join(self.body_parts)
+        self.body_parts = []
+        return json.loads(self.request.body.decode("utf-8")), dict()
+
+    def read_upload_file(self, file):
+        file.seek(0)
+        return file.read()
+
+    def on_finish(self):
+        if self.spool_file is not None:
+            self.spool_file.close()
+        if self.multipart_parser is not None:
+            for file in self.multipart_parser.files.values():
+                file.close()
+            if self.multipart_parser.part_file is not None:
+                self.multipart_parser.part_file.close()
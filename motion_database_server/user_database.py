@@ -67,8 +67,8 @@ class UserDatabase(DatabaseWrapper):
             self.server_secret = None
         print("set server secret", self.server_secret, self.enforce_access_rights)
     
-    def connect(self, path):
-        self.connect_to_database(path)
+    def connect(self, path, pragmas=None):
+        self.connect_to_database(path, pragmas)
 
     def create_database(self, path):
         self.connect_to_database(path)
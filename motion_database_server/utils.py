@@ -1,8 +1,10 @@
 import os
 import json
-import bz2
 import bson
 import numpy as np
+from motion_database_server.blob_codecs import encode_blob, decode_blob, get_blob_codec
+from motion_database_server.bvh_serializer import add_fixed_joint_parameters, convert_quaternion_frames_to_euler, \
+    generate_motion_string
 from anim_utils.animation_data.bvh import BVHReader, convert_quaternion_to_euler_frames, generate_bvh_string
 
 def save_json_file(data, file_path, indent=4):
@@ -22,20 +24,45 @@ def get_bvh_from_str(bvh_str):
     bvh_reader.process_lines(lines)
     return bvh_reader
 
-def get_bvh_string(skeleton, frames):
-    print("generate bvh string", len(skeleton.animated_joints), skeleton.reference_frame_length, frames.shape)
+
+def get_bvh_string_per_frame(skeleton, frames, frame_time):
     if frames.shape[1] < skeleton.reference_frame_length:
         frames = skeleton.add_fixed_joint_parameters_to_motion(frames)
         print("after",  frames.shape)
     euler_frames = convert_quaternion_to_euler_frames(skeleton, frames)
-    return generate_bvh_string(skeleton, euler_frames, skeleton.frame_time)
+    return generate_bvh_string(skeleton, euler_frames, frame_time)
 
 
-def extract_compressed_bson(data):
+def get_bvh_string(skeleton, frames, frame_time=None):
+    """ Converts quaternion frames into a BVH string. All frames are converted and formatted at once.
+        The per frame conversion of anim_utils is used if the skeleton can not be converted at once.
+        The values are written with BVH_FLOAT_FORMAT of bvh_serializer.
+    """
+    frames = np.asarray(frames)
+    if frame_time is None:
+        frame_time = skeleton.frame_time
     try:
-        data = bson.loads(bz2.decompress(data))
-    except:
+        full_frames = frames
+        if frames.shape[1] < skeleton.reference_frame_length:
+            full_frames = add_fixed_joint_parameters(skeleton, frames)
+        euler_frames = convert_quaternion_frames_to_euler(skeleton, full_frames)
+    except (AttributeError, KeyError, IndexError, ValueError) as e:
+        print("Warning: could not convert frames at once", e)
+        euler_frames = None
+    if euler_frames is None:
+        print("Warning: use per frame conversion for skeleton")
+        return get_bvh_string_per_frame(skeleton, frames, frame_time)
+    bvh_str = generate_bvh_string(skeleton, euler_frames[:1], frame_time)
+    hierarchy_str = bvh_str[:bvh_str.index("MOTION")]
+    return hierarchy_str + generate_motion_string(euler_frames, frame_time)
+
+
+def extract_compressed_bson(data):
+    if get_blob_codec(data) is None:
         print("Warning: data was not compressed")
-        data = bson.loads(data)
-        pass
-    return data
+    return bson.loads(decode_blob(data))
+
+
+def compress_bson(data, codec=None):
+    """ Compresses with the default codec of blob_codecs if codec is None """
+    return encode_blob(bson.dumps(data), codec)
@@ -29,6 +29,8 @@ import tornado.websocket
 import tornado.ioloop
 import tornado.web
 from motion_database_server.base_handler import BaseHandler
+from motion_database_server.executor_pool import load_executor_pool_from_config
+from motion_database_server.upload_stream import DEFAULT_MAX_UPLOAD_SIZE
 class CustomStaticFileHander(tornado.web.StaticFileHandler):
     def set_default_headers(self):
         self.set_header("Access-Control-Allow-Origin", "*")
@@ -66,10 +68,13 @@ class WebAppServer(tornado.web.Application):
         self.ssl_options = kwargs.get("ssl_options", None)
         self.activate_user_authentification = kwargs.get("activate_user_authentification", True)
         self.enable_data_transforms = kwargs.get("enable_data_transforms", False)
+        # limit of streamed upload bodies, other requests keep the default limit of tornado
+        self.max_upload_size = kwargs.get("max_upload_size", DEFAULT_MAX_UPLOAD_SIZE)
 
         self.request_handler_list = [(r"/", IndexHandler), (r"/get_meta_data", GetMetaHandler)]        
         self.service_contexts = dict()
         self.mutex = threading.Lock()
+        self.executor_pool = load_executor_pool_from_config(kwargs)
 
 
     def get_service_context(self, service_name):
@@ -100,6 +105,7 @@ class WebAppServer(tornado.web.Application):
         except KeyboardInterrupt:
             print("Handle Keyboard Interrupt")
             tornado.ioloop.IOLoop.instance().stop()
+        self.executor_pool.shutdown()
 
     def stop(self):
         print("stop")
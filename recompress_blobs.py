@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+#
+# Copyright 2019 DFKI GmbH.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to permit
+# persons to whom the Software is furnished to do so, subject to the
+# following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN
+# NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE
+# USE OR OTHER DEALINGS IN THE SOFTWARE.
+import time
+import argparse
+import bson
+from motion_database_server.schema import DBSchema, TABLES
+from motion_database_server.table import DATA_COLS
+from motion_database_server.query_builder import COND_GREATER
+from motion_database_server.motion_file_database import MotionFileDatabase
+from motion_database_server.blob_codecs import CODECS, DEFAULT_CODEC, get_blob_codec, encode_blob, decode_blob
+from motion_database_server.utils import load_json_file
+from motion_database_server.connection_pool import get_pragma_profile
+
+CONFIG_FILE = "db_server_config.json"
+DEFAULT_BATCH_SIZE = 100
+
+
+def get_file_table_names():
+    return [t for t in TABLES if any(c[0] in DATA_COLS for c in TABLES[t])]
+
+
+def recompress_blob(db, table_name, record_id, col, name, codec):
+    """ Stores the blob with the codec and updates the record. Only compressed BSON blobs
+        written by the server are converted, other data files are left unchanged.
+    """
+    if name is None or name == "":
+        return False
+    data = db.load_data_file(table_name, name)
+    if data is None:
+        return False
+    current_codec = get_blob_codec(data)
+    if current_codec is None or current_codec == codec:
+        return False
+    raw_data = decode_blob(data)
+    try:
+        bson.loads(raw_data)
+    except Exception:
+        return False
+    new_data = encode_blob(raw_data, codec)
+    with db.transaction():
+        query_str = "SELECT " + col + " FROM " + table_name + " WHERE ID = ?;"
+        records = db.fetch_records(query_str, (record_id,))
+        if len(records) < 1 or records[0][0] != name:
+            # the record was changed by the server in the meantime
+            return False
+        new_name = db.save_hashed_file(table_name, col, new_data)
+        query_str = "UPDATE " + table_name + " SET " + col + " = ? WHERE ID = ?;"
+        db.execute_write(query_str, (new_name, record_id))
+        db.delete_data_file(table_name, name)
+    return True
+
+
+def recompress_table(db, table_name, codec, batch_size=DEFAULT_BATCH_SIZE, pause=0.0):
+    cols = [c[0] for c in TABLES[table_name] if c[0] in DATA_COLS]
+    n_converted = 0
+    last_id = 0
+    while True:
+        records = db.query_table(table_name, ["ID"] + cols, [("ID", last_id, COND_GREATER)], order=["ID"], limit=batch_size)
+        if len(records) == 0:
+            break
+        for r in records:
+            last_id = r[0]
+            for col, name in zip(cols, r[1:]):
+                if recompress_blob(db, table_name, r[0], col, name, codec):
+                    n_converted += 1
+        print("converted", n_converted, "blobs of", table_name)
+        time.sleep(pause)
+    return n_converted
+
+
+def recompress_blobs(db_path, data_dir, codec, config, table_names=None, batch_size=DEFAULT_BATCH_SIZE, pause=0.0, pragmas=None):
+    if table_names is None:
+        table_names = get_file_table_names()
+    motion_db = MotionFileDatabase(DBSchema(TABLES), data_dir=data_dir, storage_config=config)
+    motion_db.connect_to_database(db_path, pragmas)
+    for table_name in table_names:
+        recompress_table(motion_db, table_name, codec, batch_size, pause)
+    motion_db.close()
+
+
+if __name__ == "__main__":
+    config = load_json_file(CONFIG_FILE)
+    parser = argparse.ArgumentParser(description='Convert the compressed blobs of the database to the codec set by blob_codec in the config.')
+    parser.add_argument('directory', nargs='?', default=config.get("data_dir", "data"), help='Data directory')
+    parser.add_argument('--codec', default=config.get("blob_codec", DEFAULT_CODEC), choices=list(CODECS.keys()), help='Target codec')
+    parser.add_argument('--tables', nargs='+', default=None, help='Tables to convert, by default all tables with data columns')
+    parser.add_argument('--batch_size', type=int, default=DEFAULT_BATCH_SIZE, help='Number of records converted before a pause')
+    parser.add_argument('--pause', type=float, default=0.0, help='Pause in seconds between batches to reduce the load on a running server')
+    parser.add_argument('--db_profile', default=config.get("db_profile", None), help='Pragma profile of the database connection, e.g. bulk_import if the server is offline')
+    args = parser.parse_args()
+    pragmas = get_pragma_profile(args.db_profile, config.get("db_profiles", None))
+    recompress_blobs(config["db_path"], args.directory, args.codec, config, args.tables, args.batch_size, args.pause, pragmas)